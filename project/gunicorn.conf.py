@@ -0,0 +1,26 @@
+import os
+
+#Gunicorn settings of the web process (Procfile). Workers and timeout can be tuned with the environment.
+
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+#Django, the URLconf and the templates are loaded once in the master and shared with the forked workers
+preload_app = True
+
+
+#In the master, before the first worker is forked - the loaded URLs and templates are shared by all workers.
+#Django is set up by the preloaded application, so the app is imported inside the hooks.
+def when_ready(server):
+    from django.db import connections
+    from timetracking_app.warmup import SHARED_STEPS, warm_up
+
+    warm_up(steps=SHARED_STEPS)
+    #a forked worker must open its own database connections
+    connections.close_all()
+
+
+#In every worker, before it accepts requests: its own database connections and cache.
+def post_worker_init(worker):
+    from timetracking_app.warmup import WORKER_STEPS, warm_up
+
+    warm_up(steps=WORKER_STEPS)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -50,11 +51,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    #first, so the queries of the other middleware are measured too
+    'timetracking_app.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    #inside the sessions, so saving a session does not count as a write of the user
+    'timetracking_app.routers.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    #after the authentication - only staff users can profile their requests
+    'timetracking_app.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -64,7 +71,8 @@ ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        #DjangoTemplates measuring the render time for the request metrics
+        'BACKEND': 'timetracking_app.instrumentation.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -91,10 +99,56 @@ DATABASES = {
         'HOST': os.getenv('HOST'),
         'PASSWORD': os.getenv('PASSWORD'),
         'USER': os.getenv('DB_USER'),
-        'PORT': os.getenv('PORT')
+        'PORT': os.getenv('PORT'),
+        #kept open between the requests of a worker, checked before reuse
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Optional read replica of the report, export and search views (timetracking_app.routers)
+
+if os.getenv('REPLICA_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': os.getenv('REPLICA_ENGINE', os.getenv('ENGINE')),
+        'NAME': os.getenv('REPLICA_NAME'),
+        'HOST': os.getenv('REPLICA_HOST', os.getenv('HOST')),
+        'PASSWORD': os.getenv('REPLICA_PASSWORD', os.getenv('PASSWORD')),
+        'USER': os.getenv('REPLICA_DB_USER', os.getenv('DB_USER')),
+        'PORT': os.getenv('REPLICA_PORT', os.getenv('PORT')),
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['timetracking_app.routers.ReplicaRouter']
+
+# Seconds a user reads from the primary after writing, longer than the usual replication lag
+
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 15))
+
+# Cache shared by all the workers - the report and scope caches are invalidated with version stamps, which every
+# worker must see. The file cache is shared by the workers of one machine, REDIS_URL (needs the redis package)
+# by the workers of all machines.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            #the file cache with an atomic add() for the report locks
+            'BACKEND': 'timetracking_app.cache.AtomicFileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'timetracking_app_cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -157,3 +211,39 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL')
 SITE_URL = os.getenv('SITE_URL')
 
+# Staff users can profile a request with ?profile=1 (or =memory) when this is switched on (timetracking_app.profiling)
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED') == '1'
+
+
+# Queries slower than this are stored with their EXPLAIN plan in the slow query log (timetracking_app.slow_queries)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 250))
+
+
+# The benchmark commands insert generated rows and drop indexes - set to 1 only on a copy of the database
+# (test databases are always allowed, timetracking_app.benchmarks)
+
+BENCHMARK_DATABASE = os.getenv('BENCHMARK_DATABASE') == '1'
+
+
+# One log line with the query count and timings of every request (timetracking_app.instrumentation)
+# and one with the warm-up timings of every gunicorn worker (timetracking_app.warmup)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'timetracking_app.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'INFO'),
+        },
+        'timetracking_app.warmup': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
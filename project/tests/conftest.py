@@ -1,14 +1,24 @@
 import random
+import sqlite3
 
 import pytest
+from django.core.cache import cache
+from django.db import connections
 from django.shortcuts import get_object_or_404
 from django.test import Client
 from django.utils import timezone
 
 from timetracking_app.models import Person, Department, SalesChannel, LoggedHours
+from timetracking_app.routers import REPLICA_DATABASE
+from timetracking_app.synthetic import OrganizationGenerator
 
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # cached scopes and reports must not leak between tests whose data is rolled back
+    cache.clear()
+
 @pytest.fixture
 def client():
     return Client()
@@ -57,3 +67,76 @@ def add_test_hours(create_test_user, create_test_channel, create_test_department
     return added_hours
 
 
+
+@pytest.fixture
+def create_test_admin():
+    test_admin = Person.objects.create_superuser(username='test_admin', email='test_admin@example.com',
+                                                 password='test_admin')
+    return test_admin
+
+@pytest.fixture
+def create_large_dataset(create_test_user, create_test_department):
+    user = create_test_user
+    department = create_test_department
+    sales_channels = SalesChannel.objects.bulk_create(
+        [SalesChannel(channel_name=f'test_channel_{number}') for number in range(10)])
+    today = timezone.now().date()
+    entries = [LoggedHours(date=today - timezone.timedelta(days=number % 400), hour=1 + number % 8, employee=user,
+                           sales_channel=sales_channels[number % len(sales_channels)], department=department)
+               for number in range(20000)]
+    LoggedHours.bulk_log(entries, batch_size=2000)
+    return sales_channels
+
+@pytest.fixture
+def seed_dataset(create_test_admin, create_test_department, create_test_channel):
+    department = create_test_department
+    second_department = Department.objects.create(department_name='second_department', manager=department.manager)
+    departments = [department, second_department]
+    sales_channels = [create_test_channel] + [SalesChannel.objects.create(channel_name=f'seed_channel_{number}')
+                                             for number in range(2)]
+    employees = [create_test_admin] + [Person.objects.create_user(username=f'seed_user_{number}',
+                                                                  email=f'seed_user_{number}@example.com',
+                                                                  department=departments[number % 2])
+                                       for number in range(4)]
+    today = timezone.now().date()
+    entries = [LoggedHours.objects.create(date=today - timezone.timedelta(days=number % 20), hour=1 + number % 8,
+                                          employee=employees[number % len(employees)],
+                                          sales_channel=sales_channels[number % len(sales_channels)],
+                                          department=departments[number % len(departments)])
+               for number in range(60)]
+    return {'departments': departments, 'sales_channels': sales_channels, 'employees': employees,
+            'entries': entries}
+
+
+#a realistic organization of a few departments with a year of daily entries, always the same (seeded)
+@pytest.fixture
+def synthetic_organization():
+    return OrganizationGenerator(departments=3, channels=4, employees=12, years=1, seed=1).generate()
+
+
+#a second SQLite file registered as the "replica" database - a copy of the test database when it is requested
+@pytest.fixture
+def replica_database(tmp_path):
+    primary = connections['default']
+    if primary.vendor != 'sqlite':
+        pytest.skip('the replica copy needs SQLite')
+    primary.ensure_connection()
+    source = primary.connection
+    replica = sqlite3.connect(tmp_path / 'replica.sqlite3')
+    #the backup API and ATTACH wait for the transaction of the test, so the tables are copied one by one
+    schema = source.execute("SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL "
+                            "AND name NOT LIKE 'sqlite_%' ORDER BY type DESC").fetchall()
+    for object_type, name, sql in schema:
+        replica.execute(sql)
+        if object_type == 'table':
+            rows = source.execute(f'SELECT * FROM "{name}"').fetchall()
+            if rows:
+                replica.executemany(f'INSERT INTO "{name}" VALUES ({", ".join("?" * len(rows[0]))})', rows)
+    replica.commit()
+    replica.close()
+    connections.settings[REPLICA_DATABASE] = {**connections.settings['default'],
+                                              'NAME': str(tmp_path / 'replica.sqlite3')}
+    yield REPLICA_DATABASE
+    connections[REPLICA_DATABASE].close()
+    del connections[REPLICA_DATABASE]
+    del connections.settings[REPLICA_DATABASE]
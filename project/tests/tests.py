@@ -1,9 +1,50 @@
+import csv
+import datetime
+import io
+import json
+import os
+import pstats
+import time
+from smtplib import SMTPException
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, models
 from django.db.models import Sum
 from django.shortcuts import resolve_url
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from timetracking_app.models import LoggedHours
+from django.utils import timezone
+from django.utils.html import escape
+from django.views import View
+from timetracking_app.models import (LoggedHours, DailyLoggedHours, SalesChannel, Person, OutboxEmail,
+                                     PersonSearchToken, ArchivedLoggedHours, RequestProfile, SlowQuery)
+from timetracking_app.benchmarks import check_benchmark_database
+from timetracking_app.cache import AtomicFileBasedCache
+from timetracking_app.archive import get_archive_cutoff, route_date_range, ARCHIVE_BOUNDARY_KEY
+from timetracking_app.date_ranges import resolve_date_range
+from timetracking_app.instrumentation import registry
+from timetracking_app.outbox import enqueue_email, send_outbox
+from timetracking_app.roster import hash_passwords
+from timetracking_app.routers import ReplicaRouter, REPLICA_DATABASE, STICKY_PRIMARY_COOKIE, request_routing
+from timetracking_app.slow_queries import get_fingerprint, get_param_shape
+from timetracking_app.search import tokenize, autocomplete_people, prefix_filter
+from timetracking_app.report_cache import (ChartDataMixin, get_cached_report, get_report_key, get_reports_version,
+                                           bump_reports_version, REPORT_CHANGED_AT_KEY, REPORT_VERSION_KEY)
+from timetracking_app.reports import hours_per_channel, hours_per_department, hours_per_month, hours_trend, get_buckets
+from timetracking_app.scope import get_user_scope, get_scope_cache_key
+from timetracking_app.urls import urlpatterns
+from timetracking_app.warmup import warm_up, compile_templates, WARMUP_STEPS
+from timetracking_app.management.commands.profile_startup import parse_import_times
 
 
 
@@ -100,3 +141,1202 @@ def test_own_hours_authentication_redirect(client, create_test_user, add_test_ho
     assert response.context['hour'] == logged_hours.hour
 
 
+
+
+@pytest.mark.django_db
+def test_hours_per_channel_single_query(create_large_dataset, django_assert_num_queries):
+    # one grouped query, whatever the number of channels and rows
+    with django_assert_num_queries(1) as captured:
+        summary = hours_per_channel(LoggedHours.objects.all())
+    assert 'GROUP BY' in captured.captured_queries[0]['sql']
+
+    expected = dict(LoggedHours.objects.values_list('sales_channel__channel_name').annotate(Sum('hour')))
+    assert summary['hours_per_channel'] == expected
+    assert summary['labels'] == sorted(expected)
+    assert summary['data'] == [expected[label] for label in summary['labels']]
+
+    # latency relative to the per entry loop it replaced, measured on the same machine (best of three runs),
+    # so the bound does not depend on the speed of the machine running the tests
+    def best_time(function):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def sum_per_entry():
+        totals = {}
+        for entry in LoggedHours.objects.select_related('sales_channel'):
+            totals[entry.sales_channel.channel_name] = totals.get(entry.sales_channel.channel_name, 0) + entry.hour
+        return totals
+
+    assert best_time(lambda: hours_per_channel(LoggedHours.objects.all())) < best_time(sum_per_entry) / 2
+
+
+@pytest.mark.django_db
+def test_HoursPerChannelView_query_count(client, create_test_admin, create_large_dataset,
+                                         django_assert_max_num_queries):
+    client.force_login(create_test_admin)
+    with django_assert_max_num_queries(10):
+        response = client.get(reverse('hours-per-channel'), {'filter_type': 'monthly'})
+    assert response.status_code == 200
+
+    # current calendar month
+    start_date = timezone.localdate().replace(day=1)
+    monthly_hours = LoggedHours.objects.filter(date__gte=start_date).aggregate(Sum('hour'))['hour__sum']
+    assert sum(response.context['data']) == monthly_hours
+    assert len(response.context['labels']) == len(create_large_dataset)
+
+
+@pytest.mark.django_db
+def test_hours_per_department_single_query(create_large_dataset, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        summary = hours_per_department(LoggedHours.objects.all())
+
+    expected = dict(LoggedHours.objects.values_list('sales_channel__channel_name').annotate(Sum('hour')))
+    assert summary['hours_per_department'] == {'test_department': expected}
+    assert summary['labels'] == ['test_department']
+    assert summary['data'] == [sum(expected.values())]
+
+
+@pytest.mark.django_db
+def test_ViewDepartmentHoursView_date_filter_for_manager(client, create_test_admin, add_test_hours):
+    logged_hours = add_test_hours
+    LoggedHours.objects.create(date=logged_hours.date - timezone.timedelta(days=400), hour=8,
+                               employee=logged_hours.employee, sales_channel=logged_hours.sales_channel,
+                               department=logged_hours.department)
+    manager = create_test_admin
+    manager.department = logged_hours.department
+    manager.save()
+    manager.groups.add(Group.objects.create(name='manager_user'))
+    client.force_login(manager)
+
+    response = client.get(reverse('department-hours'), {'filter_type': 'monthly'})
+    assert response.status_code == 200
+    assert response.context['hours_per_department'] == {'test_department': {'test_channel': logged_hours.hour}}
+    assert response.context['data'] == [logged_hours.hour]
+
+
+@pytest.mark.django_db
+def test_daily_rollup_follows_add_edit_delete(add_test_hours):
+    logged_hours = add_test_hours
+    second_entry = LoggedHours.objects.create(date=logged_hours.date, hour=2, employee=logged_hours.employee,
+                                              sales_channel=logged_hours.sales_channel,
+                                              department=logged_hours.department)
+    rollup = DailyLoggedHours.objects.get()
+    assert rollup.hour == logged_hours.hour + 2
+    assert rollup.entries_count == 2
+
+    second_entry.date = logged_hours.date - timezone.timedelta(days=1)
+    second_entry.save()
+    assert DailyLoggedHours.objects.get(date=logged_hours.date).hour == logged_hours.hour
+    assert DailyLoggedHours.objects.get(date=second_entry.date).hour == 2
+
+    second_entry.delete()
+    assert list(DailyLoggedHours.objects.values_list('date', 'hour', 'entries_count')) == [
+        (logged_hours.date, logged_hours.hour, 1)]
+
+
+@pytest.mark.django_db
+def test_models_match_migrations():
+    # exits with an error when the models need a new migration
+    call_command('makemigrations', '--check', '--dry-run', stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_daily_rollup_without_department(add_test_hours, monkeypatch):
+    entry = add_test_hours
+    for hour in (1, 2):
+        LoggedHours.objects.create(date=entry.date, hour=hour, employee=entry.employee,
+                                   sales_channel=entry.sales_channel)
+    assert list(DailyLoggedHours.objects.filter(department=None).values_list('hour', 'entries_count')) == [(3, 2)]
+
+    #a row created by another transaction after the lookup is added to, not duplicated
+    lock_rows = DailyLoggedHours._lock_rows
+    calls = []
+
+    def lock_rows_after_insert(cls, changes):
+        calls.append(changes)
+        return lock_rows(changes) if len(calls) > 1 else {}
+
+    monkeypatch.setattr(DailyLoggedHours, '_lock_rows', classmethod(lock_rows_after_insert))
+    LoggedHours.objects.create(date=entry.date, hour=4, employee=entry.employee, sales_channel=entry.sales_channel)
+    assert len(calls) == 2
+    assert list(DailyLoggedHours.objects.filter(department=None).values_list('hour', 'entries_count')) == [(7, 3)]
+    call_command('rebuild_daily_hours', '--verify', stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_rebuild_daily_hours_command(add_test_hours):
+    DailyLoggedHours.objects.update(hour=0)
+    with pytest.raises(CommandError):
+        call_command('rebuild_daily_hours', '--verify', stdout=io.StringIO())
+
+    call_command('rebuild_daily_hours', stdout=io.StringIO())
+    call_command('rebuild_daily_hours', '--verify', stdout=io.StringIO())
+    assert DailyLoggedHours.objects.get().hour == add_test_hours.hour
+
+    # float rounding of the sums is not a difference
+    DailyLoggedHours.objects.update(hour=add_test_hours.hour + 1e-9)
+    call_command('rebuild_daily_hours', '--verify', stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_daily_rollup_admin_is_read_only(client, add_test_hours, create_test_admin):
+    client.force_login(create_test_admin)
+    rollup = DailyLoggedHours.objects.get()
+    assert client.get(reverse('admin:timetracking_app_dailyloggedhours_changelist')).status_code == 200
+    assert client.get(reverse('admin:timetracking_app_dailyloggedhours_add')).status_code == 403
+    assert client.post(reverse('admin:timetracking_app_dailyloggedhours_delete', args=[rollup.pk]),
+                       {'post': 'yes'}).status_code == 403
+    response = client.post(reverse('admin:timetracking_app_dailyloggedhours_change', args=[rollup.pk]), {'hour': 0})
+    assert response.status_code == 403
+    assert DailyLoggedHours.objects.get().hour == add_test_hours.hour
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_indexes_command_rolls_back():
+    output = io.StringIO()
+    call_command('benchmark_indexes', rows=1000, repeat=1, stdout=output)
+    assert 'Without composite indexes' in output.getvalue()
+    assert 'loggedhours_dept_date_idx' in output.getvalue()
+    assert LoggedHours.objects.count() == 0
+
+    call_command('benchmark_indexes', use_existing=True, repeat=1, stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_benchmarks_refuse_live_database(monkeypatch, settings):
+    # not a test database
+    monkeypatch.setitem(connection.settings_dict, 'NAME', '/srv/timetracking/db.sqlite3')
+    for command in ('benchmark_indexes', 'benchmark_views'):
+        with pytest.raises(CommandError, match='not a test database'):
+            call_command(command, use_existing=True, repeat=1, stdout=io.StringIO())
+    assert not Person.objects.filter(username='benchmark_director').exists()
+    # a copy marked for benchmarks
+    settings.BENCHMARK_DATABASE = True
+    check_benchmark_database()
+
+
+@pytest.mark.django_db
+def test_ListAllHoursView_cursor_pagination(client, create_test_user, create_test_channel, create_test_department):
+    test_user = create_test_user
+    channels = [create_test_channel, SalesChannel.objects.create(channel_name='second_channel')]
+    LoggedHours.objects.bulk_create([LoggedHours(date=timezone.now().date(), hour=1, employee=test_user,
+                                                 sales_channel=channels[number % 2], department=create_test_department)
+                                     for number in range(25)])
+    expected_ids = list(LoggedHours.objects.order_by('sales_channel_id', 'id').values_list('id', flat=True))
+    client.force_login(test_user)
+
+    pages = []
+    params = {'pagination': 'cursor'}
+    while True:
+        response = client.get(reverse('list-all-hours'), params)
+        assert response.status_code == 200
+        pages.append([entry.id for entry in response.context['employee_entries']])
+        if not response.context['next_cursor']:
+            break
+        params = {'pagination': 'cursor', 'cursor': response.context['next_cursor']}
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == expected_ids
+    assert response.context['estimated_count'] == 25
+
+    response = client.get(reverse('list-all-hours'), {'pagination': 'cursor',
+                                                      'cursor': response.context['previous_cursor']})
+    assert [entry.id for entry in response.context['employee_entries']] == pages[1]
+
+    response = client.get(reverse('list-all-hours'), {'pagination': 'cursor', 'cursor': 'tampered'})
+    assert response.status_code == 404
+
+
+# Number of queries per URL name for a GET by a logged in superuser on the seeded dataset, with an empty cache.
+# Every request reads the session and the user; the report views read the groups of the user for the scope (the
+# permissions of a superuser are not loaded); the views listing entries read the archive boundary.
+# Rendering a relation per row (N+1) on any list page pushes its count above the budget.
+QUERY_BUDGETS = {
+    #session and user only
+    'home-page': 2,
+    'login-page': 2,
+    'import-hours': 2,
+    'onboard-employees': 2,
+    'offboard-employees': 2,
+    'password_reset': 2,
+    'password_reset_done': 2,
+    'password_reset_complete': 2,
+    'search-employee': 2,
+    'employee-autocomplete': 2,
+    'change-password': 2,
+    'password_change_done': 2,
+    'metrics': 2,
+    #+ the user of the token
+    'password_reset_confirm': 3,
+    #+ the session again and its delete
+    'logout-page': 4,
+    #+ the channel and department choices
+    'add-hours': 4,
+    'add-weekly-hours': 4,
+    #+ the department choices
+    'add-employee': 3,
+    #+ the entry, the channel and department choices
+    'edit-hours': 5,
+    #+ the entry
+    'delete-hours': 3,
+    #+ the employee, the department choices
+    'edit-employee': 4,
+    #+ the employee
+    'deactivate-employee': 3,
+    #+ the archive boundary, the count and the page of the entries
+    'list-all-hours': 5,
+    #+ groups and the report
+    'hours-per-channel': 4,
+    'department-hours': 4,
+    'chart-channel-hours': 4,
+    'chart-department-hours': 4,
+    'chart-employees-hours': 4,
+    'chart-hours-trend': 4,
+    #+ groups (the chart is loaded separately)
+    'hours-trend': 3,
+    #+ groups, the archive boundary and the streamed rows
+    'export-employees-hours': 5,
+    #+ groups, the archive boundary, the report, the count and the page of the entries
+    'employees-hours': 7,
+    #+ the employee, the archive boundary, the monthly and per channel reports, the count and the page of the entries
+    'employee-detail': 8,
+}
+
+
+def get_url_kwargs(url_name, seed_dataset):
+    entry = seed_dataset['entries'][0]
+    employee = seed_dataset['employees'][0]
+    url_kwargs = {
+        'delete-hours': {'pk': entry.pk},
+        'edit-hours': {'pk': entry.pk},
+        'edit-employee': {'pk': employee.pk},
+        'deactivate-employee': {'pk': employee.pk},
+        'employee-detail': {'pk': employee.pk},
+        'password_reset_confirm': {'uidb64': 'MQ', 'token': 'set-password'},
+    }
+    return url_kwargs.get(url_name)
+
+
+def test_every_url_has_query_budget():
+    assert {pattern.name for pattern in urlpatterns} == set(QUERY_BUDGETS)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url_name', QUERY_BUDGETS)
+def test_query_budget(client, seed_dataset, url_name, django_assert_num_queries):
+    client.force_login(seed_dataset['employees'][0])
+    with django_assert_num_queries(QUERY_BUDGETS[url_name]):
+        response = client.get(reverse(url_name, kwargs=get_url_kwargs(url_name, seed_dataset)))
+        #the streamed rows count as well
+        if response.streaming:
+            b''.join(response.streaming_content)
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_user_scope_cached_and_invalidated(client, create_test_user, add_test_hours, django_assert_num_queries):
+    manager = create_test_user
+    manager.user_permissions.add(Permission.objects.get(codename='view_loggedhours'))
+    manager.groups.add(Group.objects.create(name='manager_user'))
+    scope = get_user_scope(manager)
+    assert scope.is_manager
+    assert scope.department_id == manager.department_id
+    assert 'timetracking_app.view_loggedhours' in scope.permissions
+
+    with django_assert_num_queries(0):
+        assert get_user_scope(manager).is_manager
+
+    #the other gunicorn workers read the same cache
+    other_worker = caches.create_connection('default')
+    assert other_worker.get(get_scope_cache_key(manager.pk))['role'] == 'manager'
+    manager.groups.clear()
+    assert other_worker.get(get_scope_cache_key(manager.pk)) is None
+    manager.groups.add(Group.objects.create(name='director_user'))
+    assert get_user_scope(manager).is_director
+
+    Group.objects.get(name='director_user').permissions.add(Permission.objects.get(codename='add_loggedhours'))
+    # a new request loads a fresh user without the per-instance permission cache
+    manager = Person.objects.get(pk=manager.pk)
+    assert 'timetracking_app.add_loggedhours' in get_user_scope(manager).permissions
+
+
+@pytest.mark.django_db
+def test_report_views_query_count_after_warmup(client, seed_dataset, django_assert_num_queries):
+    client.force_login(seed_dataset['employees'][0])
+    for url_name in ['hours-per-channel', 'department-hours']:
+        client.get(reverse(url_name))
+        # session and user only - role, permissions and the report itself come from the cache
+        with django_assert_num_queries(2):
+            response = client.get(reverse(url_name))
+        assert response.status_code == 200
+
+
+def test_cached_report_single_flight():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'data': [1]}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: get_cached_report('test', ('key',), compute), range(8)))
+    assert len(calls) == 1
+    assert results == [{'data': [1]}] * 8
+
+
+def test_atomic_file_cache_add(tmp_path):
+    workers = [AtomicFileBasedCache(str(tmp_path), {}) for _ in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        added = list(executor.map(lambda worker: worker.add('lock', 1, 30), workers))
+    assert added.count(True) == 1
+    workers[0].delete('lock')
+    assert workers[1].add('lock', 1, 30)
+
+
+def test_cached_report_version_bump(settings, tmp_path):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                   'LOCATION': str(tmp_path)}}
+    assert get_cached_report('test', ('key',), lambda: 'first') == 'first'
+    assert get_cached_report('test', ('key',), lambda: 'second') == 'first'
+
+    # while another worker recomputes an expired entry, the previous result of the same version is served
+    version = get_reports_version()
+    cache.delete(f"{get_report_key('test', ('key',))}:{version}")
+    cache.add(f"{get_report_key('test', ('key',))}:{version}:lock", 1)
+    assert get_cached_report('test', ('key',), lambda: 'second') == 'first'
+
+    bump_reports_version()
+    assert get_cached_report('test', ('key',), lambda: 'third') == 'third'
+
+
+@pytest.mark.django_db
+def test_logged_hours_write_invalidates_reports(add_test_hours, django_capture_on_commit_callbacks):
+    version = get_reports_version()
+    with django_capture_on_commit_callbacks(execute=True):
+        add_test_hours.delete()
+    assert get_reports_version() == version + 1
+
+
+def test_report_cache_shared_between_workers():
+    #a process local cache would keep serving old reports in the workers that did not write
+    assert 'locmem' not in settings.CACHES['default']['BACKEND']
+    other_worker = caches.create_connection('default')
+    version = get_reports_version()
+    bump_reports_version()
+    assert other_worker.get(REPORT_VERSION_KEY) == version + 1
+    #an evicted version does not restart at an old value
+    cache.delete(REPORT_VERSION_KEY)
+    assert get_reports_version() > version + 1
+
+
+@pytest.mark.django_db
+def test_ExportEmployeesHoursView_streams_scoped_csv(client, seed_dataset, django_assert_num_queries):
+    manager = seed_dataset['employees'][0]
+    manager.department = seed_dataset['departments'][0]
+    manager.save()
+    manager.groups.add(Group.objects.create(name='manager_user'))
+    client.force_login(manager)
+
+    response = client.get(reverse('export-employees-hours'))
+    assert response.status_code == 200
+    assert response.streaming
+    assert response['Content-Type'] == 'text/csv'
+    with django_assert_num_queries(1):
+        rows = list(csv.reader(line.decode() for line in response.streaming_content))
+
+    department_entries = LoggedHours.objects.filter(department=manager.department)
+    assert rows[0][0] == 'Date'
+    assert len(rows) == department_entries.count() + 1
+    assert {row[5] for row in rows[1:]} == {manager.department.department_name}
+    assert sum(float(row[7]) for row in rows[1:]) == department_entries.aggregate(Sum('hour'))['hour__sum']
+
+
+@pytest.mark.django_db
+def test_import_hours_command(tmp_path, seed_dataset):
+    employee = seed_dataset['employees'][1]
+    rows = [['Date', 'Email', 'Department', 'Sales channel', 'Hours']]
+    rows += [['2020-01-02', employee.email, 'test_department', 'test_channel', '2.5']] * 30
+    rows += [['2999-01-01', employee.email, 'test_department', 'test_channel', '2'],
+             ['2020-01-02', 'nobody@example.com', 'test_department', 'test_channel', '20'],
+             ['2020-01-02', employee.email, 'test_department', 'test_channel', 'nan'],
+             ['2020-01-02', employee.email, 'test_department', 'test_channel', '-inf']]
+    path = tmp_path / 'hours.csv'
+    with open(path, 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+    count_before = LoggedHours.objects.count()
+
+    errors = io.StringIO()
+    call_command('import_hours', str(path), '--batch-size', '7', stdout=io.StringIO(), stderr=errors)
+    assert LoggedHours.objects.count() == count_before + 30
+    assert 'line 32: The date cannot be in the future.' in errors.getvalue()
+    assert 'unknown employee "nobody@example.com"' in errors.getvalue()
+    assert 'line 34: invalid number of hours "nan"' in errors.getvalue()
+    assert 'line 35: invalid number of hours "-inf"' in errors.getvalue()
+    assert DailyLoggedHours.objects.get(date=datetime.date(2020, 1, 2)).hour == 75
+    call_command('rebuild_daily_hours', '--verify', stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_ImportHoursView(client, seed_dataset):
+    admin = seed_dataset['employees'][0]
+    admin.is_staff = True
+    admin.save()
+    client.force_login(admin)
+    upload = SimpleUploadedFile('hours.csv', f'Date,Email,Department,Sales channel,Hours\n'
+                                             f'2020-01-02,{admin.email},test_department,test_channel,1\n'
+                                             f'2020-01-02,{admin.email},unknown,test_channel,1\n'.encode())
+    response = client.post(reverse('import-hours'), {'file': upload})
+    assert response.status_code == 200
+    assert response.context['importer'].created == 1
+    assert response.context['importer'].errors == [(3, 'unknown department "unknown"')]
+
+
+def get_timesheet_data(rows, total_forms=3):
+    data = {'form-TOTAL_FORMS': total_forms, 'form-INITIAL_FORMS': 0}
+    for number, row in enumerate(rows):
+        for field, value in row.items():
+            data[f'form-{number}-{field}'] = value
+    return data
+
+
+@pytest.mark.django_db
+def test_AddWeeklyHoursView_saves_week_in_one_insert(client, create_test_user, create_test_channel,
+                                                     create_test_department, django_assert_max_num_queries):
+    test_user = create_test_user
+    client.force_login(test_user)
+    last_week = timezone.localdate() - timezone.timedelta(days=7)
+    week_start = last_week - timezone.timedelta(days=last_week.weekday())
+    channel, department = create_test_channel, create_test_department
+    data = get_timesheet_data([
+        {'sales_channel': channel.id, 'department': department.id, 'day_0': 8, 'day_1': 8, 'day_2': 4, 'day_4': 2},
+        {'sales_channel': channel.id, 'department': department.id, 'day_2': 1.5},
+    ])
+
+    with django_assert_max_num_queries(13):
+        response = client.post(f"{reverse('add-weekly-hours')}?week={last_week}", data)
+    assert response.status_code == 302
+    entries = LoggedHours.objects.filter(employee=test_user).order_by('date', 'hour')
+    assert [(entry.date - week_start).days for entry in entries] == [0, 1, 2, 2, 4]
+    assert sum(entry.hour for entry in entries) == 23.5
+    assert DailyLoggedHours.objects.get(date=week_start + timezone.timedelta(days=2)).hour == 5.5
+
+
+@pytest.mark.django_db
+def test_AddWeeklyHoursView_validates_all_rows(client, create_test_user, create_test_channel, create_test_department):
+    client.force_login(create_test_user)
+    old_week = timezone.localdate() - timezone.timedelta(days=60)
+    channel, department = create_test_channel, create_test_department
+    response = client.post(f"{reverse('add-weekly-hours')}?week={old_week}", get_timesheet_data([
+        {'sales_channel': channel.id, 'department': department.id, 'day_0': 8},
+        {'day_1': 9},
+    ]))
+    assert response.status_code == 200
+    assert response.context['form'].forms[1].errors
+    assert LoggedHours.objects.count() == 0
+
+    response = client.post(f"{reverse('add-weekly-hours')}?week={old_week}", get_timesheet_data([
+        {'sales_channel': channel.id, 'department': department.id, 'day_0': 8},
+    ]))
+    assert 'The date must be within last 30 days.' in response.context['form'].non_form_errors()[0]
+    assert LoggedHours.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_chart_data_views_conditional_get(client, seed_dataset, django_assert_num_queries,
+                                          django_capture_on_commit_callbacks):
+    client.force_login(seed_dataset['employees'][0])
+    response = client.get(reverse('chart-channel-hours'))
+    assert response.status_code == 200
+    chart = response.json()
+    page = client.get(reverse('hours-per-channel'))
+    assert chart == {'labels': page.context['labels'], 'data': page.context['data']}
+    etag = response['ETag']
+
+    # session and user only - the version stamp and the scope come from the cache
+    with django_assert_num_queries(2):
+        response = client.get(reverse('chart-channel-hours'), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    # another filter is another report
+    assert client.get(reverse('chart-channel-hours') + '?filter_type=yearly')['ETag'] != etag
+
+    with django_capture_on_commit_callbacks(execute=True):
+        seed_dataset['entries'][0].delete()
+    response = client.get(reverse('chart-channel-hours'), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+    for url_name in ['chart-department-hours', 'chart-employees-hours']:
+        response = client.get(reverse(url_name))
+        assert response.status_code == 200
+        assert set(response.json()) == {'labels', 'data'}
+        assert client.get(reverse(url_name), HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+
+
+def test_chart_data_view_requires_chart_data():
+    class IncompleteChartDataView(ChartDataMixin, View):
+        report_name = 'incomplete'
+
+    with pytest.raises(TypeError):
+        IncompleteChartDataView()
+
+
+#locmem backend that counts opened connections and refuses subjects containing "fail"
+class CountingEmailBackend(LocmemEmailBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = 0
+
+    def open(self):
+        self.opened += 1
+
+    def send_messages(self, messages):
+        if any('fail' in message.subject for message in messages):
+            raise SMTPException('mailbox unavailable')
+        return super().send_messages(messages)
+
+
+@pytest.mark.django_db
+def test_password_reset_is_queued_and_sent_by_worker(client, create_test_user, mailoutbox):
+    response = client.post(reverse('password_reset'), {'email': create_test_user.email})
+    assert response.status_code == 302
+    assert mailoutbox == []
+    email = OutboxEmail.objects.get()
+    assert email.to == [create_test_user.email]
+    assert email.status == OutboxEmail.PENDING
+
+    call_command('send_outbox_emails')
+    assert len(mailoutbox) == 1
+    assert mailoutbox[0].to == [create_test_user.email]
+    email.refresh_from_db()
+    assert email.status == OutboxEmail.SENT
+    assert email.sent_at is not None
+
+
+@pytest.mark.django_db
+def test_send_outbox_batches_and_retries(mailoutbox):
+    for number in range(3):
+        enqueue_email(f'hello {number}', 'body', [f'user{number}@example.com'])
+    failing = enqueue_email('fail', 'body', ['broken@example.com'])
+
+    connection = CountingEmailBackend()
+    assert send_outbox(connection=connection, max_attempts=2) == (3, 1)
+    assert connection.opened == 1
+    assert len(mailoutbox) == 3
+
+    # the failed email is retried later, not on the next run
+    failing.refresh_from_db()
+    assert failing.status == OutboxEmail.PENDING
+    assert failing.attempts == 1
+    assert failing.next_attempt_at > timezone.now()
+    assert send_outbox(connection=CountingEmailBackend()) == (0, 0)
+
+    OutboxEmail.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+    assert send_outbox(connection=CountingEmailBackend(), max_attempts=2) == (0, 1)
+    failing.refresh_from_db()
+    assert failing.status == OutboxEmail.FAILED
+    assert 'mailbox unavailable' in failing.last_error
+
+
+def get_roster_file(tmp_path, seed_dataset, size):
+    department = seed_dataset['departments'][0].department_name
+    channels = ';'.join(channel.channel_name for channel in seed_dataset['sales_channels'][:2])
+    path = tmp_path / 'roster.csv'
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Username', 'First name', 'Last name', 'Email', 'Password', 'Department', 'Sales channels'])
+        for number in range(size):
+            writer.writerow([f'new_{number}', 'New', f'Employee {number}', f'new_{number}@example.com',
+                             f'Roster-password-{number}', department, channels])
+        writer.writerow(['new_0', 'Duplicate', 'Employee', 'new_0@example.com', '', department, ''])
+        writer.writerow(['bad_row', 'Bad', 'Employee', 'not-an-email', '123', 'no department', 'no channel'])
+        writer.writerow(['bad name!', 'L' * 151, 'Employee', 'bad_name@example.com', '', department, ''])
+    return path
+
+
+def test_hash_passwords_in_process_pool():
+    hashes = hash_passwords([f'password-{number}' for number in range(10)] + [None], workers=2)
+    assert len(hashes) == 11
+    assert check_password('password-3', hashes[3])
+    assert not check_password('password-3', hashes[4])
+    assert hashes[-1].startswith('!')
+
+
+@pytest.mark.django_db
+def test_onboard_employees_command(tmp_path, seed_dataset, django_assert_max_num_queries, capsys):
+    path = get_roster_file(tmp_path, seed_dataset, 20)
+    # lookups, one insert of the employees, one of their sales channels and the search index, no matter the roster size
+    with django_assert_max_num_queries(13):
+        call_command('onboard_employees', str(path), '--workers', '2')
+    errors = capsys.readouterr().err
+    assert 'line 23' in errors
+    # too long or invalid values are errors of their row, not of the whole import
+    assert 'line 24' in errors and 'username: Enter a valid username' in errors
+    assert 'first name: Ensure this value has at most 150 characters' in errors
+
+    new_employees = Person.objects.filter(username__startswith='new_')
+    assert new_employees.count() == 20
+    employee = new_employees.get(username='new_7')
+    assert employee.check_password('Roster-password-7')
+    assert employee.department == seed_dataset['departments'][0]
+    assert set(employee.sales_channels.all()) == set(seed_dataset['sales_channels'][:2])
+    assert not Person.objects.filter(username='bad_row').exists()
+
+
+@pytest.mark.django_db
+def test_offboard_employees(client, seed_dataset, django_assert_num_queries):
+    admin = seed_dataset['employees'][0]
+    employees = seed_dataset['employees'][1:]
+    get_user_scope(employees[0])
+    with django_assert_num_queries(1):
+        call_command('offboard_employees', '--email', employees[0].email, '--email', employees[1].email)
+    assert Person.objects.filter(is_active=False).count() == 2
+    # the update sends no post_save, the cached scopes are dropped anyway
+    assert cache.get(get_scope_cache_key(employees[0].pk)) is None
+
+    client.force_login(admin)
+    roster = '\n'.join(['Email'] + [employee.email for employee in employees[2:]] + ['nobody@example.com'])
+    response = client.post(reverse('offboard-employees'), {'file': SimpleUploadedFile('roster.csv', roster.encode())})
+    assert response.status_code == 200
+    assert response.context['done'] == len(employees) - 2
+    assert len(response.context['importer'].errors) == 1
+    assert not Person.objects.filter(pk__in=[employee.pk for employee in employees], is_active=True).exists()
+    assert Person.objects.get(pk=admin.pk).is_active
+
+
+def test_search_tokenize_folds_accents():
+    assert tokenize('Łukasz Żółć-Wójcik') == ['lukasz', 'zolc', 'wojcik']
+    assert tokenize('Jan.Kowalski@Example.com') == ['jan', 'kowalski', 'example', 'com']
+    assert tokenize('') == []
+
+
+@pytest.mark.django_db
+def test_SearchEmployeeView_uses_search_index(client, seed_dataset):
+    admin = seed_dataset['employees'][0]
+    employee = seed_dataset['employees'][1]
+    employee.first_name, employee.last_name = 'Łukasz', 'Żółć'
+    employee.save()
+    client.force_login(admin)
+
+    response = client.get(reverse('search-employee'), {'q': 'luk zol'})
+    assert response.status_code == 200
+    assert list(response.context['employees']) == [employee]
+
+    # deactivated employees only when asked for, e.g. to reactivate them
+    employee.is_active = False
+    employee.save()
+    assert list(client.get(reverse('search-employee'), {'q': 'luk zol'}).context['employees']) == []
+    response = client.get(reverse('search-employee'), {'q': 'luk zol', 'include_inactive': 'on'})
+    assert list(response.context['employees']) == [employee]
+    assert 'Deactivated' in response.content.decode()
+    assert 'include_inactive=True' in response.context['search_query']
+    employee.is_active = True
+    employee.save()
+
+    response = client.get(reverse('search-employee'), {'department': 'second_dep'})
+    expected = Person.objects.filter(department=seed_dataset['departments'][1], is_active=True)
+    assert set(response.context['employees']) == set(expected)
+    assert 'department=second_dep' in response.context['search_query']
+
+    # renaming the department re-indexes its people
+    department = seed_dataset['departments'][1]
+    department.department_name = 'Księgowość'
+    department.save()
+    response = client.get(reverse('search-employee'), {'department': 'ksiegow'})
+    assert set(response.context['employees']) == set(expected)
+
+    # logging in only updates last_login and does not rewrite the tokens
+    tokens = set(PersonSearchToken.objects.filter(person=employee).values_list('id', flat=True))
+    employee.save(update_fields=['last_login'])
+    assert set(PersonSearchToken.objects.filter(person=employee).values_list('id', flat=True)) == tokens
+
+
+@pytest.mark.django_db
+def test_employee_autocomplete(client, seed_dataset, django_assert_num_queries):
+    client.force_login(seed_dataset['employees'][0])
+    client.get(reverse('employee-autocomplete'))
+    # session, user, the token index and the matched people
+    with django_assert_num_queries(4):
+        response = client.get(reverse('employee-autocomplete'), {'q': 'seed'})
+    results = response.json()['results']
+    assert [result['email'] for result in results] == [f'seed_user_{number}@example.com' for number in range(4)]
+    assert results[0]['url'] == reverse('employee-detail', kwargs={'pk': seed_dataset['employees'][1].pk})
+
+    # several matching words of one person count once, every word of the query must match
+    assert len(autocomplete_people('seed', limit=2)) == 2
+    assert [employee.email for employee in autocomplete_people('user 2 seed')] == ['seed_user_2@example.com']
+
+
+@pytest.mark.django_db
+def test_search_prefix_lookup_reads_token_index():
+    plan = PersonSearchToken.objects.filter(**prefix_filter('kow')).values('person_id').explain()
+    assert 'personsearchtoken_token_idx' in plan
+
+
+@pytest.mark.django_db
+def test_EmployeeDetailView_summaries_and_pages(client, seed_dataset, django_assert_num_queries):
+    admin = seed_dataset['employees'][0]
+    employee = seed_dataset['employees'][1]
+    client.force_login(admin)
+    url = reverse('employee-detail', kwargs={'pk': employee.pk})
+    client.get(url)
+
+    # session, user, employee, monthly and channel totals, entries count and page
+    with django_assert_num_queries(7):
+        response = client.get(url)
+    entries = LoggedHours.objects.filter(employee=employee)
+    assert response.context['hours_per_month'] == hours_per_month(entries)
+    assert response.context['hours_per_channel'] == hours_per_channel(entries)['hours_per_channel']
+    assert response.context['page_obj'].paginator.count == entries.count()
+
+    # three years of hours - still one page of entries and the same queries
+    today = timezone.now().date()
+    LoggedHours.bulk_log([LoggedHours(date=today - datetime.timedelta(days=day), hour=4, employee=employee,
+                                      sales_channel=seed_dataset['sales_channels'][0],
+                                      department=seed_dataset['departments'][0]) for day in range(1095)])
+    with django_assert_num_queries(7):
+        response = client.get(url, {'page': 2})
+    assert len(response.context['employee_entries']) == 50
+    assert len(response.context['hours_per_month']) >= 36
+
+    start = today - datetime.timedelta(days=6)
+    response = client.get(url, {'start': start.isoformat(), 'end': today.isoformat()})
+    entries = LoggedHours.objects.filter(employee=employee, date__gte=start, date__lte=today)
+    assert response.context['page_obj'].paginator.count == entries.count()
+    assert sum(response.context['hours_per_month'].values()) == entries.aggregate(total=Sum('hour'))['total']
+    assert 'start=' in response.context['date_query']
+
+
+def test_trend_buckets_are_calendar_aligned():
+    assert get_buckets(datetime.date(2023, 11, 15), datetime.date(2024, 2, 1), 'month') == [
+        datetime.date(2023, 11, 1), datetime.date(2023, 12, 1), datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)]
+    assert get_buckets(datetime.date(2023, 12, 31), datetime.date(2024, 4, 1), 'quarter') == [
+        datetime.date(2023, 10, 1), datetime.date(2024, 1, 1), datetime.date(2024, 4, 1)]
+    # weeks start on Monday
+    assert get_buckets(datetime.date(2024, 1, 3), datetime.date(2024, 1, 10), 'week') == [
+        datetime.date(2024, 1, 1), datetime.date(2024, 1, 8)]
+
+
+@pytest.mark.django_db
+def test_hours_trend_fills_gaps_and_downsamples(seed_dataset):
+    today = timezone.now().date()
+    start = today - datetime.timedelta(days=29)
+    trend = hours_trend(LoggedHours.objects.all(), start, today, bucket='day', split='channel')
+    assert len(trend['labels']) == 30
+    assert {dataset['label'] for dataset in trend['datasets']} == {channel.channel_name
+                                                                  for channel in seed_dataset['sales_channels']}
+    # seed entries cover the last 20 days only - older days are filled with zeros
+    assert trend['data'][:10] == [0] * 10
+    assert sum(trend['data']) == LoggedHours.objects.aggregate(total=Sum('hour'))['total']
+    # the rollup gives the same series
+    assert hours_trend(DailyLoggedHours.objects.all(), start, today, bucket='day') == \
+        hours_trend(LoggedHours.objects.all(), start, today, bucket='day')
+
+    five_years = hours_trend(DailyLoggedHours.objects.all(), today - datetime.timedelta(days=5 * 365), today,
+                             bucket='day', max_points=300)
+    assert len(five_years['labels']) <= 300
+    assert five_years['bucket_size'] == 7
+    assert sum(five_years['data']) == sum(trend['data'])
+
+
+@pytest.mark.django_db
+def test_TrendChartDataView(client, seed_dataset):
+    client.force_login(seed_dataset['employees'][0])
+    assert client.get(reverse('hours-trend')).status_code == 200
+
+    response = client.get(reverse('chart-hours-trend'), {'bucket': 'week', 'split': 'department'})
+    assert response.status_code == 200
+    chart = response.json()
+    assert chart['bucket'] == 'week'
+    assert {dataset['label'] for dataset in chart['datasets']} == {department.department_name
+                                                                  for department in seed_dataset['departments']}
+    assert client.get(reverse('chart-hours-trend'), {'bucket': 'week', 'split': 'department'},
+                      HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+    # another grouping is another report
+    assert client.get(reverse('chart-hours-trend'), {'bucket': 'month'})['ETag'] != response['ETag']
+    assert client.get(reverse('chart-hours-trend'), {'bucket': 'year'}).status_code == 400
+    # ranges with too many buckets or past the last date are form errors
+    for params in ({'end': '9999-12-31', 'bucket': 'month'}, {'end': '9999-12-31', 'bucket': 'quarter'},
+                   {'start': '0001-01-01', 'bucket': 'day'}):
+        response = client.get(reverse('chart-hours-trend'), params)
+        assert response.status_code == 400
+        assert response.json()['errors']['__all__']
+
+
+def test_resolve_date_range_calendar_periods():
+    today = datetime.date(2024, 2, 14)
+    assert resolve_date_range('weekly', today=today) == (datetime.date(2024, 2, 12), datetime.date(2024, 2, 18))
+    assert resolve_date_range('monthly', today=today) == (datetime.date(2024, 2, 1), datetime.date(2024, 2, 29))
+    assert resolve_date_range('yearly', today=today) == (datetime.date(2024, 1, 1), datetime.date(2024, 12, 31))
+    assert resolve_date_range(today=today) == (None, None)
+    # explicit dates win over the preset
+    assert resolve_date_range('yearly', start=datetime.date(2024, 3, 1), today=today) == (
+        datetime.date(2024, 3, 1), datetime.date(2024, 12, 31))
+
+
+@pytest.mark.django_db
+def test_views_share_date_range(client, seed_dataset):
+    client.force_login(seed_dataset['employees'][0])
+    today = timezone.localdate()
+    start = today - datetime.timedelta(days=4)
+    params = {'start': start.isoformat(), 'end': today.isoformat()}
+    in_range = LoggedHours.objects.filter(date__gte=start, date__lte=today)
+
+    response = client.get(reverse('hours-per-channel'), params)
+    assert sum(response.context['data']) == in_range.aggregate(total=Sum('hour'))['total']
+    response = client.get(reverse('department-hours'), params)
+    assert sum(response.context['data']) == in_range.aggregate(total=Sum('hour'))['total']
+    response = client.get(reverse('employees-hours'), params)
+    assert response.context['paginator'].count == in_range.count()
+    assert response.context['date_query'] == f'start={start.isoformat()}&end={today.isoformat()}'
+    response = client.get(reverse('list-all-hours'), params)
+    assert response.context['paginator'].count == in_range.filter(employee=seed_dataset['employees'][0]).count()
+
+    # invalid ranges are reported and do not filter
+    response = client.get(reverse('employees-hours'), {'start': today.isoformat(), 'end': start.isoformat()})
+    assert response.context['date_range_form'].errors
+    assert response.context['paginator'].count == LoggedHours.objects.count()
+
+
+@pytest.mark.django_db
+def test_date_range_uses_employee_date_index(create_test_user):
+    start, end = resolve_date_range('monthly')
+    queryset = LoggedHours.objects.filter(employee=create_test_user, date__gte=start, date__lte=end)
+    assert 'loggedhours_employee_date_idx' in queryset.explain()
+    # plain dates are compared, not datetimes
+    assert f"'{start.isoformat()}'" in str(queryset.query) or start.isoformat() in str(queryset.query)
+    assert ':' not in str(queryset.query).split('WHERE')[1]
+
+
+@pytest.mark.django_db
+def test_archived_entries_cannot_be_edited(client, create_test_admin, create_test_channel, create_test_department):
+    today = timezone.localdate()
+    old, recent = LoggedHours.bulk_log([
+        LoggedHours(date=date, hour=2, employee=create_test_admin, sales_channel=create_test_channel,
+                    department=create_test_department) for date in (datetime.date(today.year - 3, 6, 15), today)])
+    call_command('archive_logged_hours', stdout=io.StringIO())
+    client.force_login(create_test_admin)
+
+    for url_name in ('list-all-hours', 'employees-hours'):
+        response = client.get(reverse(url_name))
+        assert {entry.pk: entry.archived for entry in response.context['employee_entries']} == {old.pk: True,
+                                                                                               recent.pk: False}
+        content = response.content.decode()
+        assert reverse('delete-hours', kwargs={'pk': recent.pk}) in content
+        assert reverse('edit-hours', kwargs={'pk': old.pk}) not in content
+        assert reverse('delete-hours', kwargs={'pk': old.pk}) not in content
+    response = client.get(reverse('employee-detail', kwargs={'pk': create_test_admin.pk}))
+    assert response.content.decode().count('(archived)') == 1
+
+
+@pytest.mark.django_db
+def test_archive_logged_hours_round_trip(client, seed_dataset):
+    employee = seed_dataset['employees'][0]
+    today = timezone.localdate()
+    old_day = datetime.date(today.year - 3, 6, 15)
+    LoggedHours.bulk_log([LoggedHours(date=old_day + datetime.timedelta(days=number), hour=2, employee=employee,
+                                      sales_channel=seed_dataset['sales_channels'][0],
+                                      department=seed_dataset['departments'][0]) for number in range(25)])
+    totals = hours_per_channel(DailyLoggedHours.objects.all())
+    all_ids = set(LoggedHours.objects.values_list('id', flat=True))
+    cutoff = get_archive_cutoff(keep_years=2)
+    assert cutoff == datetime.date(today.year - 1, 1, 1)
+
+    call_command('archive_logged_hours', '--batch-size', '10', stdout=io.StringIO())
+    assert ArchivedLoggedHours.objects.count() == 25
+    assert not LoggedHours.objects.filter(date__lt=cutoff).exists()
+    #the rollup keeps the archived hours
+    assert hours_per_channel(DailyLoggedHours.objects.all()) == totals
+    call_command('rebuild_daily_hours', '--verify', stdout=io.StringIO())
+
+    client.force_login(employee)
+    #open ranges and ranges reaching into the archive read both tables, recent ranges the hot table only
+    response = client.get(reverse('list-all-hours'))
+    assert response.context['paginator'].count == LoggedHours.objects.filter(employee=employee).count() + 25
+    response = client.get(reverse('list-all-hours'), {'start': old_day.isoformat(), 'end': today.isoformat()})
+    assert response.context['paginator'].count == LoggedHours.objects.filter(employee=employee).count() + 25
+    response = client.get(reverse('employee-detail', kwargs={'pk': employee.pk}), {'filter_type': 'yearly'})
+    assert response.context['page_obj'].paginator.count == LoggedHours.objects.filter(
+        employee=employee, date__year=today.year).count()
+    response = client.get(reverse('export-employees-hours'), {'start': old_day.isoformat(),
+                                                               'end': (old_day + datetime.timedelta(days=9)).isoformat()})
+    assert len(b''.join(response.streaming_content).decode().splitlines()) == 1 + 10
+    #the export of all hours keeps the archived entries, in the columns of the header
+    response = client.get(reverse('export-employees-hours'))
+    rows = list(csv.reader(line.decode() for line in response.streaming_content))
+    assert len(rows) == 1 + LoggedHours.objects.count() + 25
+    assert {len(row) for row in rows} == {len(rows[0])} == {8}
+    assert [old_day.isoformat(), employee.username, employee.first_name, employee.last_name, employee.email,
+            seed_dataset['departments'][0].department_name, seed_dataset['sales_channels'][0].channel_name,
+            '2.0'] in rows
+
+    recent = route_date_range(lambda queryset: queryset, start=cutoff)
+    assert 'archivedloggedhours' not in str(recent.query)
+    old = route_date_range(lambda queryset: queryset, start=old_day, end=old_day + datetime.timedelta(days=4))
+    assert old.count() == 5
+
+    call_command('archive_logged_hours', '--restore', '--year', str(old_day.year), '--batch-size', '7',
+                 stdout=io.StringIO())
+    assert not ArchivedLoggedHours.objects.exists()
+    assert set(LoggedHours.objects.values_list('id', flat=True)) == all_ids
+    call_command('rebuild_daily_hours', '--verify', stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_synthetic_organization(synthetic_organization):
+    departments = synthetic_organization['departments']
+    employees = synthetic_organization['employees']
+    assert len(departments) == 3 and len(employees) == 12
+    assert all(department.manager.department_id == department.pk for department in departments)
+    entries = LoggedHours.objects.filter(employee__in=employees)
+    #about 260 working days, 1-3 entries each
+    assert 12 * 200 < entries.count() < 12 * 261 * 3
+    assert not entries.filter(date__week_day__in=[1, 7]).exists()
+    daily_totals = entries.order_by().values('employee', 'date').annotate(total=Sum('hour'))
+    assert all(4 <= row['total'] <= 8 for row in daily_totals)
+    #the entries use the channels of the employee, the rollup and the search index are written
+    assert not entries.exclude(sales_channel__person=models.F('employee')).exists()
+    call_command('rebuild_daily_hours', '--verify', stdout=io.StringIO())
+    assert autocomplete_people(employees[0].last_name)
+
+
+@pytest.mark.django_db
+def test_benchmark_views_command(tmp_path):
+    output = tmp_path / 'results.json'
+    cache.set('benchmark_marker', 'kept')
+    call_command('benchmark_views', '--sizes', 'small', '--repeat', '1', '--output', str(output),
+                 stdout=io.StringIO())
+    results = json.loads(output.read_text())
+    views = results['datasets'][0]['views']
+    assert {view['name'] for view in views} == {pattern.name for pattern in urlpatterns}
+    assert all(view['status'] in (200, 302) for view in views)
+    assert all(view['queries'] <= QUERY_BUDGETS[view['name']] for view in views if not view['query'])
+    #the generated data is rolled back, the shared cache is not touched
+    assert not Person.objects.filter(username__startswith='benchmark_').exists()
+    assert cache.get('benchmark_marker') == 'kept'
+
+    stdout = io.StringIO()
+    call_command('benchmark_views', '--sizes', 'small', '--repeat', '1', '--output', str(tmp_path / 'again.json'),
+                 '--compare', str(output), stdout=stdout)
+    assert 'Compared with' in stdout.getvalue()
+
+
+@pytest.mark.django_db
+def test_benchmark_views_existing_without_employees(tmp_path):
+    with pytest.raises(CommandError, match='no employees'):
+        call_command('benchmark_views', '--use-existing', '--repeat', '1', '--output', str(tmp_path / 'results.json'),
+                     stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_request_metrics(client, seed_dataset, caplog):
+    registry.clear()
+    client.force_login(seed_dataset['employees'][0])
+    with caplog.at_level('INFO', logger='timetracking_app.requests'):
+        response = client.get(reverse('list-all-hours'))
+    record = [record for record in caplog.records if record.name == 'timetracking_app.requests'][-1]
+    timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+    assert set(timing) == {'db', 'tpl', 'total'}
+    assert timing['db'].endswith(f';desc="{record.queries} queries"')
+    assert record.view == 'list-all-hours' and record.status == 200
+    assert 0 < record.queries <= QUERY_BUDGETS['list-all-hours']
+    assert record.template_ms > 0 and record.total_ms >= record.db_ms
+
+    client.get('/no-such-page/')
+    response = client.get(reverse('metrics'))
+    assert response.status_code == 200
+    text = response.content.decode()
+    assert '# TYPE timetracking_request_duration_seconds histogram' in text
+    worker = os.getpid()
+    assert f'timetracking_request_duration_seconds_count{{view="list-all-hours",worker="{worker}"}} 1' in text
+    assert f'timetracking_db_queries_bucket{{view="unresolved",worker="{worker}",le="+Inf"}} 1' in text
+
+
+@pytest.mark.django_db
+def test_metrics_staff_only(client, create_test_user):
+    assert client.get(reverse('metrics')).status_code == 302
+    client.force_login(create_test_user)
+    assert client.get(reverse('metrics')).status_code == 403
+
+
+@pytest.mark.django_db
+def test_request_profiler(client, seed_dataset, create_test_user, tmp_path):
+    url = reverse('department-hours')
+    client.force_login(seed_dataset['employees'][0])
+    #disabled unless the setting allows it
+    response = client.get(url, {'profile': '1'})
+    assert 'X-Profile-Id' not in response and not RequestProfile.objects.exists()
+
+    with override_settings(PROFILING_ENABLED=True):
+        response = client.get(url, {'profile': '1'})
+        profile = RequestProfile.objects.get(request_id=response['X-Profile-Id'])
+        assert profile.view_name == 'department-hours' and profile.top_functions
+        assert profile.top_allocations == []
+        response = client.get(url, HTTP_X_PROFILE='memory')
+        assert RequestProfile.objects.get(request_id=response['X-Profile-Id']).top_allocations
+        #only staff users
+        client.force_login(create_test_user)
+        response = client.get(reverse('list-all-hours'), {'profile': '1'})
+        assert 'X-Profile-Id' not in response and RequestProfile.objects.count() == 2
+
+    client.force_login(seed_dataset['employees'][0])
+    response = client.get(reverse('admin:timetracking_app_requestprofile_changelist'))
+    assert response.status_code == 200 and escape(profile.top_functions[0]['function']) in response.content.decode()
+    assert client.get(reverse('admin:timetracking_app_requestprofile_change', args=[profile.pk])).status_code == 200
+    response = client.get(reverse('admin:timetracking_app_requestprofile_download', args=[profile.pk]))
+    (tmp_path / 'request.prof').write_bytes(response.content)
+    assert pstats.Stats(str(tmp_path / 'request.prof')).total_calls > 0
+
+
+def test_slow_query_fingerprint():
+    assert get_fingerprint('SELECT * FROM t WHERE id IN (%s, %s) LIMIT 21') == \
+        get_fingerprint('SELECT *  FROM t WHERE id IN (%s, %s, %s)\nLIMIT 100')
+    assert get_fingerprint('SELECT * FROM t WHERE a = %s') != get_fingerprint('SELECT * FROM t WHERE b = %s')
+    assert get_param_shape([1, 'a', datetime.date.today(), [1, 2]]) == ['int', 'str', 'date', 'list[2]']
+    assert get_param_shape([(1,), (2,)], many=True) == {'rows': 2, 'params': ['int']}
+
+
+@pytest.mark.django_db
+def test_slow_query_log(client, seed_dataset):
+    client.force_login(seed_dataset['employees'][0])
+    #every query counts as slow
+    with override_settings(SLOW_QUERY_THRESHOLD_MS=0):
+        client.get(reverse('list-all-hours'), {'filter_type': 'monthly'})
+        recorded = SlowQuery.objects.count()
+        plans = dict(SlowQuery.objects.values_list('fingerprint', 'explain'))
+        client.get(reverse('list-all-hours'), {'filter_type': 'monthly'})
+    assert recorded and SlowQuery.objects.count() == recorded
+    entries = SlowQuery.objects.exclude(sql__contains='COUNT(').get(sql__contains='FROM "timetracking_app_loggedhours"')
+    assert entries.count == 2 and entries.views == ['list-all-hours']
+    assert 'loggedhours_employee_date_idx' in entries.explain and plans[entries.fingerprint] == entries.explain
+    #the archived annotation, the employee id and the date range
+    assert entries.param_shape[:3] == ['bool', 'int', 'str']
+    #the values are not stored
+    assert seed_dataset['employees'][0].email not in json.dumps(list(SlowQuery.objects.values_list('param_shape')))
+
+    client.get(reverse('list-all-hours'))
+    assert SlowQuery.objects.count() == recorded
+    response = client.get(reverse('admin:timetracking_app_slowquery_change', args=[entries.pk]))
+    assert response.status_code == 200 and 'loggedhours_employee_date_idx' in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_slow_query_log_errors_are_logged(client, seed_dataset, monkeypatch, caplog):
+    def fail(slow_queries, view_name):
+        raise DatabaseError('database is locked')
+
+    monkeypatch.setattr('timetracking_app.instrumentation.record_slow_queries', fail)
+    client.force_login(seed_dataset['employees'][0])
+    with override_settings(SLOW_QUERY_THRESHOLD_MS=0), caplog.at_level('ERROR', logger='timetracking_app.requests'):
+        assert client.get(reverse('list-all-hours')).status_code == 200
+    assert 'slow queries of list-all-hours not recorded' in caplog.text
+
+
+def test_replica_router():
+    router = ReplicaRouter()
+    assert router.db_for_read(LoggedHours) is None and router.db_for_write(LoggedHours) == 'default'
+    token = request_routing.set({'replica': True, 'wrote': False})
+    try:
+        assert router.db_for_read(LoggedHours) == REPLICA_DATABASE
+        #sessions, groups and permissions stay on the primary, the people (search) are read from the replica
+        assert router.db_for_read(Group) is None
+        assert router.db_for_read(Person.groups.through) is None
+        assert router.db_for_read(Person.user_permissions.through) is None
+        assert router.db_for_read(Person) == REPLICA_DATABASE
+        #the instrumentation writes do not make the user sticky
+        assert router.db_for_write(RequestProfile) == 'default' and not request_routing.get()['wrote']
+        assert router.db_for_write(LoggedHours) == 'default' and request_routing.get()['wrote']
+    finally:
+        request_routing.reset(token)
+    assert not router.allow_migrate(REPLICA_DATABASE, 'timetracking_app')
+
+
+@pytest.mark.django_db
+def test_replica_reads(client, seed_dataset, replica_database):
+    #the replica has not got the hours yet
+    DailyLoggedHours.objects.using(replica_database).all().delete()
+    LoggedHours.objects.using(replica_database).all().delete()
+    client.force_login(seed_dataset['employees'][0])
+
+    def get_channel_hours():
+        cache.clear()
+        #no hours changed within the sticky window
+        cache.set(REPORT_CHANGED_AT_KEY, 0, None)
+        return client.get(reverse('hours-per-channel')).context['hours_per_channel']
+
+    assert get_channel_hours() == {}
+    #the pages that are not marked read from the primary
+    assert len(client.get(reverse('list-all-hours')).context['object_list']) > 0
+    assert client.get(reverse('export-employees-hours')).getvalue().decode().count('\n') == 1
+
+    #the search reads the replica too, the user of the request comes from the primary
+    PersonSearchToken.objects.using(replica_database).all().delete()
+    response = client.get(reverse('search-employee'), {'q': seed_dataset['employees'][1].username})
+    assert response.context['user'] == seed_dataset['employees'][0]
+    assert list(response.context['employees']) == []
+
+    #hours changed a moment ago - the replica may lag, its report is served but not cached
+    cache.clear()
+    assert client.get(reverse('hours-per-channel')).context['hours_per_channel'] == {}
+    client.cookies[STICKY_PRIMARY_COOKIE] = '1'
+    assert client.get(reverse('hours-per-channel')).context['hours_per_channel'] != {}
+    del client.cookies[STICKY_PRIMARY_COOKIE]
+
+    #the user wrote, the next reads are sticky to the primary
+    response = client.post(reverse('delete-hours', kwargs={'pk': seed_dataset['entries'][0].pk}))
+    assert response.cookies[STICKY_PRIMARY_COOKIE]['max-age'] == 15
+    assert get_channel_hours() != {}
+    del client.cookies[STICKY_PRIMARY_COOKIE]
+    assert get_channel_hours() == {}
+
+
+@pytest.mark.django_db
+def test_warm_up():
+    assert list(warm_up()) == list(WARMUP_STEPS)
+    #nothing archived
+    assert cache.get(ARCHIVE_BOUNDARY_KEY) == ''
+    assert compile_templates() >= len(list((settings.BASE_DIR / 'timetracking_app' / 'templates').rglob('*.html')))
+
+
+@pytest.mark.django_db
+def test_warm_up_reference_data(client, seed_dataset):
+    employee, inactive, absent = seed_dataset['employees'][1:4]
+    Person.objects.filter(pk__in=[employee.pk, inactive.pk]).update(last_login=timezone.now())
+    inactive.is_active = False
+    inactive.save()
+    cache.clear()
+    warm_up(['caches'])
+    assert cache.get(get_scope_cache_key(employee.pk))['department_id'] == employee.department_id
+    assert cache.get(get_scope_cache_key(inactive.pk)) is None
+    assert cache.get(get_scope_cache_key(absent.pk)) is None
+
+    #the weekly timesheet reads the channels and departments from the cache
+    client.force_login(employee)
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(reverse('add-weekly-hours'))
+    assert not [query for query in captured.captured_queries
+                if 'timetracking_app_saleschannel' in query['sql'] or 'timetracking_app_department' in query['sql']]
+    channel = seed_dataset['sales_channels'][0]
+    assert (channel.id, channel.channel_name) in response.context['form'].forms[0].fields['sales_channel'].choices
+
+    channel.channel_name = 'renamed_channel'
+    channel.save()
+    response = client.get(reverse('add-weekly-hours'))
+    assert (channel.id, 'renamed_channel') in response.context['form'].forms[0].fields['sales_channel'].choices
+
+
+def test_parse_import_times():
+    output = ('import time: self [us] | cumulative | imported package\n'
+              'import time:       120 |        120 |     _csv\n'
+              'import time:       580 |        700 |   csv\n'
+              'warmed up in 1.0 ms\n'
+              'import time:      1500 |       2200 | timetracking_app.roster\n')
+    assert parse_import_times(output) == [
+        {'module': '_csv', 'self_ms': 0.12, 'cumulative_ms': 0.12, 'depth': 2},
+        {'module': 'csv', 'self_ms': 0.58, 'cumulative_ms': 0.7, 'depth': 1},
+        {'module': 'timetracking_app.roster', 'self_ms': 1.5, 'cumulative_ms': 2.2, 'depth': 0},
+    ]
@@ -1,6 +1,16 @@
 from django.contrib import admin
 
-from .models import Person, LoggedHours, Department, SalesChannel
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+
+from .models import (Person, LoggedHours, ArchivedLoggedHours, Department, SalesChannel, DailyLoggedHours, OutboxEmail,
+                     RequestProfile, SlowQuery)
+from .report_cache import bump_reports_version
+from .roster import deactivate_employees
 
 # Register your models here.
 
@@ -8,6 +18,11 @@ from .models import Person, LoggedHours, Department, SalesChannel
 class PersonAdmin(admin.ModelAdmin):
     model = Person
     list_display = ['first_name', 'last_name', 'email', 'department', 'is_active']
+    actions = ['deactivate']
+
+    @admin.action(description='Deactivate selected employees', permissions=['delete'])
+    def deactivate(self, request, queryset):
+        deactivate_employees(queryset)
 
 class DepartmentAdmin(admin.ModelAdmin):
     model = Department
@@ -25,8 +40,165 @@ class LoggedHoursAdmin(admin.ModelAdmin):
     def get_employee_name(self, obj):
         return obj.employee.last_name, obj.employee.first_name if obj.employee else 'No employee'
 
+    #bulk delete bypasses LoggedHours.delete, so update the daily rollup and the report cache here
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            DailyLoggedHours.remove_entries(queryset)
+            super().delete_queryset(request, queryset)
+            transaction.on_commit(bump_reports_version)
+
+
+#read only - entries are archived and restored with the archive_logged_hours command
+class ArchivedLoggedHoursAdmin(admin.ModelAdmin):
+    model = ArchivedLoggedHours
+    list_display = ['date', 'employee', 'hour', 'sales_channel', 'department']
+    list_select_related = ['employee', 'sales_channel', 'department']
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+#read only - the rollup follows LoggedHours and is rebuilt with the rebuild_daily_hours command
+class DailyLoggedHoursAdmin(admin.ModelAdmin):
+    model = DailyLoggedHours
+    list_display = ['date', 'employee', 'hour', 'entries_count', 'sales_channel', 'department']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+    model = OutboxEmail
+    list_display = ['subject', 'to', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status']
+    actions = ['retry_now']
+
+    #queue failed (or delayed) emails again for the next worker run
+    @admin.action(description='Retry selected emails now')
+    def retry_now(self, request, queryset):
+        queryset.exclude(status=OutboxEmail.SENT).update(status=OutboxEmail.PENDING, attempts=0,
+                                                        next_attempt_at=timezone.now())
+
+
+
+#Recent request profiles with their hottest functions. Profiles are created by the profiling middleware only.
+class RequestProfileAdmin(admin.ModelAdmin):
+    model = RequestProfile
+    list_display = ['created_at', 'method', 'path', 'view_name', 'user', 'status_code', 'duration_ms',
+                    'hottest_function']
+    list_filter = ['view_name']
+    list_select_related = ['user']
+    search_fields = ['path', 'request_id']
+    exclude = ['stats', 'top_functions', 'top_allocations']
+    readonly_fields = ['request_id', 'path', 'method', 'view_name', 'user', 'status_code', 'duration_ms',
+                       'created_at', 'download', 'functions_table', 'allocations_table']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    #the change list does not need the stored stats
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('stats', 'top_allocations')
+
+    def get_urls(self):
+        return [path('<int:pk>/download/', self.admin_site.admin_view(self.download_view),
+                     name='timetracking_app_requestprofile_download')] + super().get_urls()
+
+    def download_view(self, request, pk):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(bytes(profile.stats), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{profile.request_id}.prof"'
+        return response
+
+    @admin.display(description='Hottest function')
+    def hottest_function(self, obj):
+        if not obj.top_functions:
+            return '-'
+        function = obj.top_functions[0]
+        return f'{function["function"]} ({function["tottime_ms"]} ms)'
+
+    @admin.display(description='.prof file')
+    def download(self, obj):
+        url = reverse('admin:timetracking_app_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}.prof</a>', url, obj.request_id)
+
+    @admin.display(description='Functions by own time')
+    def functions_table(self, obj):
+        rows = format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+                                ((function['function'], function['calls'], function['tottime_ms'],
+                                  function['cumtime_ms']) for function in obj.top_functions))
+        return format_html('<table><tr><th>Function</th><th>Calls</th><th>Own ms</th><th>Total ms</th></tr>{}</table>',
+                           rows)
+
+    @admin.display(description='Allocations')
+    def allocations_table(self, obj):
+        if not obj.top_allocations:
+            return '-'
+        rows = format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td></tr>',
+                                ((allocation['location'], allocation['size_kb'], allocation['count'])
+                                 for allocation in obj.top_allocations))
+        return format_html('<table><tr><th>Line</th><th>KiB</th><th>Blocks</th></tr>{}</table>', rows)
+
+
+
+#Slow queries per fingerprint, the most expensive first, with their EXPLAIN plans.
+#Delete a query to capture a fresh plan (e.g. after adding an index) on its next slow execution.
+class SlowQueryAdmin(admin.ModelAdmin):
+    model = SlowQuery
+    list_display = ['short_sql', 'views', 'count', 'average_ms', 'max_ms', 'total_ms', 'last_seen']
+    ordering = ['-total_ms']
+    search_fields = ['sql']
+    readonly_fields = ['fingerprint', 'sql_text', 'param_shape', 'database', 'views', 'explain_text', 'count',
+                       'total_ms', 'max_ms', 'first_seen', 'last_seen']
+    exclude = ['sql', 'explain']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='SQL')
+    def short_sql(self, obj):
+        return obj.sql[:120]
+
+    @admin.display(description='Average ms', ordering='total_ms')
+    def average_ms(self, obj):
+        return round(obj.total_ms / obj.count, 1) if obj.count else 0
+
+    @admin.display(description='SQL')
+    def sql_text(self, obj):
+        return format_html('<pre style="white-space: pre-wrap">{}</pre>', obj.sql)
+
+    @admin.display(description='EXPLAIN')
+    def explain_text(self, obj):
+        return format_html('<pre>{}</pre>', obj.explain or '-')
+
 
 admin.site.register(Person, PersonAdmin)
 admin.site.register(LoggedHours, LoggedHoursAdmin)
 admin.site.register(Department, DepartmentAdmin)
-admin.site.register(SalesChannel)
\ No newline at end of file
+admin.site.register(SalesChannel)
+admin.site.register(ArchivedLoggedHours, ArchivedLoggedHoursAdmin)
+admin.site.register(DailyLoggedHours, DailyLoggedHoursAdmin)
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
+admin.site.register(RequestProfile, RequestProfileAdmin)
+admin.site.register(SlowQuery, SlowQueryAdmin)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TimetrackingAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'timetracking_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - registers the signal receivers
@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Q, Value
+
+from .date_ranges import filter_date_range, get_today
+from .models import LoggedHours, ArchivedLoggedHours
+
+ARCHIVE_BATCH_SIZE = 1000
+#whole years kept in LoggedHours (the current one included), older entries are archived
+ARCHIVE_KEEP_YEARS = getattr(settings, 'LOGGED_HOURS_KEEP_YEARS', 2)
+ARCHIVE_FIELDS = ('id', 'date', 'hour', 'employee_id', 'sales_channel_id', 'department_id')
+ARCHIVE_BOUNDARY_KEY = 'logged_hours:archive_boundary'
+#an archive run deletes the boundary from the shared cache - the timeout bounds how long a worker that cannot see
+#that cache keeps an old boundary
+ARCHIVE_BOUNDARY_TIMEOUT = 600
+
+
+#first day kept in LoggedHours - the archive holds whole years before it
+def get_archive_cutoff(keep_years=ARCHIVE_KEEP_YEARS, today=None):
+    today = today or get_today()
+    return date(today.year - keep_years + 1, 1, 1)
+
+
+#Day after the newest archived entry, None while nothing is archived. Cached until the next archive or restore run
+#or the timeout.
+def get_archive_boundary():
+    boundary = cache.get(ARCHIVE_BOUNDARY_KEY)
+    if boundary is None:
+        newest = ArchivedLoggedHours.objects.aggregate(newest=Max('date'))['newest']
+        #'' caches "nothing archived"
+        boundary = newest + timedelta(days=1) if newest else ''
+        cache.set(ARCHIVE_BOUNDARY_KEY, boundary, ARCHIVE_BOUNDARY_TIMEOUT)
+    return boundary or None
+
+
+#Hours of a date range, read only from the tables holding it.
+#build_queryset(queryset) applies the filters of the caller to a LoggedHours or an ArchivedLoggedHours queryset.
+#LoggedHours is always read; the archive only when something is archived and the range has no start or starts
+#before the archive boundary, so recent ranges stay on the small hot table. Both parts are combined with UNION ALL.
+#Rows are annotated with archived (True for the archive) - archived entries cannot be edited or deleted.
+def route_date_range(build_queryset, start=None, end=None):
+    queryset = filter_date_range(build_queryset(LoggedHours.objects.annotate(archived=Value(False))), start, end)
+    boundary = get_archive_boundary()
+    if boundary is None or (start is not None and start >= boundary):
+        return queryset
+    archived = filter_date_range(build_queryset(ArchivedLoggedHours.objects.annotate(archived=Value(True))), start,
+                                 end)
+    return queryset.union(archived, all=True)
+
+
+#Move the rows of the queryset to the target model in chunks of batch_size, one transaction per chunk, keeping the
+#ids. The daily rollup is not touched - it sums both tables. Returns the number of moved rows.
+def move_entries(queryset, target, batch_size=ARCHIVE_BATCH_SIZE):
+    moved = 0
+    try:
+        while True:
+            with transaction.atomic():
+                rows = list(queryset.select_for_update().order_by('id').values(*ARCHIVE_FIELDS)[:batch_size])
+                if not rows:
+                    break
+                target.objects.bulk_create([target(**row) for row in rows])
+                queryset.model.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+    finally:
+        cache.delete(ARCHIVE_BOUNDARY_KEY)
+    return moved
+
+
+#Archive the entries logged before the cutoff date.
+def archive_logged_hours(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    return move_entries(LoggedHours.objects.filter(date__lt=cutoff), ArchivedLoggedHours, batch_size)
+
+
+#Move archived entries back to LoggedHours - all of them, or the entries of the given years only.
+def restore_logged_hours(years=None, batch_size=ARCHIVE_BATCH_SIZE):
+    queryset = ArchivedLoggedHours.objects.all()
+    if years:
+        #date__year is a BETWEEN on the date index, one range per year
+        queryset = queryset.filter(reduce(or_, (Q(date__year=year) for year in years)))
+    return move_entries(queryset, LoggedHours, batch_size)
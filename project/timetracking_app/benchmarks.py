@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+#A test database (test_ name or an in-memory SQLite database) or a copy marked with settings.BENCHMARK_DATABASE.
+def is_benchmark_database(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    name = str(connection.settings_dict['NAME'])
+    if getattr(settings, 'BENCHMARK_DATABASE', False) or Path(name).name.startswith('test_'):
+        return True
+    return connection.vendor == 'sqlite' and connection.creation.is_in_memory_db(name)
+
+
+#The benchmarks insert generated rows and drop indexes inside long transactions, which lock the tables of a live
+#database - refuse to run anywhere else.
+def check_benchmark_database(using=DEFAULT_DB_ALIAS):
+    if not is_benchmark_database(using):
+        raise CommandError(f'The {connections[using].settings_dict["NAME"]} database is not a test database. Run the '
+                           f'benchmark on a copy of the database started with BENCHMARK_DATABASE=1.')
@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+#File cache whose add() is atomic between processes, so the workers can share the report locks
+#(the add() of Django checks the key and writes the file in two steps).
+class AtomicFileBasedCache(FileBasedCache):
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        #has_key() also removes the file of an expired key
+        if self.has_key(key, version):
+            return False
+        self._createdir()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as file:
+                self._write_content(file, timeout, value)
+            #unlike a rename, a link fails when another process created the file first
+            os.link(tmp_path, self._key_to_file(key, version))
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+
+from django.utils import timezone
+
+#calendar periods containing today
+DATE_RANGE_PRESETS = {
+    'weekly': 'Current week',
+    'monthly': 'Current month',
+    'yearly': 'Current year',
+}
+DATE_RANGE_PARAMS = ('filter_type', 'start', 'end')
+
+
+#today in the timezone of the company (settings.TIME_ZONE, Europe/Warsaw), whatever timezone is active
+def get_today():
+    return timezone.localdate(timezone=timezone.get_default_timezone())
+
+
+#First and last day of a preset period, (None, None) for no preset.
+#Weeks start on Monday, all bounds are inclusive dates.
+def get_preset_range(preset, today=None):
+    today = today or get_today()
+    if preset == 'weekly':
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=6)
+    if preset == 'monthly':
+        start = today.replace(day=1)
+        next_month = (start + timedelta(days=31)).replace(day=1)
+        return start, next_month - timedelta(days=1)
+    if preset == 'yearly':
+        return date(today.year, 1, 1), date(today.year, 12, 31)
+    return None, None
+
+
+#Resolve a preset and/or explicit dates to an inclusive (start, end) pair of dates - None means unbounded.
+#Explicit dates take precedence over the bounds of the preset.
+def resolve_date_range(preset=None, start=None, end=None, today=None):
+    preset_start, preset_end = get_preset_range(preset, today)
+    return start or preset_start, end or preset_end
+
+
+#Plain date predicates on a DateField, so the (employee|department, date) indexes serve them.
+def filter_date_range(queryset, start=None, end=None, field='date'):
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{field}__lte': end})
+    return queryset
+
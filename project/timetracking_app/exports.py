@@ -0,0 +1,36 @@
+import csv
+
+EXPORT_CHUNK_SIZE = 2000
+
+LOGGED_HOURS_EXPORT_COLUMNS = (
+    ('Date', 'date'),
+    ('Username', 'employee__username'),
+    ('First name', 'employee__first_name'),
+    ('Last name', 'employee__last_name'),
+    ('Email', 'employee__email'),
+    ('Department', 'department__department_name'),
+    ('Sales channel', 'sales_channel__channel_name'),
+    ('Hours', 'hour'),
+)
+
+
+#File-like object that hands back what csv.writer writes instead of storing it.
+class Echo:
+    def write(self, value):
+        return value
+
+
+#Export columns of a LoggedHours or ArchivedLoggedHours queryset. Applied to each table before a range reaching
+#into the archive combines them (UNION ALL), so both parts select exactly the exported columns.
+def export_values(queryset):
+    return queryset.values_list(*[field for header, field in LOGGED_HOURS_EXPORT_COLUMNS])
+
+
+#Yield the header and the rows of export_values() querysets (ordered by selected columns only) as CSV lines.
+#Related names are joined in the query and rows are fetched in chunks (server-side cursor on PostgreSQL),
+#so memory use does not depend on the number of exported rows.
+def iter_logged_hours_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, field in LOGGED_HOURS_EXPORT_COLUMNS])
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield writer.writerow(row)
@@ -1,10 +1,24 @@
 from datetime import datetime, timedelta
 
 from django import forms
+from django.contrib.auth.forms import PasswordResetForm
 from django.forms import PasswordInput
 from django.core.exceptions import ValidationError
+from django.template.loader import render_to_string
 
+from .date_ranges import DATE_RANGE_PRESETS, get_today, resolve_date_range
 from .models import SalesChannel, LoggedHours, Department, Person
+from .outbox import enqueue_email
+from .reports import TREND_MAX_FUTURE, TREND_MAX_SPANS
+
+
+#Rules for the date of logged hours, shared by the forms and the bulk import.
+#max_age_days=None allows any past date (used when importing historical hours).
+def validate_logged_date(date, max_age_days=30):
+    if date > date.today():
+        raise ValidationError ('The date cannot be in the future.')
+    elif max_age_days is not None and date < date.today() - timedelta(days=max_age_days):
+        raise ValidationError(f"The date must be within last {max_age_days} days.")
 
 
 class LoginForm(forms.Form):
@@ -34,24 +48,141 @@ class AddHoursForm(forms.ModelForm):
 
     def clean_date(self):
         date = self.cleaned_data['date']
-        if date > date.today():
-            raise ValidationError ('The date cannot be in the future.')
-        elif date < date.today() - timedelta(days=30):
-            raise ValidationError(f"The date must be within last 30 days.")
+        validate_logged_date(date)
         return date
 
 
+#One row of the weekly timesheet: a sales channel and department with hours for each day of the week.
+#Choices are passed in by the formset, so the channels and departments are loaded once for all rows.
+class TimesheetRowForm(forms.Form):
+    DAYS = 7
+
+    def __init__(self, *args, channel_choices=(), department_choices=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['sales_channel'] = forms.TypedChoiceField(choices=[('', '---------')] + list(channel_choices),
+                                                              coerce=int, empty_value=None)
+        self.fields['department'] = forms.TypedChoiceField(choices=[('', '---------')] + list(department_choices),
+                                                           coerce=int, empty_value=None)
+        hour_validators = LoggedHours._meta.get_field('hour').validators
+        for day in range(self.DAYS):
+            self.fields[f'day_{day}'] = forms.FloatField(required=False, validators=hour_validators,
+                                                         widget=forms.NumberInput(attrs={'step': 0.25, 'style': 'width: 5em'}))
+
+    def get_hours(self):
+        return [self.cleaned_data.get(f'day_{day}') for day in range(self.DAYS)]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        has_hours = any(hours for hours in self.get_hours())
+        if has_hours and not (cleaned_data.get('sales_channel') and cleaned_data.get('department')):
+            raise ValidationError('Select a sales channel and a department for the hours in this row.')
+        return cleaned_data
+
+
+#Validates all timesheet rows together - every filled day must pass the AddHoursForm date rules.
+class BaseTimesheetFormSet(forms.BaseFormSet):
+
+    def __init__(self, *args, week_start=None, **kwargs):
+        self.week_start = week_start
+        super().__init__(*args, **kwargs)
+
+    def clean(self):
+        if any(self.errors):
+            return
+        for form in self.forms:
+            for day, hours in enumerate(form.get_hours()):
+                if hours:
+                    date = self.week_start + timedelta(days=day)
+                    try:
+                        validate_logged_date(date)
+                    except ValidationError as error:
+                        raise ValidationError(f'{date}: {error.messages[0]}')
+
+    #unsaved LoggedHours entries for all filled cells
+    def get_entries(self, employee):
+        entries = []
+        for form in self.forms:
+            for day, hours in enumerate(form.get_hours()):
+                if hours:
+                    entries.append(LoggedHours(date=self.week_start + timedelta(days=day), hour=hours,
+                                               employee=employee, sales_channel_id=form.cleaned_data['sales_channel'],
+                                               department_id=form.cleaned_data['department']))
+        return entries
+
+
+TimesheetFormSet = forms.formset_factory(TimesheetRowForm, formset=BaseTimesheetFormSet, extra=5)
+
+
+class ImportHoursForm(forms.Form):
+    file = forms.FileField(label='CSV file', help_text='Columns: Date, Email, Department, Sales channel, Hours')
+
+
+class RosterFileForm(forms.Form):
+    file = forms.FileField(label='CSV file')
+
+
 class ResetPasswordForm(forms.Form):
     email = forms.EmailField(label='Email')
     new_password = forms.CharField(label='New password', widget=forms.PasswordInput)
     confirm_password = forms.CharField(label='Confirm new password', widget=forms.PasswordInput)
 
 
+#Django's password reset form, but the email is queued in the outbox instead of being sent within the request
+class OutboxPasswordResetForm(PasswordResetForm):
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = ''.join(render_to_string(subject_template_name, context).splitlines())
+        body = render_to_string(email_template_name, context)
+        html_body = render_to_string(html_email_template_name, context) if html_email_template_name else ''
+        enqueue_email(subject, body, [to_email], from_email=from_email, html_body=html_body)
+
+
+class DateRangeForm(forms.Form):
+    filter_type = forms.ChoiceField(label='Period', required=False,
+                                    choices=[('', 'Any time')] + list(DATE_RANGE_PRESETS.items()))
+    start = forms.DateField(label='From', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(label='To', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise ValidationError('The start date must not be after the end date.')
+        return cleaned_data
+
+
+class TrendForm(DateRangeForm):
+    bucket = forms.ChoiceField(label='Group by', required=False, initial='month',
+                               choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month'), ('quarter', 'Quarter')])
+    split = forms.ChoiceField(label='Split by', required=False,
+                              choices=[('', 'Nothing'), ('channel', 'Sales channel'), ('department', 'Department')])
+
+    #default: the last year, by month
+    def clean(self):
+        cleaned_data = super().clean()
+        cleaned_data['bucket'] = cleaned_data.get('bucket') or 'month'
+        cleaned_data['split'] = cleaned_data.get('split') or None
+        start, end = resolve_date_range(cleaned_data.pop('filter_type', None), cleaned_data.get('start'),
+                                        cleaned_data.get('end'))
+        cleaned_data['end'] = end or get_today()
+        cleaned_data['start'] = start or cleaned_data['end'] - timedelta(days=365)
+        if cleaned_data['end'] > get_today() + TREND_MAX_FUTURE:
+            raise ValidationError(f'The end date must be within {TREND_MAX_FUTURE.days} days from today.')
+        if cleaned_data['end'] - cleaned_data['start'] > TREND_MAX_SPANS[cleaned_data['bucket']]:
+            raise ValidationError(f'The range is too long to group by {cleaned_data["bucket"]}, '
+                                  f'choose a shorter range or group by a longer period.')
+        return cleaned_data
+
+
 class SearchEmployeeForm(forms.Form):
-    email = forms.EmailField(label='Email', required=False)
+    q = forms.CharField(label='Search', required=False)
+    email = forms.CharField(label='Email', required=False)
     first_name = forms.CharField(label='First name', required=False)
     last_name = forms.CharField(label='Last name', required=False)
     department = forms.CharField(label='Department', required=False)
+    #deactivated employees are found only on request - to reactivate them or to audit their hours
+    include_inactive = forms.BooleanField(label='Include deactivated employees', required=False)
 
 
 class ChangePasswordForm(forms.Form):
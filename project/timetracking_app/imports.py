@@ -0,0 +1,93 @@
+import csv
+import math
+from datetime import date
+
+from django.core.exceptions import ValidationError
+
+from .forms import validate_logged_date
+from .models import LoggedHours, Person, Department, SalesChannel
+
+IMPORT_BATCH_SIZE = 5000
+
+#CSV columns read by the import - the same headers as in the CSV export, so an export can be imported back
+IMPORT_COLUMNS = ('Date', 'Email', 'Department', 'Sales channel', 'Hours')
+
+
+#Import LoggedHours rows from CSV in batches.
+#Employees, departments and sales channels are resolved from lookup maps loaded once, rows are validated with the
+#AddHoursForm date rules and the LoggedHours.hour validators, valid rows are written with bulk_create per batch.
+class LoggedHoursImporter:
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, max_age_days=None):
+        self.batch_size = batch_size
+        self.max_age_days = max_age_days
+        self.employees = dict(Person.objects.values_list('email', 'id'))
+        self.departments = dict(Department.objects.values_list('department_name', 'id'))
+        self.sales_channels = dict(SalesChannel.objects.values_list('channel_name', 'id'))
+        self.hour_field = LoggedHours._meta.get_field('hour')
+        self.created = 0
+        self.errors = []
+
+    def import_file(self, file):
+        reader = csv.DictReader(file)
+        missing = [column for column in IMPORT_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            self.errors.append((1, f'Missing columns: {", ".join(missing)}'))
+            return self
+
+        batch = []
+        #line 1 is the header
+        for line_number, row in enumerate(reader, start=2):
+            entry = self.build_entry(line_number, row)
+            if entry is not None:
+                batch.append(entry)
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = []
+        self.save_batch(batch)
+        return self
+
+    #return an unsaved LoggedHours, or record the errors of the row and return None
+    def build_entry(self, line_number, row):
+        row = {column: (row[column] or '').strip() for column in IMPORT_COLUMNS}
+        errors = []
+        entry_date = hour = None
+        try:
+            entry_date = date.fromisoformat(row['Date'])
+            validate_logged_date(entry_date, max_age_days=self.max_age_days)
+        except ValueError:
+            errors.append(f'invalid date "{row["Date"]}"')
+        except ValidationError as error:
+            errors.extend(error.messages)
+        try:
+            hour = float(row['Hours'])
+            #nan and inf pass the min and max validators
+            if not math.isfinite(hour):
+                raise ValueError
+            self.hour_field.run_validators(hour)
+        except ValueError:
+            errors.append(f'invalid number of hours "{row["Hours"]}"')
+        except ValidationError as error:
+            errors.extend(error.messages)
+
+        employee_id = self.employees.get(row['Email'])
+        department_id = self.departments.get(row['Department'])
+        sales_channel_id = self.sales_channels.get(row['Sales channel'])
+        if employee_id is None:
+            errors.append(f'unknown employee "{row["Email"]}"')
+        if department_id is None:
+            errors.append(f'unknown department "{row["Department"]}"')
+        if sales_channel_id is None:
+            errors.append(f'unknown sales channel "{row["Sales channel"]}"')
+
+        if errors:
+            self.errors.append((line_number, '; '.join(errors)))
+            return None
+        return LoggedHours(date=entry_date, hour=hour, employee_id=employee_id, department_id=department_id,
+                           sales_channel_id=sales_channel_id)
+
+    def save_batch(self, batch):
+        if not batch:
+            return
+        LoggedHours.bulk_log(batch)
+        self.created += len(batch)
@@ -0,0 +1,238 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+from .slow_queries import record_slow_queries
+
+logger = logging.getLogger('timetracking_app.requests')
+
+#upper bounds of the histogram buckets - seconds for the timings, a count for the queries
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+#the histograms cover the last METRICS_WINDOWS windows of METRICS_WINDOW seconds (an hour)
+METRICS_WINDOW = 300
+METRICS_WINDOWS = 12
+#view label of the requests that did not resolve to a named URL (404, static files)
+UNRESOLVED_VIEW = 'unresolved'
+
+#metrics of the request being handled in this thread / task
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+#Timings of one request, in seconds.
+class RequestMetrics:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0
+        self.template_time = 0
+        self.total_time = None
+        #queries slower than this (seconds) are kept for the slow query log, None keeps none
+        threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+        self.slow_query_threshold = threshold / 1000 if threshold is not None else None
+        self.slow_queries = []
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.start
+
+    def get_server_timing(self):
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+                f'tpl;dur={self.template_time * 1000:.1f}, total;dur={self.total_time * 1000:.1f}')
+
+
+#Database execute wrapper - counts and times every query run during a request.
+def time_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        metrics.queries += 1
+        metrics.db_time += duration
+        if metrics.slow_query_threshold is not None and duration >= metrics.slow_query_threshold:
+            metrics.slow_queries.append({'sql': sql, 'params': params, 'many': many, 'duration': duration,
+                                         'using': context['connection'].alias})
+
+
+#Django template backend that adds the render time of every template to the request metrics.
+#Included templates render inside the template including them, so they are not counted twice.
+class TimedDjangoTemplates(DjangoTemplates):
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class TimedTemplate:
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            if metrics is not None:
+                metrics.template_time += time.perf_counter() - start
+
+
+#Bucket counts, sum and count of the observed values.
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+#Per view histograms of the requests of the last hour, kept per window so old requests drop out.
+#The registry is per process - every worker reports only the requests it served, labelled with its pid
+#(worker="..."). A scrape through the load balancer reaches one worker; sum over the worker label only when every
+#worker is scraped.
+class MetricsRegistry:
+    METRICS = {
+        'request_duration_seconds': ('Time to build the response', TIME_BUCKETS),
+        'db_duration_seconds': ('Time spent in database queries', TIME_BUCKETS),
+        'template_duration_seconds': ('Time spent rendering templates', TIME_BUCKETS),
+        'db_queries': ('Database queries per request', QUERY_BUCKETS),
+    }
+
+    def __init__(self, window=METRICS_WINDOW, windows=METRICS_WINDOWS):
+        self.window = window
+        self.windows = windows
+        self.lock = threading.Lock()
+        #window number -> {(metric, view): Histogram}
+        self.data = {}
+
+    def record(self, view, metrics):
+        values = {
+            'request_duration_seconds': metrics.total_time,
+            'db_duration_seconds': metrics.db_time,
+            'template_duration_seconds': metrics.template_time,
+            'db_queries': metrics.queries,
+        }
+        window = int(time.time() // self.window)
+        with self.lock:
+            histograms = self.data.setdefault(window, {})
+            for name, value in values.items():
+                key = (name, view)
+                if key not in histograms:
+                    histograms[key] = Histogram(self.METRICS[name][1])
+                histograms[key].observe(value)
+            for old_window in [old for old in self.data if old <= window - self.windows]:
+                del self.data[old_window]
+
+    #histograms of the retained windows merged per metric and view
+    def collect(self):
+        oldest = int(time.time() // self.window) - self.windows + 1
+        merged = {}
+        with self.lock:
+            for window, histograms in self.data.items():
+                if window < oldest:
+                    continue
+                for (name, view), histogram in histograms.items():
+                    if (name, view) not in merged:
+                        merged[(name, view)] = Histogram(histogram.buckets)
+                    merged[(name, view)].merge(histogram)
+        return merged
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    #Prometheus text exposition format (version 0.0.4)
+    def render(self):
+        merged = self.collect()
+        #read when rendering - a preloaded application is imported by the master, before the workers fork
+        worker = os.getpid()
+        lines = []
+        for name, (description, buckets) in self.METRICS.items():
+            metric = f'timetracking_{name}'
+            lines.append(f'# HELP {metric} {description}, per view, over the last {self.window * self.windows}s, '
+                         f'of this worker process only.')
+            lines.append(f'# TYPE {metric} histogram')
+            for (histogram_name, view), histogram in sorted(merged.items()):
+                if histogram_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{view="{view}",worker="{worker}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{view="{view}",worker="{worker}"}} {histogram.sum:.6f}')
+                lines.append(f'{metric}_count{{view="{view}",worker="{worker}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+#Measure every request: SQL query count and time, template render time and total time.
+#They are sent as a Server-Timing header, logged as one line and recorded in the per view histograms.
+#Queries over settings.SLOW_QUERY_THRESHOLD_MS go to the slow query log.
+#Streamed responses are measured until the response starts, not while the body is streamed.
+class RequestMetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(time_query))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        metrics.finish()
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else UNRESOLVED_VIEW
+        response.headers.setdefault('Server-Timing', metrics.get_server_timing())
+        registry.record(view, metrics)
+        #stored after the request, so the EXPLAIN and the bookkeeping are not measured as part of it
+        #the log must not turn a served request into an error
+        if metrics.slow_queries:
+            try:
+                record_slow_queries(metrics.slow_queries, view)
+            except Exception:
+                logger.exception('slow queries of %s not recorded', view)
+        logger.info('view=%s method=%s status=%s queries=%d db_ms=%.1f template_ms=%.1f total_ms=%.1f',
+                    view, request.method, response.status_code, metrics.queries, metrics.db_time * 1000,
+                    metrics.template_time * 1000, metrics.total_time * 1000,
+                    extra={'view': view, 'method': request.method, 'status': response.status_code,
+                           'queries': metrics.queries, 'db_ms': round(metrics.db_time * 1000, 1),
+                           'template_ms': round(metrics.template_time * 1000, 1),
+                           'total_ms': round(metrics.total_time * 1000, 1)})
+        return response
@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timetracking_app.archive import (archive_logged_hours, restore_logged_hours, get_archive_cutoff,
+                                      ARCHIVE_BATCH_SIZE, ARCHIVE_KEEP_YEARS)
+
+
+class Command(BaseCommand):
+    help = ('Move LoggedHours entries of past years to the archive table in chunks, or move them back with --restore. '
+            'The daily rollup keeps the archived hours, so the reports do not change.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-years', type=int, default=ARCHIVE_KEEP_YEARS,
+                            help='Whole years kept in LoggedHours, the current one included')
+        parser.add_argument('--before', type=date.fromisoformat,
+                            help='Archive the entries before this date (YYYY-MM-DD) instead of whole years')
+        parser.add_argument('--restore', action='store_true', help='Move archived entries back to LoggedHours')
+        parser.add_argument('--year', type=int, action='append', dest='years',
+                            help='With --restore: restore this year only (can be repeated)')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            restored = restore_logged_hours(options['years'], batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Restored {restored} entries to LoggedHours.'))
+            return
+
+        if options['keep_years'] < 1:
+            raise CommandError('--keep-years must be at least 1.')
+        cutoff = options['before'] or get_archive_cutoff(options['keep_years'])
+        archived = archive_logged_hours(cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} entries logged before {cutoff}.'))
@@ -0,0 +1,113 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from timetracking_app.benchmarks import check_benchmark_database
+from timetracking_app.models import LoggedHours, Person, Department, SalesChannel
+
+
+class Command(BaseCommand):
+    help = ('Print EXPLAIN plans and timings of the entry list queries without and with the LoggedHours '
+            'composite indexes. Runs on a generated dataset inside a transaction that is rolled back, on a test '
+            'database or a copy (BENCHMARK_DATABASE=1) only.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Number of LoggedHours rows to generate')
+        parser.add_argument('--repeat', type=int, default=5, help='How many times each query is timed')
+        parser.add_argument('--use-existing', action='store_true', help='Benchmark the existing data, generate nothing')
+
+    def handle(self, *args, **options):
+        #dropping the indexes locks LoggedHours and slows down every query of the running site
+        check_benchmark_database()
+        #SQLite can only change the schema inside a transaction with foreign key checks switched off beforehand
+        connection.disable_constraint_checking()
+        try:
+            self.benchmark(options)
+        finally:
+            connection.enable_constraint_checking()
+
+    def benchmark(self, options):
+        with transaction.atomic():
+            if not options['use_existing']:
+                self.generate_dataset(options['rows'])
+            self.analyze()
+
+            indexes = LoggedHours._meta.indexes
+            with connection.schema_editor() as schema_editor:
+                for index in indexes:
+                    schema_editor.remove_index(LoggedHours, index)
+            self.analyze()
+            self.stdout.write(self.style.MIGRATE_HEADING('Without composite indexes'))
+            self.run_queries(options['repeat'])
+
+            with connection.schema_editor() as schema_editor:
+                for index in indexes:
+                    schema_editor.add_index(LoggedHours, index)
+            self.analyze()
+            self.stdout.write(self.style.MIGRATE_HEADING('With composite indexes'))
+            self.run_queries(options['repeat'])
+
+            #leave the database exactly as it was
+            transaction.set_rollback(True)
+
+    #create a small organisation and spread the rows over the last three years
+    def generate_dataset(self, rows):
+        suffix = timezone.now().strftime('%Y%m%d%H%M%S')
+        managers = [Person(username=f'benchmark_manager_{number}_{suffix}',
+                           email=f'benchmark_manager_{number}_{suffix}@example.com') for number in range(10)]
+        managers = Person.objects.bulk_create(managers)
+        departments = Department.objects.bulk_create(
+            [Department(department_name=f'benchmark_department_{number}_{suffix}', manager=manager)
+             for number, manager in enumerate(managers)])
+        channels = SalesChannel.objects.bulk_create(
+            [SalesChannel(channel_name=f'benchmark_channel_{number}_{suffix}') for number in range(20)])
+        employees = Person.objects.bulk_create(
+            [Person(username=f'benchmark_employee_{number}_{suffix}',
+                    email=f'benchmark_employee_{number}_{suffix}@example.com',
+                    department=departments[number % len(departments)]) for number in range(500)])
+
+        today = timezone.now().date()
+        batch = []
+        for number in range(rows):
+            employee = employees[number % len(employees)]
+            batch.append(LoggedHours(date=today - timezone.timedelta(days=(number // len(employees)) % 1095),
+                                     hour=1 + number % 8, employee=employee, department_id=employee.department_id,
+                                     sales_channel=channels[number % len(channels)]))
+            if len(batch) == 5000:
+                LoggedHours.objects.bulk_create(batch)
+                batch = []
+        LoggedHours.objects.bulk_create(batch)
+        self.stdout.write(f'Generated {rows} LoggedHours rows.')
+
+    def analyze(self):
+        if connection.vendor in ('postgresql', 'sqlite'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    #the access paths of the entry lists and exports (the reports read the daily rollup)
+    def get_queries(self):
+        entry = LoggedHours.objects.order_by('-id').first()
+        if entry is None:
+            return {}
+        month_ago = timezone.now().date() - timezone.timedelta(days=30)
+        return {
+            'employee hours (ListAllHoursView, EmployeeDetailView)':
+                LoggedHours.objects.filter(employee_id=entry.employee_id, date__gte=month_ago).order_by('sales_channel'),
+            'department entries (ViewEmployeesHoursView, manager scope)':
+                LoggedHours.objects.filter(department_id=entry.department_id, date__gte=month_ago).order_by('employee'),
+            'all entries (ViewEmployeesHoursView, director scope)':
+                LoggedHours.objects.filter(date__gte=month_ago).order_by('employee'),
+        }
+
+    def run_queries(self, repeat):
+        for name, queryset in self.get_queries().items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(self.style.SQL_KEYWORD(name))
+            self.stdout.write(queryset.explain())
+            self.stdout.write(f'best {min(timings):.2f} ms, average {sum(timings) / len(timings):.2f} ms\n')
@@ -0,0 +1,219 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from timetracking_app.benchmarks import check_benchmark_database
+from timetracking_app.models import LoggedHours, Person
+from timetracking_app.synthetic import OrganizationGenerator
+from timetracking_app.urls import urlpatterns
+
+#organization sizes of the --sizes option
+DATASET_SIZES = {
+    'small': {'departments': 3, 'channels': 5, 'employees': 20, 'years': 1},
+    'medium': {'departments': 10, 'channels': 20, 'employees': 200, 'years': 2},
+    'large': {'departments': 20, 'channels': 40, 'employees': 1000, 'years': 3},
+}
+#extra query strings benchmarked besides the plain GET of every view
+VIEW_PARAMS = {
+    'list-all-hours': [{'filter_type': 'monthly'}],
+    'hours-per-channel': [{'filter_type': 'yearly'}],
+    'department-hours': [{'filter_type': 'yearly'}],
+    'employees-hours': [{'filter_type': 'monthly'}, {'pagination': 'cursor'}],
+    'chart-hours-trend': [{'bucket': 'week', 'split': 'channel'}],
+    'search-employee': [{'q': 'anna'}],
+    'employee-autocomplete': [{'q': 'ko'}],
+    'employee-detail': [{'filter_type': 'yearly'}],
+}
+#a wall time or query count increase above this share is reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.2
+#cache of the benchmarked requests, private to the command
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'benchmark_views'}}
+
+
+class Command(BaseCommand):
+    help = ('Time every view of timetracking_app.urls on generated organizations of the given sizes and write the '
+            'query counts, wall times and peak memory as JSON. The generated data is rolled back; runs on a test '
+            'database or a copy (BENCHMARK_DATABASE=1) only.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='small,medium',
+                            help=f'Comma separated dataset sizes: {", ".join(DATASET_SIZES)}')
+        parser.add_argument('--repeat', type=int, default=5, help='Warm (cached) requests timed per view')
+        parser.add_argument('--output', default='benchmark_results.json', help='Path of the JSON results')
+        parser.add_argument('--use-existing', action='store_true',
+                            help='Benchmark the existing data once instead of generating organizations')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when --compare finds a regression')
+
+    def handle(self, *args, **options):
+        sizes = ['existing'] if options['use_existing'] else options['sizes'].split(',')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+        unknown = set(sizes) - set(DATASET_SIZES) - {'existing'}
+        if unknown:
+            raise CommandError(f'Unknown dataset sizes: {", ".join(sorted(unknown))}')
+        check_benchmark_database()
+
+        results = {
+            'commit': get_commit(),
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'repeat': options['repeat'],
+        }
+        #the requests clear the cache and cache reports of rolled back data - keep them away from the shared cache
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            results['datasets'] = [self.benchmark_dataset(size, options['repeat']) for size in sizes]
+        with open(options['output'], 'w') as file:
+            json.dump(results, file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}.'))
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                regressions = self.compare(json.load(file), results)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} regressions found.')
+
+    #generate the organization, benchmark it and roll it back, so the database is left as it was
+    def benchmark_dataset(self, size, repeat):
+        with transaction.atomic():
+            generated = {}
+            if size != 'existing':
+                start = time.perf_counter()
+                generated = OrganizationGenerator(**DATASET_SIZES[size], prefix=f'benchmark_{size}').generate()
+                self.stdout.write(f'{size}: generated in {time.perf_counter() - start:.1f}s')
+            employee = generated['employees'][-1] if generated else Person.objects.order_by('-pk').first()
+            if employee is None:
+                raise CommandError('The database has no employees to benchmark, generate a dataset with --sizes.')
+            user = self.create_director()
+            entry = LoggedHours.objects.filter(employee=employee).order_by('-pk').first()
+            dataset = {
+                'size': size,
+                'parameters': DATASET_SIZES.get(size, {}),
+                'employees': Person.objects.count(),
+                'entries': LoggedHours.objects.count(),
+                'views': [],
+            }
+            url_kwargs = {
+                'delete-hours': {'pk': getattr(entry, 'pk', 0)},
+                'edit-hours': {'pk': getattr(entry, 'pk', 0)},
+                'edit-employee': {'pk': employee.pk},
+                'deactivate-employee': {'pk': employee.pk},
+                'employee-detail': {'pk': employee.pk},
+                'password_reset_confirm': {'uidb64': 'MQ', 'token': 'set-password'},
+            }
+            #ALLOWED_HOSTS may not contain the host of the test client
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for pattern in urlpatterns:
+                    path = reverse(pattern.name, kwargs=url_kwargs.get(pattern.name))
+                    for params in [{}] + VIEW_PARAMS.get(pattern.name, []):
+                        result = self.benchmark_view(user, path, params, repeat)
+                        result['name'] = pattern.name
+                        dataset['views'].append(result)
+                        self.stdout.write(f'{size:>8} {pattern.name:<28} {result["query"]:<28} '
+                                          f'{result["queries"]:>4} queries {result["cold_ms"]:>9.1f} ms cold '
+                                          f'{result["warm_ms"]:>9.1f} ms warm {result["peak_memory_kb"]:>9.0f} KiB')
+            transaction.set_rollback(True)
+        return dataset
+
+    #the benchmark user sees all data, like a director
+    def create_director(self):
+        user = Person.objects.create_superuser(username='benchmark_director', email='benchmark_director@example.com',
+                                               password=None)
+        user.groups.add(Group.objects.get_or_create(name='director_user')[0])
+        return user
+
+    #Cold request (empty cache) with the query count, warm requests for the wall time, and one more cold request
+    #under tracemalloc for the peak memory - it slows the code down, so it is not timed.
+    def benchmark_view(self, user, path, params, repeat):
+        client = Client()
+
+        def get():
+            start = time.perf_counter()
+            response = client.get(path, params)
+            #streamed responses are produced while they are read - consumed without keeping them in memory
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            return response, (time.perf_counter() - start) * 1000
+
+        #the logout view ends the session, so the client logs in again before every request
+        cache.clear()
+        client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response, cold_ms = get()
+        #the next requests reset the query log
+        query_count = len(queries)
+        warm = []
+        for _ in range(repeat):
+            client.force_login(user)
+            warm.append(get()[1])
+
+        cache.clear()
+        client.force_login(user)
+        tracemalloc.start()
+        try:
+            get()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'path': path,
+            'query': '&'.join(f'{key}={value}' for key, value in params.items()),
+            'status': response.status_code,
+            'queries': query_count,
+            'cold_ms': round(cold_ms, 2),
+            'warm_ms': round(statistics.median(warm), 2),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    #print the views that got slower or run more queries than in the earlier results
+    def compare(self, previous, current):
+        def index(results):
+            return {(dataset['size'], view['name'], view['query']): view
+                    for dataset in results['datasets'] for view in dataset['views']}
+
+        before = index(previous)
+        regressions = 0
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Compared with {previous.get("commit") or "earlier run"}'))
+        for key, view in index(current).items():
+            old = before.get(key)
+            if old is None:
+                continue
+            changes = []
+            if view['queries'] > old['queries']:
+                changes.append(f'queries {old["queries"]} -> {view["queries"]}')
+            for metric in ('cold_ms', 'warm_ms'):
+                if old.get(metric) and view.get(metric) and view[metric] > old[metric] * (1 + REGRESSION_THRESHOLD):
+                    changes.append(f'{metric} {old[metric]} -> {view[metric]}')
+            if changes:
+                regressions += 1
+                self.stdout.write(self.style.WARNING(f'{" ".join(filter(None, key))}: {", ".join(changes)}'))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions.'))
+        return regressions
+
+
+#commit of the benchmarked code, None outside a git checkout
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timetracking_app.synthetic import OrganizationGenerator
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic organization - departments, sales channels, employees and their daily hours '
+            'of the last years - with bulk inserts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--departments', type=int, default=5)
+        parser.add_argument('--channels', type=int, default=10)
+        parser.add_argument('--employees', type=int, default=100)
+        parser.add_argument('--years', type=int, default=1, help='Years of daily entries, up to today')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed generates the same organization')
+        parser.add_argument('--prefix', default='synthetic',
+                            help='Prefix of the generated names, usernames and emails - must not be used yet')
+
+    def handle(self, *args, **options):
+        generator = OrganizationGenerator(departments=options['departments'], channels=options['channels'],
+                                          employees=options['employees'], years=options['years'],
+                                          seed=options['seed'], prefix=options['prefix'])
+        start = time.perf_counter()
+        try:
+            organization = generator.generate()
+        except Exception as error:
+            raise CommandError(f'Generation failed (is the prefix "{options["prefix"]}" already used?): {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(organization["departments"])} departments, {len(organization["sales_channels"])} '
+            f'sales channels, {len(organization["employees"])} employees and {generator.entries} entries '
+            f'in {time.perf_counter() - start:.2f}s.'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timetracking_app.imports import LoggedHoursImporter, IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Import logged hours from a CSV file with the columns Date, Email, Department, Sales channel, Hours'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the CSV file')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--max-age-days', type=int, default=None,
+                            help='Reject dates older than this many days (default: accept any past date)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as file:
+                importer = LoggedHoursImporter(batch_size=options['batch_size'], max_age_days=options['max_age_days'])
+                importer.import_file(file)
+        except OSError as error:
+            raise CommandError(f'Cannot read {options["path"]}: {error}')
+        duration = time.perf_counter() - start
+
+        for line_number, message in importer.errors:
+            self.stderr.write(f'line {line_number}: {message}')
+        rate = importer.created / duration if duration else importer.created
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.created} rows in {duration:.2f}s ({rate:.0f} rows/s), {len(importer.errors)} rejected.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from timetracking_app.models import Person
+from timetracking_app.roster import RosterDeactivator, deactivate_employees
+
+
+class Command(BaseCommand):
+    help = 'Deactivate employees listed in a CSV roster with an Email column, or given with --email'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Path of the CSV file')
+        parser.add_argument('--email', action='append', default=[], help='Email of an employee (can be repeated)')
+        parser.add_argument('--department', help='Deactivate everyone in this department')
+
+    def handle(self, *args, **options):
+        if not (options['path'] or options['email'] or options['department']):
+            raise CommandError('Give a roster file, --email or --department.')
+
+        deactivated = 0
+        if options['path']:
+            try:
+                with open(options['path'], newline='', encoding='utf-8-sig') as file:
+                    deactivator = RosterDeactivator().import_file(file)
+            except OSError as error:
+                raise CommandError(f'Cannot read {options["path"]}: {error}')
+            for line_number, message in deactivator.errors:
+                self.stderr.write(f'line {line_number}: {message}')
+            deactivated += deactivator.deactivated
+        if options['email']:
+            deactivated += deactivate_employees(Person.objects.filter(email__in=options['email']))
+        if options['department']:
+            deactivated += deactivate_employees(
+                Person.objects.filter(department__department_name=options['department']))
+        self.stdout.write(self.style.SUCCESS(f'Deactivated {deactivated} employees.'))
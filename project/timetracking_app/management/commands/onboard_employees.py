@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timetracking_app.roster import RosterImporter, ROSTER_COLUMNS
+
+
+class Command(BaseCommand):
+    help = f'Create employees from a CSV roster with the columns {", ".join(ROSTER_COLUMNS)}'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the CSV file')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes hashing the passwords (default: number of CPUs, at most 8)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as file:
+                importer = RosterImporter(workers=options['workers']).import_file(file)
+        except OSError as error:
+            raise CommandError(f'Cannot read {options["path"]}: {error}')
+        duration = time.perf_counter() - start
+
+        for line_number, message in importer.errors:
+            self.stderr.write(f'line {line_number}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {importer.created} employees in {duration:.2f}s, {len(importer.errors)} rows rejected.'))
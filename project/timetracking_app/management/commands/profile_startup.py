@@ -0,0 +1,98 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+#Run in a new interpreter: import the WSGI application, optionally warm it up, and time two requests served by it
+#the way gunicorn calls it.
+#The timings are printed as JSON, the import times go to stderr (-X importtime).
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+timings = {'import_ms': (time.perf_counter() - start) * 1000}
+if sys.argv[2] == 'warmup':
+    from timetracking_app.warmup import warm_up
+    start = time.perf_counter()
+    warm_up()
+    timings['warmup_ms'] = (time.perf_counter() - start) * 1000
+from wsgiref.util import setup_testing_defaults
+for request in ('first_request_ms', 'second_request_ms'):
+    environ = {'PATH_INFO': sys.argv[1]}
+    setup_testing_defaults(environ)
+    start = time.perf_counter()
+    response = application(environ, lambda status, headers, exc_info=None: None)
+    b''.join(response)
+    response.close()
+    timings[request] = (time.perf_counter() - start) * 1000
+print(json.dumps(timings))
+'''
+#"import time: self [us] | cumulative | imported package", nested imports are indented
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+#(module, self ms, cumulative ms, nesting depth) of every imported module
+def parse_import_times(output):
+    imports = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append({'module': module, 'self_ms': int(self_us) / 1000,
+                            'cumulative_ms': int(cumulative_us) / 1000, 'depth': (len(indent) - 1) // 2})
+    return imports
+
+
+class Command(BaseCommand):
+    help = ('Measure the start of a web worker in new interpreters: import time of the WSGI application, '
+            'the slowest imports, the warm-up and the first requests')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/login/', help='Path of the timed requests')
+        parser.add_argument('--repeat', type=int, default=3, help='Interpreters started, the median is reported')
+        parser.add_argument('--limit', type=int, default=15, help='Slowest imports listed')
+        parser.add_argument('--no-warmup', action='store_true', help='Time the requests of a cold worker')
+        parser.add_argument('--output', help='Path of the JSON report')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+        mode = 'cold' if options['no_warmup'] else 'warmup'
+        runs = [self.run_interpreter(options['path'], mode) for _ in range(options['repeat'])]
+        timings = {name: round(statistics.median(run[0][name] for run in runs), 1) for name in runs[0][0]}
+        #the import times of one interpreter - they vary less than the total
+        imports = runs[-1][1]
+        report = {
+            'timings': timings,
+            'imports': len(imports),
+            'slowest_imports': sorted(imports, key=lambda item: item['cumulative_ms'], reverse=True)
+            [:options['limit']],
+            'slowest_modules': sorted(imports, key=lambda item: item['self_ms'], reverse=True)[:options['limit']],
+        }
+
+        self.stdout.write(' '.join(f'{name}={value}' for name, value in timings.items()))
+        self.stdout.write(self.style.MIGRATE_HEADING('Slowest imports (including the modules they import)'))
+        for item in report['slowest_imports']:
+            self.stdout.write(f'{item["cumulative_ms"]:>9.1f} ms  {"  " * item["depth"]}{item["module"]}')
+        self.stdout.write(self.style.MIGRATE_HEADING('Slowest modules (own time)'))
+        for item in report['slowest_modules']:
+            self.stdout.write(f'{item["self_ms"]:>9.1f} ms  {item["module"]}')
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}.'))
+
+    def run_interpreter(self, path, mode):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'project.settings')}
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT, path, mode],
+                                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'The interpreter failed:\n{result.stderr[-2000:]}')
+        #the last line, the application may log to stdout too
+        return json.loads(result.stdout.strip().splitlines()[-1]), parse_import_times(result.stderr)
@@ -0,0 +1,68 @@
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from timetracking_app.models import LoggedHours, ArchivedLoggedHours, DailyLoggedHours
+
+#smaller differences of the hours are float rounding, not missing entries
+HOURS_TOLERANCE = 1e-6
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily logged hours rollup from LoggedHours and the archive, or verify it with --verify'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Compare the rollup with LoggedHours without changing it')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild(options['batch_size'])
+
+    #sum the raw entries per day, employee, sales channel and department - the logged and the archived ones
+    def get_expected_rows(self):
+        expected = {}
+        for model in (LoggedHours, ArchivedLoggedHours):
+            rows = (model.objects.order_by()
+                    .values('date', 'employee_id', 'sales_channel_id', 'department_id')
+                    .annotate(total_hours=Sum('hour'), total_entries=Count('id')))
+            for row in rows.iterator():
+                key = (row['date'], row['employee_id'], row['sales_channel_id'], row['department_id'])
+                hours, count = expected.get(key, (0, 0))
+                expected[key] = (hours + row['total_hours'], count + row['total_entries'])
+        for key, (hours, count) in expected.items():
+            yield key, hours, count
+
+    def rebuild(self, batch_size):
+        with transaction.atomic():
+            DailyLoggedHours.objects.all().delete()
+            rollups = [DailyLoggedHours(date=date, employee_id=employee_id, sales_channel_id=sales_channel_id,
+                                        department_id=department_id, hour=hours, entries_count=count)
+                       for (date, employee_id, sales_channel_id, department_id), hours, count
+                       in self.get_expected_rows()]
+            DailyLoggedHours.objects.bulk_create(rollups, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(rollups)} daily rollup rows.'))
+
+    def verify(self):
+        expected = {key: (hours, count) for key, hours, count in self.get_expected_rows()}
+        actual = {(row.date, row.employee_id, row.sales_channel_id, row.department_id): (row.hour, row.entries_count)
+                  for row in DailyLoggedHours.objects.all().iterator()}
+
+        mismatches = [key for key in expected.keys() | actual.keys()
+                      if not self.rows_match(expected.get(key), actual.get(key))]
+        for key in mismatches[:20]:
+            self.stdout.write(f'{key}: expected {expected.get(key)}, found {actual.get(key)}')
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} daily rollup rows differ from LoggedHours.')
+        self.stdout.write(self.style.SUCCESS(f'Daily rollup matches LoggedHours ({len(actual)} rows).'))
+
+    #the rollup adds and subtracts the hours entry by entry, so its float sums differ from SUM() in the last digits
+    @staticmethod
+    def rows_match(expected, actual):
+        if expected is None or actual is None:
+            return expected == actual
+        return expected[1] == actual[1] and math.isclose(expected[0], actual[0], abs_tol=HOURS_TOLERANCE)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from timetracking_app.models import Person, PersonSearchToken
+from timetracking_app.search import index_people
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the employee search index (PersonSearchToken) from Person'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        indexed = 0
+        with transaction.atomic():
+            PersonSearchToken.objects.all().delete()
+            batch = []
+            for person in Person.objects.order_by('id').iterator(chunk_size=batch_size):
+                batch.append(person)
+                if len(batch) == batch_size:
+                    index_people(batch)
+                    indexed += len(batch)
+                    batch = []
+            index_people(batch)
+            indexed += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} people ({PersonSearchToken.objects.count()} tokens).'))
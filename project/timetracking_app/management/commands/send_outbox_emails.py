@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from timetracking_app.outbox import send_outbox, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS
+
+
+class Command(BaseCommand):
+    help = 'Deliver the queued outbox emails in batches over one mail connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=OUTBOX_MAX_ATTEMPTS,
+                            help='Give up on an email after this many failed attempts')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait between polls of an empty outbox')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_outbox(batch_size=options['batch_size'], max_attempts=options['max_attempts'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed.')
+            #a full batch means there may be more due emails - drain them before waiting
+            if sent + failed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Done: {total_sent} emails sent, {total_failed} failed.'))
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+#sum the existing entries into the rollup (same rows as the rebuild_daily_hours command)
+def fill_daily_logged_hours(apps, schema_editor):
+    LoggedHours = apps.get_model('timetracking_app', 'LoggedHours')
+    DailyLoggedHours = apps.get_model('timetracking_app', 'DailyLoggedHours')
+    rows = (LoggedHours.objects.order_by()
+            .values('date', 'employee_id', 'sales_channel_id', 'department_id')
+            .annotate(total_hours=Sum('hour'), total_entries=Count('id')))
+    rollups = []
+    for row in rows.iterator():
+        rollups.append(DailyLoggedHours(date=row['date'], employee_id=row['employee_id'],
+                                        sales_channel_id=row['sales_channel_id'],
+                                        department_id=row['department_id'], hour=row['total_hours'] or 0,
+                                        entries_count=row['total_entries']))
+        if len(rollups) >= 5000:
+            DailyLoggedHours.objects.bulk_create(rollups)
+            rollups = []
+    DailyLoggedHours.objects.bulk_create(rollups)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetracking_app', '0010_alter_person_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLoggedHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(null=True)),
+                ('hour', models.FloatField(default=0)),
+                ('entries_count', models.PositiveIntegerField(default=0)),
+                ('department', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='timetracking_app.department')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('sales_channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='timetracking_app.saleschannel')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyloggedhours',
+            constraint=models.UniqueConstraint(fields=('date', 'employee', 'sales_channel', 'department'), name='unique_daily_logged_hours'),
+        ),
+        migrations.RunPython(fill_daily_logged_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetracking_app', '0011_dailyloggedhours'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loggedhours',
+            index=models.Index(fields=['employee', 'date'], name='loggedhours_employee_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loggedhours',
+            index=models.Index(fields=['department', 'date', 'sales_channel', 'hour'], name='loggedhours_dept_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loggedhours',
+            index=models.Index(fields=['date', 'sales_channel', 'hour'], name='loggedhours_date_channel_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+#index the existing people (same tokens as timetracking_app.search.index_people)
+def index_existing_people(apps, schema_editor):
+    from timetracking_app.search import tokenize
+
+    Person = apps.get_model('timetracking_app', 'Person')
+    PersonSearchToken = apps.get_model('timetracking_app', 'PersonSearchToken')
+    tokens = []
+    for person in Person.objects.select_related('department').iterator(chunk_size=2000):
+        department_name = person.department.department_name if person.department_id else None
+        values = {'first_name': person.first_name, 'last_name': person.last_name, 'email': person.email,
+                  'username': person.username, 'department': department_name}
+        tokens.extend(PersonSearchToken(person_id=person.pk, field=field, token=token)
+                      for field, text in values.items() for token in set(tokenize(text)))
+        if len(tokens) >= 5000:
+            PersonSearchToken.objects.bulk_create(tokens)
+            tokens = []
+    PersonSearchToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetracking_app', '0013_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('first_name', 'First name'), ('last_name', 'Last name'), ('email', 'Email'), ('username', 'Username'), ('department', 'Department')], max_length=16)),
+                ('token', models.CharField(max_length=64)),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'person'], name='personsearchtoken_token_idx')],
+            },
+        ),
+        migrations.RunPython(index_existing_people, migrations.RunPython.noop),
+    ]
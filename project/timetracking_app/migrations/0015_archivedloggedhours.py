@@ -0,0 +1,29 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetracking_app', '0014_personsearchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLoggedHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(null=True)),
+                ('hour', models.FloatField()),
+                ('department', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='timetracking_app.department')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('sales_channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='timetracking_app.saleschannel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['employee', 'date'], name='archived_employee_date_idx'), models.Index(fields=['department', 'date'], name='archived_dept_date_idx'), models.Index(fields=['date'], name='archived_date_idx')],
+            },
+        ),
+    ]
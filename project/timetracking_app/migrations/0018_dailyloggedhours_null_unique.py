@@ -0,0 +1,41 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:16
+
+import datetime
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+#merge the rows the old constraint let through - the same day, employee and channel without a department or date
+def merge_duplicate_rows(apps, schema_editor):
+    DailyLoggedHours = apps.get_model('timetracking_app', 'DailyLoggedHours')
+    duplicates = (DailyLoggedHours.objects.order_by()
+                  .values('date', 'employee_id', 'sales_channel_id', 'department_id')
+                  .annotate(rows=Count('id'), first_id=Min('id'), total_hours=Sum('hour'),
+                            total_entries=Sum('entries_count'))
+                  .filter(rows__gt=1))
+    for row in duplicates:
+        group = DailyLoggedHours.objects.filter(date=row['date'], employee_id=row['employee_id'],
+                                                sales_channel_id=row['sales_channel_id'],
+                                                department_id=row['department_id'])
+        group.filter(id=row['first_id']).update(hour=row['total_hours'], entries_count=row['total_entries'])
+        group.exclude(id=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetracking_app', '0017_slowquery'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='dailyloggedhours',
+            name='unique_daily_logged_hours',
+        ),
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailyloggedhours',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('date', models.Value(datetime.date(1, 1, 1))), models.F('employee'), models.F('sales_channel'), django.db.models.functions.comparison.Coalesce('department', models.Value(0)), name='unique_daily_logged_hours'),
+        ),
+    ]
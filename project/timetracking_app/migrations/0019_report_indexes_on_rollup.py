@@ -0,0 +1,41 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetracking_app', '0018_dailyloggedhours_null_unique'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='loggedhours',
+            name='loggedhours_dept_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='loggedhours',
+            name='loggedhours_date_channel_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dailyloggedhours',
+            index=models.Index(fields=['date', 'sales_channel'], name='daily_date_channel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyloggedhours',
+            index=models.Index(fields=['department', 'date'], name='daily_dept_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyloggedhours',
+            index=models.Index(fields=['employee', 'date'], name='daily_employee_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loggedhours',
+            index=models.Index(fields=['department', 'date'], name='loggedhours_dept_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loggedhours',
+            index=models.Index(fields=['date'], name='loggedhours_date_idx'),
+        ),
+    ]
@@ -2,7 +2,11 @@ from datetime import datetime
 
 from django.contrib.auth.models import User, AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .report_cache import bump_reports_version
 
 # Create your models here.
 
@@ -42,5 +46,257 @@ class LoggedHours(models.Model):
     sales_channel = models.ForeignKey(SalesChannel, on_delete=models.CASCADE)
     department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True)
 
+    class Meta:
+        indexes = [
+            #own hours and employee details: employee + date range
+            models.Index(fields=['employee', 'date'], name='loggedhours_employee_date_idx'),
+            #entry lists and exports of managers: department + date range (the reports read DailyLoggedHours)
+            models.Index(fields=['department', 'date'], name='loggedhours_dept_date_idx'),
+            #entry lists and exports of directors: date range only
+            models.Index(fields=['date'], name='loggedhours_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.date}, {self.hour}, {self.employee}, {self.sales_channel}'
+
+    #keep the daily rollup in step with every saved entry (views, admin and shell)
+    #and invalidate the cached reports once the change is committed
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = LoggedHours.objects.filter(pk=self.pk).first() if self.pk else None
+            super().save(*args, **kwargs)
+            if previous is not None:
+                DailyLoggedHours.remove_entries([previous])
+            DailyLoggedHours.add_entries([self])
+            transaction.on_commit(bump_reports_version)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            DailyLoggedHours.remove_entries([self])
+            transaction.on_commit(bump_reports_version)
+            return super().delete(*args, **kwargs)
+
+    #insert many entries at once - bulk_create bypasses save(), so the rollup and the report cache are updated here
+    @classmethod
+    def bulk_log(cls, entries, batch_size=None):
+        with transaction.atomic():
+            cls.objects.bulk_create(entries, batch_size=batch_size)
+            DailyLoggedHours.add_entries(entries)
+            transaction.on_commit(bump_reports_version)
+        return entries
+
+
+#Hours summed per day, employee, department and sales channel.
+#Maintained by LoggedHours.save/delete, rebuilt with the rebuild_daily_hours command.
+class DailyLoggedHours(models.Model):
+    date = models.DateField(null=True)
+    employee = models.ForeignKey(Person, on_delete=models.CASCADE)
+    sales_channel = models.ForeignKey(SalesChannel, on_delete=models.CASCADE)
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True)
+    #named like LoggedHours.hour, so the same aggregations work on both tables
+    hour = models.FloatField(default=0)
+    entries_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            #director reports and trends: date range, grouped by channel
+            models.Index(fields=['date', 'sales_channel'], name='daily_date_channel_idx'),
+            #manager reports: department + date range
+            models.Index(fields=['department', 'date'], name='daily_dept_date_idx'),
+            #employee details: employee + date range
+            models.Index(fields=['employee', 'date'], name='daily_employee_date_idx'),
+        ]
+        constraints = [
+            #NULL dates and departments are coalesced, so they are not distinct from each other like in a plain
+            #unique constraint
+            models.UniqueConstraint(Coalesce('date', models.Value(datetime.min.date())), 'employee', 'sales_channel',
+                                    Coalesce('department', models.Value(0)), name='unique_daily_logged_hours'),
+        ]
+
+    def __str__(self):
+        return f'{self.date}, {self.hour}, {self.employee}, {self.sales_channel}'
+
+    #add the given LoggedHours entries to the rollup (also used after bulk_create)
+    @classmethod
+    def add_entries(cls, entries):
+        cls._apply(entries, 1)
+
+    #subtract the given LoggedHours entries from the rollup (used before deleting them)
+    @classmethod
+    def remove_entries(cls, entries):
+        cls._apply(entries, -1)
+
+    @classmethod
+    def _apply(cls, entries, sign):
+        changes = {}
+        for entry in entries:
+            key = (entry.date, entry.employee_id, entry.sales_channel_id, entry.department_id)
+            hours, count = changes.get(key, (0, 0))
+            changes[key] = (hours + entry.hour, count + 1)
+        if not changes:
+            return
+
+        with transaction.atomic():
+            existing = cls._lock_rows(changes)
+            missing = [key for key in changes if key not in existing]
+            try:
+                #savepoint - the insert fails if another transaction created one of the rows meanwhile
+                with transaction.atomic():
+                    cls.objects.bulk_create([cls(date=key[0], employee_id=key[1], sales_channel_id=key[2],
+                                                 department_id=key[3], hour=sign * changes[key][0],
+                                                 entries_count=sign * changes[key][1])
+                                             for key in missing if sign * changes[key][1] > 0], batch_size=1000)
+                changes = {key: value for key, value in changes.items() if key in existing}
+            except IntegrityError:
+                #empty rows for the keys still missing, then the changes are added to the locked rows
+                cls.objects.bulk_create([cls(date=date, employee_id=employee_id, sales_channel_id=sales_channel_id,
+                                             department_id=department_id)
+                                         for date, employee_id, sales_channel_id, department_id in missing],
+                                        batch_size=1000, ignore_conflicts=True)
+                existing = cls._lock_rows(changes)
+
+            #the rows are updated in place, so a transaction waiting for their locks reads the new sums
+            to_update, to_delete = [], []
+            for key, (hours, count) in changes.items():
+                rollup = existing[key]
+                rollup.hour += sign * hours
+                rollup.entries_count += sign * count
+                if rollup.entries_count > 0:
+                    to_update.append(rollup)
+                else:
+                    to_delete.append(rollup.pk)
+            cls.objects.bulk_update(to_update, ['hour', 'entries_count'], batch_size=1000)
+            if to_delete:
+                cls.objects.filter(pk__in=to_delete).delete()
+
+    #lock and return the rollup rows the changes may touch, fetched in one query
+    @classmethod
+    def _lock_rows(cls, changes):
+        dates = {key[0] for key in changes}
+        date_filter = models.Q(date__in=dates - {None})
+        if None in dates:
+            date_filter |= models.Q(date__isnull=True)
+        candidates = cls.objects.select_for_update().filter(
+            date_filter,
+            employee_id__in={key[1] for key in changes},
+            sales_channel_id__in={key[2] for key in changes})
+        return {(rollup.date, rollup.employee_id, rollup.sales_channel_id, rollup.department_id): rollup
+                for rollup in candidates}
+
+
+#Entries moved out of LoggedHours by the archive_logged_hours command, keeping their ids.
+#The columns match LoggedHours, so both tables can be read as one (archive.route_date_range). Their hours stay in the
+#daily rollup, so the reports and totals do not change when entries are archived.
+class ArchivedLoggedHours(models.Model):
+    date = models.DateField(null=True)
+    hour = models.FloatField()
+    employee = models.ForeignKey(Person, on_delete=models.CASCADE)
+    sales_channel = models.ForeignKey(SalesChannel, on_delete=models.CASCADE)
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True)
+
+    class Meta:
+        indexes = [
+            #the date range lookups of LoggedHours, for ranges that reach into archived years
+            models.Index(fields=['employee', 'date'], name='archived_employee_date_idx'),
+            models.Index(fields=['department', 'date'], name='archived_dept_date_idx'),
+            models.Index(fields=['date'], name='archived_date_idx'),
+        ]
+
     def __str__(self):
         return f'{self.date}, {self.hour}, {self.employee}, {self.sales_channel}'
+
+
+#Normalized (lowercase, accent-folded) words of the names, email and department of a person.
+#Maintained on Person and Department save, rebuilt with the rebuild_search_index command. Used by the employee search.
+class PersonSearchToken(models.Model):
+    FIRST_NAME = 'first_name'
+    LAST_NAME = 'last_name'
+    EMAIL = 'email'
+    USERNAME = 'username'
+    DEPARTMENT = 'department'
+    FIELD_CHOICES = [(FIRST_NAME, 'First name'), (LAST_NAME, 'Last name'), (EMAIL, 'Email'), (USERNAME, 'Username'),
+                     (DEPARTMENT, 'Department')]
+
+    person = models.ForeignKey(Person, related_name='search_tokens', on_delete=models.CASCADE)
+    field = models.CharField(max_length=16, choices=FIELD_CHOICES)
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            #prefix lookups read a range of this index, the person id comes from the index too
+            models.Index(fields=['token', 'person'], name='personsearchtoken_token_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.token}, {self.field}, {self.person_id}'
+
+
+#Transactional email waiting for delivery. Requests only enqueue, the send_outbox_emails worker delivers in batches.
+class OutboxEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            #the worker picks the due pending emails
+            models.Index(fields=['status', 'next_attempt_at'], name='outboxemail_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject}, {", ".join(self.to)}, {self.status}'
+
+
+#cProfile (and optionally tracemalloc) results of one request of a staff user - see profiling.ProfilingMiddleware.
+#stats holds the marshalled stats, the content of a .prof file readable with pstats or snakeviz.
+class RequestProfile(models.Model):
+    request_id = models.UUIDField(unique=True)
+    path = models.CharField(max_length=255)
+    method = models.CharField(max_length=8)
+    view_name = models.CharField(max_length=100, blank=True)
+    user = models.ForeignKey(Person, null=True, on_delete=models.SET_NULL)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    stats = models.BinaryField()
+    top_functions = models.JSONField(default=list)
+    top_allocations = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.method} {self.path}, {self.duration_ms} ms, {self.created_at}'
+
+
+#Queries slower than settings.SLOW_QUERY_THRESHOLD_MS, one row per fingerprint (the SQL without its values).
+#Recorded by the request metrics middleware, see slow_queries.record_slow_queries.
+class SlowQuery(models.Model):
+    fingerprint = models.CharField(max_length=32, unique=True)
+    sql = models.TextField()
+    #parameter types of the first execution, never the values
+    param_shape = models.JSONField(default=list)
+    database = models.CharField(max_length=64, default='default')
+    views = models.JSONField(default=list)
+    explain = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return f'{self.sql[:80]}, {self.count}x, max {self.max_ms:.0f} ms'
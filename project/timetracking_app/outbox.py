@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+#first retry after a minute, then doubling up to an hour
+OUTBOX_RETRY_DELAY = 60
+OUTBOX_MAX_RETRY_DELAY = 3600
+#claimed emails are hidden from other workers for this long - if a worker dies they are picked up again
+OUTBOX_LEASE = 300
+
+
+#Queue an email for the delivery worker - a single insert, no network in the request.
+def enqueue_email(subject, body, recipients, from_email=None, html_body=''):
+    return OutboxEmail.objects.create(subject=subject, body=body, html_body=html_body or '',
+                                      from_email=from_email or settings.DEFAULT_FROM_EMAIL or '',
+                                      to=list(recipients))
+
+
+#Lease a batch of due emails. skip_locked lets several workers drain the outbox without sending twice.
+def claim_due_emails(batch_size=OUTBOX_BATCH_SIZE):
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(OutboxEmail.objects.select_for_update(skip_locked=True)
+                      .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+                      .order_by('next_attempt_at', 'id')[:batch_size])
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            next_attempt_at=now + timezone.timedelta(seconds=OUTBOX_LEASE))
+    return emails
+
+
+def get_retry_delay(attempts):
+    return min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_DELAY)
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email or None, email.to,
+                                     connection=connection)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def record_failure(email, error, max_attempts):
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= max_attempts:
+        email.status = OutboxEmail.FAILED
+    else:
+        email.next_attempt_at = timezone.now() + timezone.timedelta(seconds=get_retry_delay(email.attempts))
+
+
+#Send one batch of due emails over a single connection. Returns the number of sent and failed emails.
+#Delivery is at least once: if the worker dies between sending and saving, the batch is retried after the lease.
+def send_outbox(batch_size=OUTBOX_BATCH_SIZE, max_attempts=OUTBOX_MAX_ATTEMPTS, connection=None):
+    emails = claim_due_emails(batch_size)
+    if not emails:
+        return 0, 0
+
+    connection = connection or get_connection()
+    sent = failed = 0
+    try:
+        connection.open()
+    except Exception as error:
+        #the mail server is unreachable - the whole batch counts as one failed attempt
+        for email in emails:
+            record_failure(email, error, max_attempts)
+        failed = len(emails)
+    else:
+        try:
+            for email in emails:
+                try:
+                    build_message(email, connection).send()
+                except Exception as error:
+                    record_failure(email, error, max_attempts)
+                    failed += 1
+                else:
+                    email.attempts += 1
+                    email.status = OutboxEmail.SENT
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+                    sent += 1
+        finally:
+            connection.close()
+
+    OutboxEmail.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    return sent, failed
@@ -0,0 +1,84 @@
+import json
+
+from django.core import signing
+from django.db import connection
+from django.db.models import Q
+from django.http import Http404
+
+
+#Estimate the number of rows of a queryset from the query planner instead of running COUNT(*).
+#Falls back to an exact count on databases without a usable row estimate.
+def estimated_count(queryset):
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.count()
+
+
+#Keyset (cursor) pagination for list views, switched on with ?pagination=cursor.
+#Pages are read with "WHERE (key, id) > (last key, last id)" on the view ordering, so every page costs the same
+#and rows do not shift between pages while new hours are logged. Tokens are signed, so they are opaque to users.
+class CursorPaginationMixin:
+    cursor_salt = 'timetracking_app.cursor'
+    estimate_count = True
+
+    def is_cursor_pagination(self):
+        return self.request.GET.get('pagination') == 'cursor'
+
+    #ordering field of the view, followed by id to make it unique
+    def get_cursor_field(self):
+        ordering = self.get_ordering() or ['id']
+        field = self.model._meta.get_field(ordering[0].lstrip('-'))
+        return field.attname
+
+    def paginate_queryset(self, queryset, page_size):
+        field = self.get_cursor_field()
+        queryset = queryset.order_by(field, 'id')
+        #a range reaching into the archive is a UNION, which cannot be filtered by the cursor - use page numbers
+        if not self.is_cursor_pagination() or queryset.query.combinator:
+            return super().paginate_queryset(queryset, page_size)
+
+        cursor = self.decode_cursor(self.request.GET.get('cursor'))
+        if cursor is None:
+            direction = 'next'
+            page = queryset
+        elif cursor['direction'] == 'next':
+            direction = 'next'
+            page = queryset.filter(Q(**{f'{field}__gt': cursor['key']}) | Q(**{field: cursor['key'], 'id__gt': cursor['id']}))
+        else:
+            direction = 'previous'
+            page = (queryset.filter(Q(**{f'{field}__lt': cursor['key']}) | Q(**{field: cursor['key'], 'id__lt': cursor['id']}))
+                    .order_by(f'-{field}', '-id'))
+
+        entries = list(page[:page_size + 1])
+        has_more = len(entries) > page_size
+        entries = entries[:page_size]
+        if direction == 'previous':
+            entries.reverse()
+
+        has_next = has_more if direction == 'next' else True
+        has_previous = cursor is not None if direction == 'next' else has_more
+        self.cursor_context = {
+            'cursor_pagination': True,
+            'next_cursor': self.encode_cursor(entries[-1], field, 'next') if entries and has_next else None,
+            'previous_cursor': self.encode_cursor(entries[0], field, 'previous') if entries and has_previous else None,
+            'estimated_count': estimated_count(queryset) if self.estimate_count else None,
+        }
+        return None, None, entries, has_next or has_previous
+
+    def encode_cursor(self, entry, field, direction):
+        return signing.dumps({'key': getattr(entry, field), 'id': entry.id, 'direction': direction},
+                             salt=self.cursor_salt)
+
+    def decode_cursor(self, token):
+        if not token:
+            return None
+        try:
+            return signing.loads(token, salt=self.cursor_salt)
+        except signing.BadSignature:
+            raise Http404('Invalid page cursor.')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(getattr(self, 'cursor_context', {'cursor_pagination': False}))
+        return context
@@ -0,0 +1,82 @@
+import cProfile
+import marshal
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+
+from .models import RequestProfile
+
+#?profile=1 or the X-Profile: 1 header profiles the request, "memory" also traces the allocations
+PROFILE_PARAM = 'profile'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+PROFILE_TOP_FUNCTIONS = 30
+PROFILE_TOP_ALLOCATIONS = 20
+#older profiles are deleted when a new one is stored
+PROFILE_KEEP = 200
+
+
+#'cpu', 'memory' or None - the user is checked last, so other requests do not load it
+def get_profile_mode(request):
+    if not getattr(settings, 'PROFILING_ENABLED', False):
+        return None
+    mode = request.GET.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+    mode = {'1': 'cpu', 'cpu': 'cpu', 'memory': 'memory'}.get(mode)
+    if mode is None or not request.user.is_staff:
+        return None
+    return mode
+
+
+#functions with the most own time (excluding the functions they call), from cProfile stats
+def get_top_functions(stats, limit=PROFILE_TOP_FUNCTIONS):
+    rows = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [{'function': f'{file}:{line}({name})', 'calls': calls, 'tottime_ms': round(tottime * 1000, 3),
+             'cumtime_ms': round(cumtime * 1000, 3)}
+            for (file, line, name), (primitive_calls, calls, tottime, cumtime, callers) in rows]
+
+
+def get_top_allocations(snapshot, limit=PROFILE_TOP_ALLOCATIONS):
+    return [{'location': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]]
+
+
+#Profile the requests of staff users who ask for it, when settings.PROFILING_ENABLED allows it.
+#The request runs under cProfile (and tracemalloc in the "memory" mode). The .prof data and the top lists are
+#stored as a RequestProfile, whose id is returned in the X-Profile-Id header.
+#Streamed responses are profiled until the response starts.
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = get_profile_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        if mode == 'memory':
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            response = profiler.runcall(self.get_response, request)
+        finally:
+            duration = time.perf_counter() - start
+            snapshot = tracemalloc.take_snapshot() if mode == 'memory' else None
+            if mode == 'memory':
+                tracemalloc.stop()
+
+        profiler.create_stats()
+        match = getattr(request, 'resolver_match', None)
+        profile = RequestProfile.objects.create(
+            request_id=uuid.uuid4(), path=request.get_full_path()[:255], method=request.method,
+            view_name=(match.view_name if match else '')[:100], user=request.user,
+            status_code=response.status_code, duration_ms=round(duration * 1000, 1),
+            stats=marshal.dumps(profiler.stats), top_functions=get_top_functions(profiler.stats),
+            top_allocations=get_top_allocations(snapshot) if snapshot else [])
+        old = RequestProfile.objects.order_by('-created_at').values_list('pk', flat=True)[PROFILE_KEEP:]
+        RequestProfile.objects.filter(pk__in=list(old)).delete()
+        response[PROFILE_ID_HEADER] = str(profile.request_id)
+        return response
@@ -0,0 +1,26 @@
+from django.core.cache import cache
+
+from .models import Department, SalesChannel
+
+#the sales channels and departments change rarely - the timeout only bounds a missed invalidation
+REFERENCE_CACHE_TIMEOUT = 3600
+CHANNEL_CHOICES_KEY = 'reference:channel_choices'
+DEPARTMENT_CHOICES_KEY = 'reference:department_choices'
+
+
+#(id, name) of every sales channel, read from the shared cache
+def get_channel_choices():
+    return cache.get_or_set(CHANNEL_CHOICES_KEY, lambda: list(SalesChannel.objects.values_list('id', 'channel_name')),
+                            REFERENCE_CACHE_TIMEOUT)
+
+
+#(id, name) of every department, read from the shared cache
+def get_department_choices():
+    return cache.get_or_set(DEPARTMENT_CHOICES_KEY,
+                            lambda: list(Department.objects.values_list('id', 'department_name')),
+                            REFERENCE_CACHE_TIMEOUT)
+
+
+#Drop the cached choices (a sales channel or department was saved or deleted).
+def invalidate_reference_data():
+    cache.delete_many([CHANNEL_CHOICES_KEY, DEPARTMENT_CHOICES_KEY])
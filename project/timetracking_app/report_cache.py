@@ -0,0 +1,130 @@
+import hashlib
+import time
+from abc import ABC, abstractmethod
+
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .routers import get_sticky_seconds, reading_replica
+
+REPORT_CACHE_TIMEOUT = 300
+REPORT_LOCK_TIMEOUT = 30
+REPORT_LOCK_POLL_INTERVAL = 0.05
+REPORT_VERSION_KEY = 'reports:version'
+REPORT_CHANGED_AT_KEY = 'reports:changed_at'
+
+
+#Current version of all report results - bumped after every committed LoggedHours write.
+#A missing (evicted) version starts from the current time, so it never matches the results of an older version.
+def get_reports_version():
+    return cache.get_or_set(REPORT_VERSION_KEY, time.time_ns, None)
+
+
+def bump_reports_version():
+    cache.set(REPORT_CHANGED_AT_KEY, int(time.time()), None)
+    try:
+        cache.incr(REPORT_VERSION_KEY)
+    except ValueError:
+        cache.set(REPORT_VERSION_KEY, time.time_ns(), None)
+
+
+#Time (epoch seconds) of the latest LoggedHours change - "now" if it is not known yet.
+def get_reports_changed_at():
+    return cache.get_or_set(REPORT_CHANGED_AT_KEY, int(time.time()), None)
+
+
+#Reports read from the replica within the sticky window of the latest change may miss that change - they are served,
+#but not cached under the current version (and not tagged with it), so the next request reads them again.
+def is_report_cacheable():
+    return not reading_replica() or time.time() - get_reports_changed_at() >= get_sticky_seconds()
+
+
+def get_report_key(name, key_parts):
+    digest = hashlib.md5(repr(key_parts).encode()).hexdigest()
+    return f'report:{name}:{digest}'
+
+
+#Return a cached report result, computing it with compute() on a miss.
+#Only the worker that takes the lock recomputes; the others get the previous result of the same version, or wait.
+#Results of older versions are never served, so a write is visible on the next request.
+def get_cached_report(name, key_parts, compute):
+    version = get_reports_version()
+    base_key = get_report_key(name, key_parts)
+    key = f'{base_key}:{version}'
+    latest_key = f'{base_key}:latest'
+
+    result = cache.get(key)
+    if result is not None:
+        return result
+    if not is_report_cacheable():
+        return compute()
+
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + REPORT_LOCK_TIMEOUT
+    while not cache.add(lock_key, 1, REPORT_LOCK_TIMEOUT):
+        #someone else is recomputing - serve the expired result if it is still current
+        latest = cache.get(latest_key)
+        if latest is not None and latest[0] == version:
+            return latest[1]
+        time.sleep(REPORT_LOCK_POLL_INTERVAL)
+        result = cache.get(key)
+        if result is not None:
+            return result
+        if time.monotonic() > deadline:
+            #the lock holder died or is too slow - do not wait any longer
+            return compute()
+
+    try:
+        result = compute()
+        cache.set(key, result, REPORT_CACHE_TIMEOUT)
+        cache.set(latest_key, (version, result), None)
+    finally:
+        cache.delete(lock_key)
+    return result
+
+
+#Cache the report aggregations of a ScopedViewMixin view per scope, department and date range.
+#The resolved dates are part of the key, so a preset like "current week" moves on by itself.
+class CachedReportMixin:
+
+    def get_report_cache_key(self):
+        scope = self.get_scope()
+        date_range = self.get_date_range() if hasattr(self, 'get_date_range') else (None, None)
+        return (scope.role, scope.department_id) + tuple(date_range)
+
+    def get_report(self, name, compute):
+        return get_cached_report(name, self.get_report_cache_key(), compute)
+
+    #changes whenever the report version or the report key (scope, filter, day) changes, without touching the db
+    def get_report_etag(self, name):
+        return quote_etag(f'{get_report_key(name, self.get_report_cache_key())}:{get_reports_version()}')
+
+
+#Serve the chart series of a report as JSON and answer 304 Not Modified while nothing changed for the caller.
+class ChartDataMixin(CachedReportMixin, ABC):
+    report_name = None
+    #keys of the report sent to the browser
+    chart_keys = ('labels', 'data')
+
+    #the report computed from the view queryset - a dictionary with (at least) the labels and data of the chart
+    @abstractmethod
+    def get_chart_data(self):
+        ...
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_report_etag(self.report_name)
+        last_modified = get_reports_changed_at()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            report = self.get_report(self.report_name, self.get_chart_data)
+            response = JsonResponse({key: report[key] for key in self.chart_keys})
+            if not is_report_cacheable():
+                response['Cache-Control'] = 'private, no-cache'
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        #let the browser keep the data but ask every time whether it is still current
+        response['Cache-Control'] = 'private, no-cache'
+        return response
@@ -0,0 +1,144 @@
+import math
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncQuarter
+
+TREND_BUCKETS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth, 'quarter': TruncQuarter}
+TREND_SPLITS = {'channel': 'sales_channel__channel_name', 'department': 'department__department_name'}
+#longer series are downsampled to at most this many points
+TREND_MAX_POINTS = 300
+#longest range of a trend per bucket, and how far after today it may end - every bucket of the range is built
+TREND_MAX_SPANS = {'day': timedelta(days=5 * 366), 'week': timedelta(days=20 * 366),
+                   'month': timedelta(days=100 * 366), 'quarter': timedelta(days=200 * 366)}
+TREND_MAX_FUTURE = timedelta(days=366)
+
+
+#Summarize hours per sales channel with a single grouped query.
+#Returns the table data and the chart labels/data in one dictionary.
+def hours_per_channel(queryset):
+    rows = (queryset.order_by()
+            .values('sales_channel__channel_name')
+            .annotate(total_hours=Sum('hour'))
+            .order_by('sales_channel__channel_name'))
+
+    hours_per_channel = {row['sales_channel__channel_name']: row['total_hours'] for row in rows}
+    return {
+        'hours_per_channel': hours_per_channel,
+        'labels': list(hours_per_channel.keys()),
+        'data': list(hours_per_channel.values()),
+    }
+
+
+#Build the department x sales channel matrix with a single grouped query.
+#The per department totals and the chart series are derived from the same rows.
+def hours_per_department(queryset):
+    rows = (queryset.order_by()
+            .values('department__department_name', 'sales_channel__channel_name')
+            .annotate(total_hours=Sum('hour'))
+            .order_by('department__department_name', 'sales_channel__channel_name'))
+
+    hours_per_department = {}
+    department_totals = {}
+    for row in rows:
+        department = row['department__department_name']
+        hours = row['total_hours']
+        hours_per_department.setdefault(department, {})[row['sales_channel__channel_name']] = hours
+        department_totals[department] = department_totals.get(department, 0) + hours
+
+    return {
+        'hours_per_department': hours_per_department,
+        'department_totals': department_totals,
+        'labels': list(department_totals.keys()),
+        'data': list(department_totals.values()),
+    }
+
+
+#Summarize hours per employee with a single grouped query.
+def hours_per_employee(queryset):
+    rows = (queryset.order_by()
+            .values('employee__username')
+            .annotate(total_hours=Sum('hour'))
+            .order_by('employee__username'))
+    return {row['employee__username']: row['total_hours'] for row in rows}
+
+
+#Summarize hours per calendar month with a single grouped query, oldest month first.
+#Works on LoggedHours and on the DailyLoggedHours rollup.
+def hours_per_month(queryset):
+    rows = (queryset.order_by()
+            .annotate(month=TruncMonth('date'))
+            .values('month')
+            .annotate(total_hours=Sum('hour'))
+            .order_by('month'))
+    return {row['month']: row['total_hours'] for row in rows}
+
+
+#first day of the calendar bucket (day, week starting on Monday, month, quarter) containing the date
+def get_bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    if bucket == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day
+
+
+def get_next_bucket(day, bucket):
+    if bucket == 'week':
+        return day + timedelta(days=7)
+    if bucket in ('month', 'quarter'):
+        month = day.month - 1 + (3 if bucket == 'quarter' else 1)
+        return day.replace(year=day.year + month // 12, month=month % 12 + 1, day=1)
+    return day + timedelta(days=1)
+
+
+#every bucket between the dates, also the empty ones
+def get_buckets(start, end, bucket):
+    buckets = []
+    day = get_bucket_start(start, bucket)
+    while day <= end:
+        buckets.append(day)
+        day = get_next_bucket(day, bucket)
+    return buckets
+
+
+#Merge neighbouring points, so a series has at most max_points. Hours are summed, so totals do not change;
+#a merged point is labelled with its first bucket.
+def downsample(labels, series, max_points=TREND_MAX_POINTS):
+    if len(labels) <= max_points:
+        return labels, series, 1
+    size = math.ceil(len(labels) / max_points)
+    labels = labels[::size]
+    series = {name: [sum(values[position:position + size]) for position in range(0, len(values), size)]
+              for name, values in series.items()}
+    return labels, series, size
+
+
+#Hours per calendar bucket between start and end, grouped in the database, optionally one series per sales channel
+#or department. Empty buckets are filled with 0. Works on LoggedHours and on the DailyLoggedHours rollup.
+def hours_trend(queryset, start, end, bucket='month', split=None, max_points=TREND_MAX_POINTS):
+    fields = ['period'] + ([TREND_SPLITS[split]] if split else [])
+    rows = (queryset.filter(date__gte=start, date__lte=end).order_by()
+            .annotate(period=TREND_BUCKETS[bucket]('date'))
+            .values(*fields)
+            .annotate(total_hours=Sum('hour'))
+            .order_by(*fields))
+
+    periods = get_buckets(start, end, bucket)
+    positions = {period: position for position, period in enumerate(periods)}
+    series = {}
+    for row in rows:
+        name = (row[TREND_SPLITS[split]] or 'None') if split else 'Hours'
+        series.setdefault(name, [0] * len(periods))[positions[row['period']]] += row['total_hours']
+
+    labels, series, bucket_size = downsample([period.isoformat() for period in periods], series, max_points)
+    totals = [sum(values) for values in zip(*series.values())] if series else [0] * len(labels)
+    return {
+        'bucket': bucket,
+        'bucket_size': bucket_size,
+        'labels': labels,
+        'data': totals,
+        'datasets': [{'label': name, 'data': values} for name, values in sorted(series.items())],
+    }
@@ -0,0 +1,191 @@
+import csv
+import os
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .models import Person, Department, SalesChannel
+from .scope import invalidate_all_scopes
+from .search import index_people
+
+#CSV columns of the onboarding roster - sales channels are separated with ";", an empty password is set as unusable
+ROSTER_COLUMNS = ('Username', 'First name', 'Last name', 'Email', 'Password', 'Department', 'Sales channels')
+#the offboarding roster needs the emails only
+OFFBOARDING_COLUMNS = ('Email',)
+ROSTER_BATCH_SIZE = 1000
+#below this many passwords starting the worker processes costs more than it saves
+PARALLEL_HASHING_THRESHOLD = 8
+
+
+def get_default_workers():
+    return min(os.cpu_count() or 1, 8)
+
+
+#worker processes started with "spawn" (macOS, Windows) do not inherit the configured Django
+def _init_hashing_worker():
+    django.setup()
+
+
+#Hash the passwords across a process pool - PBKDF2 is CPU bound, so threads would not help.
+#None stays None and becomes an unusable password.
+def hash_passwords(passwords, workers=None):
+    passwords = list(passwords)
+    workers = workers or get_default_workers()
+    if workers == 1 or len(passwords) < PARALLEL_HASHING_THRESHOLD:
+        return [make_password(password) for password in passwords]
+    #multiprocessing is imported on the first large roster, not when every web worker starts
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_hashing_worker) as executor:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+def read_roster(file, columns):
+    reader = csv.DictReader(file)
+    missing = [column for column in columns if column not in (reader.fieldnames or [])]
+    if missing:
+        return None, f'Missing columns: {", ".join(missing)}'
+    #line 1 is the header
+    rows = ((line_number, {column: (row[column] or '').strip() for column in columns})
+            for line_number, row in enumerate(reader, start=2))
+    return rows, None
+
+
+#Create employees from a CSV roster.
+#Rows are validated against lookup maps loaded once, the passwords are hashed in parallel and the Person rows and
+#their sales channel links are inserted with bulk_create, in one transaction.
+class RosterImporter:
+
+    def __init__(self, workers=None, batch_size=ROSTER_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.departments = dict(Department.objects.values_list('department_name', 'id'))
+        self.sales_channels = dict(SalesChannel.objects.values_list('channel_name', 'id'))
+        self.emails = set(Person.objects.values_list('email', flat=True))
+        self.usernames = set(Person.objects.values_list('username', flat=True))
+        self.created = 0
+        self.errors = []
+
+    def import_file(self, file):
+        rows, error = read_roster(file, ROSTER_COLUMNS)
+        if error:
+            self.errors.append((1, error))
+            return self
+
+        employees, passwords, channel_ids = [], [], []
+        for line_number, row in rows:
+            built = self.build_employee(line_number, row)
+            if built is not None:
+                employee, password, channels = built
+                employees.append(employee)
+                passwords.append(password)
+                channel_ids.append(channels)
+
+        for employee, password_hash in zip(employees, hash_passwords(passwords, self.workers)):
+            employee.password = password_hash
+        self.save(employees, channel_ids)
+        return self
+
+    #return (unsaved Person, raw password, sales channel ids), or record the errors of the row and return None
+    def build_employee(self, line_number, row):
+        errors = []
+        #fields with an error already, not validated again below
+        invalid = set()
+        if not row['Username']:
+            errors.append('missing username')
+            invalid.add('username')
+        elif row['Username'] in self.usernames:
+            errors.append(f'username "{row["Username"]}" already exists')
+        try:
+            validate_email(row['Email'])
+        except ValidationError:
+            errors.append(f'invalid email "{row["Email"]}"')
+            invalid.add('email')
+        if row['Email'] in self.emails:
+            errors.append(f'email "{row["Email"]}" already exists')
+
+        department_id = None
+        if row['Department']:
+            department_id = self.departments.get(row['Department'])
+            if department_id is None:
+                errors.append(f'unknown department "{row["Department"]}"')
+        channel_ids = []
+        for channel_name in filter(None, (name.strip() for name in row['Sales channels'].split(';'))):
+            channel_id = self.sales_channels.get(channel_name)
+            if channel_id is None:
+                errors.append(f'unknown sales channel "{channel_name}"')
+            channel_ids.append(channel_id)
+
+        employee = Person(username=row['Username'], first_name=row['First name'], last_name=row['Last name'],
+                          email=row['Email'], department_id=department_id)
+        #lengths and formats of the columns - bulk_create would fail the whole import on them; the department
+        #(a query per row) and the not yet hashed password are skipped
+        try:
+            employee.clean_fields(exclude={'password', 'department'} | invalid)
+        except ValidationError as error:
+            errors.extend(f'{Person._meta.get_field(field).verbose_name}: {message}'
+                          for field, messages in error.message_dict.items() for message in messages)
+        password = row['Password'] or None
+        if password is not None:
+            try:
+                validate_password(password, user=employee)
+            except ValidationError as error:
+                errors.extend(error.messages)
+
+        if errors:
+            self.errors.append((line_number, '; '.join(errors)))
+            return None
+        #later rows of the same file must not reuse the username or email
+        self.usernames.add(employee.username)
+        self.emails.add(employee.email)
+        return employee, password, channel_ids
+
+    def save(self, employees, channel_ids):
+        if not employees:
+            return
+        Link = Person.sales_channels.through
+        with transaction.atomic():
+            Person.objects.bulk_create(employees, batch_size=self.batch_size)
+            links = [Link(person_id=employee.pk, saleschannel_id=channel_id)
+                     for employee, channels in zip(employees, channel_ids) for channel_id in set(channels)]
+            Link.objects.bulk_create(links, batch_size=self.batch_size)
+            #bulk_create does not send post_save, so the search index is written here
+            index_people(employees)
+        self.created += len(employees)
+
+
+#Deactivate all employees of the queryset with a single UPDATE. Returns the number of deactivated employees.
+#update() sends no post_save, so the cached scopes are dropped here - a deactivated user must lose access at once.
+def deactivate_employees(queryset):
+    deactivated = queryset.filter(is_active=True).update(is_active=False)
+    if deactivated:
+        invalidate_all_scopes()
+    return deactivated
+
+
+#Deactivate the employees listed (by email) in a CSV roster.
+class RosterDeactivator:
+
+    def __init__(self):
+        self.deactivated = 0
+        self.errors = []
+
+    def import_file(self, file):
+        rows, error = read_roster(file, OFFBOARDING_COLUMNS)
+        if error:
+            self.errors.append((1, error))
+            return self
+
+        emails = {}
+        for line_number, row in rows:
+            emails.setdefault(row['Email'], line_number)
+        known = set(Person.objects.filter(email__in=emails).values_list('email', flat=True))
+        for email, line_number in emails.items():
+            if email not in known:
+                self.errors.append((line_number, f'unknown employee "{email}"'))
+        self.deactivated = deactivate_employees(Person.objects.filter(email__in=known))
+        return self
@@ -0,0 +1,112 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DATABASE = 'replica'
+#only the models of the app are read from the replica - sessions, users' groups and permissions stay on the primary
+REPLICA_APPS = {'timetracking_app'}
+#the group and permission links of the users, read by the permission checks - a lagging replica must not decide them
+#(the user of the request is loaded from the primary before the view runs, see ReplicaRoutingMiddleware)
+PRIMARY_MODELS = {'timetracking_app.person_groups', 'timetracking_app.person_user_permissions'}
+#request profiles and slow queries recorded by the instrumentation - their writes do not make the user sticky
+INTERNAL_MODELS = {'timetracking_app.requestprofile', 'timetracking_app.slowquery'}
+#cookie set after a write - the user reads from the primary until the replica has caught up
+STICKY_PRIMARY_COOKIE = 'use_primary'
+
+#routing state of the request being handled: {'replica': reads may use the replica, 'wrote': the request wrote}
+request_routing = ContextVar('request_routing', default=None)
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 15)
+
+
+def replica_configured():
+    return REPLICA_DATABASE in connections.settings
+
+
+#the request being handled reads the app models from the replica
+def reading_replica():
+    routing = request_routing.get()
+    return bool(routing and routing['replica'])
+
+
+#Reads of the app models go to the replica while a marked view handles a request, everything else - writes and
+#reads of other views - goes to the primary. A no-op while no replica database is configured.
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if reading_replica() and model._meta.app_label in REPLICA_APPS and model._meta.label_lower not in PRIMARY_MODELS:
+            return REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        routing = request_routing.get()
+        if routing is not None and model._meta.label_lower not in INTERNAL_MODELS:
+            routing['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    #the replica holds the same rows as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    #the replica gets the schema by replication
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_DATABASE
+
+
+#Mark a view (function or class) whose GET requests may read from the replica - reports, exports and searches.
+def replica_reads(view):
+    view.replica_reads = True
+    return view
+
+
+#View mixin marking a class based view as replica_reads.
+class ReplicaReadsMixin:
+    replica_reads = True
+
+
+def is_replica_view(view_func):
+    return getattr(view_func, 'replica_reads', False) or getattr(getattr(view_func, 'view_class', None),
+                                                                 'replica_reads', False)
+
+
+#Route the reads of marked views to the replica, unless the user wrote a moment ago (sticky primary cookie) - the
+#stickiness is per user, other users keep reading from the replica. Writes set the sticky cookie, so read-after-write
+#pages see the new rows. Reports read from a lagging replica are not cached, see report_cache.is_report_cacheable.
+class ReplicaRoutingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing = {'replica': False, 'wrote': False}
+        token = request_routing.set(routing)
+        try:
+            response = self.get_response(request)
+            if response.streaming and routing['replica']:
+                response.streaming_content = self.stream_from_replica(response.streaming_content)
+        finally:
+            request_routing.reset(token)
+        if routing['wrote']:
+            response.set_cookie(STICKY_PRIMARY_COOKIE, '1', max_age=get_sticky_seconds(), httponly=True,
+                                samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routing = request_routing.get()
+        if (routing is not None and replica_configured() and is_replica_view(view_func)
+                and request.method in ('GET', 'HEAD') and STICKY_PRIMARY_COOKIE not in request.COOKIES):
+            #the session and the user (a lazy object) are read from the primary, before the reads are switched
+            if hasattr(request, 'user'):
+                request.user.is_authenticated
+            routing['replica'] = True
+
+    #streamed rows are read after the view returns, keep them on the replica too
+    def stream_from_replica(self, content):
+        token = request_routing.set({'replica': True, 'wrote': False})
+        try:
+            yield from content
+        finally:
+            request_routing.reset(token)
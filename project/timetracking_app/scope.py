@@ -0,0 +1,100 @@
+import time
+
+from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.core.cache import cache
+
+from .models import LoggedHours
+
+SCOPE_CACHE_TIMEOUT = 300
+SCOPE_VERSION_KEY = 'user_scope:version'
+
+
+#Role, department and permission set of a user - everything the report views need to restrict data visibility.
+class UserScope:
+    def __init__(self, role, department_id, permissions, is_superuser=False):
+        self.role = role
+        self.department_id = department_id
+        self.permissions = frozenset(permissions)
+        self.is_superuser = is_superuser
+
+    @property
+    def is_director(self):
+        return self.role == 'director'
+
+    @property
+    def is_manager(self):
+        return self.role == 'manager'
+
+    def has_perms(self, perm_list):
+        return self.is_superuser or set(perm_list) <= self.permissions
+
+    #restricting data visibility - managers can view their departments only, director can view all departments
+    def filter_logged_hours(self, queryset=None):
+        if queryset is None:
+            queryset = LoggedHours.objects.all()
+        if self.is_manager:
+            return queryset.filter(department_id=self.department_id)
+        return queryset
+
+
+#Version of all cached scopes - kept in the shared cache, so an invalidation reaches every worker.
+#A missing (evicted) version starts from the current time, so it never matches the scopes of an older version.
+def get_scope_version():
+    return cache.get_or_set(SCOPE_VERSION_KEY, time.time_ns, None)
+
+
+def get_scope_cache_key(user_id):
+    return f'user_scope:{get_scope_version()}:{user_id}'
+
+
+#Compute the scope of a user, or read it from the cache.
+def get_user_scope(user):
+    key = get_scope_cache_key(user.pk)
+    cached = cache.get(key)
+    if cached is None:
+        group_names = set(user.groups.values_list('name', flat=True))
+        if 'director_user' in group_names:
+            role = 'director'
+        elif 'manager_user' in group_names:
+            role = 'manager'
+        else:
+            role = 'employee'
+        #superusers pass every permission check, so their (complete) permission set is not loaded
+        permissions = set() if user.is_superuser else user.get_all_permissions()
+        cached = {'role': role, 'department_id': user.department_id, 'is_superuser': user.is_superuser,
+                  'permissions': permissions}
+        cache.set(key, cached, SCOPE_CACHE_TIMEOUT)
+    return UserScope(**cached)
+
+
+#Drop the cached scope of one user (group membership or department changed).
+def invalidate_user_scope(user_id):
+    cache.delete(get_scope_cache_key(user_id))
+
+
+#Drop the cached scopes of all users (permissions of a group changed).
+def invalidate_all_scopes():
+    try:
+        cache.incr(SCOPE_VERSION_KEY)
+    except ValueError:
+        cache.set(SCOPE_VERSION_KEY, time.time_ns(), None)
+
+
+#Resolve the scope once per request and check permissions against it.
+#Also primes the permission cache of the user, so {{ perms }} in templates does not query again.
+class ScopedViewMixin(PermissionRequiredMixin):
+
+    def get_scope(self):
+        if not hasattr(self.request, 'user_scope'):
+            scope = get_user_scope(self.request.user)
+            self.request.user._perm_cache = set(scope.permissions)
+            self.request.user_scope = scope
+        return self.request.user_scope
+
+    def has_permission(self):
+        user = self.request.user
+        return user.is_active and self.get_scope().has_perms(self.get_permission_required())
+
+    #LoggedHours restricted to the data the user is allowed to see
+    def get_scoped_queryset(self, queryset=None):
+        return self.get_scope().filter_logged_hours(queryset)
@@ -0,0 +1,127 @@
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .models import Person, Department, PersonSearchToken
+
+#letters without a decomposition, which NFKD does not fold to ASCII
+FOLDED_LETTERS = str.maketrans({'ł': 'l', 'đ': 'd', 'ø': 'o', 'ß': 'ss', 'æ': 'ae', 'œ': 'oe', 'ı': 'i'})
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+TOKEN_LENGTH = PersonSearchToken._meta.get_field('token').max_length
+#Person fields whose changes need new tokens (department is the foreign key)
+INDEXED_FIELDS = ('first_name', 'last_name', 'email', 'username', 'department')
+AUTOCOMPLETE_LIMIT = 10
+#how many index entries are counted at most when looking for the most selective word of a query
+SELECTIVITY_PROBE = 5000
+
+
+#lowercase, strip accents ("Łukasz Żółć" -> "lukasz zolc") and split into ASCII words
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', (text or '').casefold().translate(FOLDED_LETTERS))
+    text = ''.join(character for character in text if not unicodedata.combining(character))
+    return [token[:TOKEN_LENGTH] for token in TOKEN_PATTERN.findall(text)]
+
+
+#(field, token) pairs of one person - every word of the names, email and department
+def get_person_tokens(person, department_name=None):
+    values = {
+        PersonSearchToken.FIRST_NAME: person.first_name,
+        PersonSearchToken.LAST_NAME: person.last_name,
+        PersonSearchToken.EMAIL: person.email,
+        PersonSearchToken.USERNAME: person.username,
+        PersonSearchToken.DEPARTMENT: department_name,
+    }
+    return {(field, token) for field, text in values.items() for token in tokenize(text)}
+
+
+#Rewrite the search tokens of the given people - two queries for the tokens plus one for the department names.
+def index_people(people):
+    people = [person for person in people if person.pk is not None]
+    if not people:
+        return
+    department_ids = {person.department_id for person in people} - {None}
+    department_names = dict(Department.objects.filter(pk__in=department_ids).values_list('id', 'department_name'))
+    tokens = [PersonSearchToken(person_id=person.pk, field=field, token=token)
+              for person in people
+              for field, token in get_person_tokens(person, department_names.get(person.department_id))]
+    with transaction.atomic():
+        PersonSearchToken.objects.filter(person_id__in=[person.pk for person in people]).delete()
+        PersonSearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+#tokens are [a-z0-9] only, so all words starting with the prefix sort between the prefix and the prefix padded with
+#"z" - a range any plain b-tree index serves, unlike LIKE 'prefix%' on SQLite or a non-C collation on PostgreSQL
+def prefix_filter(prefix):
+    return {'token__range': (prefix, prefix + 'z' * (TOKEN_LENGTH - len(prefix)))}
+
+
+#words of a query, the most selective first - it drives the lookup, the others only filter its matches.
+#Words are compared by their number of index entries, counted up to SELECTIVITY_PROBE (one short range scan each).
+def get_query_prefixes(query, field=None):
+    prefixes = list(dict.fromkeys(tokenize(query)))
+    if len(prefixes) < 2:
+        return prefixes
+
+    def selectivity(prefix):
+        tokens = PersonSearchToken.objects.filter(**prefix_filter(prefix))
+        if field:
+            tokens = tokens.filter(field=field)
+        return tokens.order_by()[:SELECTIVITY_PROBE].count()
+    #equal counts (both over the probe) - prefer the longer word
+    return sorted(prefixes, key=lambda prefix: (selectivity(prefix), -len(prefix)))
+
+
+#ids of the people who have a word starting with every word of the query (optionally in the given field only)
+def matching_people(query, field=None):
+    prefixes = get_query_prefixes(query, field)
+    if not prefixes:
+        return None
+    people = None
+    for prefix in prefixes:
+        tokens = PersonSearchToken.objects.filter(**prefix_filter(prefix))
+        if field:
+            tokens = tokens.filter(field=field)
+        if people is None:
+            people = tokens
+        else:
+            people = people.filter(Exists(tokens.filter(person_id=OuterRef('person_id'))))
+    return people.values('person_id')
+
+
+#Filter a Person queryset by the free text query and the per field queries. Empty queries do not filter.
+def search_people(queryset, query='', **field_queries):
+    for field, text in [(None, query)] + list(field_queries.items()):
+        people = matching_people(text, field)
+        if people is not None:
+            queryset = queryset.filter(pk__in=people)
+    return queryset
+
+
+#First matches for the autocomplete, read from the token index in index order, so a short prefix that matches
+#thousands of people still only reads a few index entries.
+def autocomplete_people(query, limit=AUTOCOMPLETE_LIMIT):
+    prefixes = get_query_prefixes(query)
+    if not prefixes:
+        return []
+    tokens = PersonSearchToken.objects.filter(**prefix_filter(prefixes[0]), person__is_active=True)
+    #the other words are checked per candidate among the few tokens of that person, so the scan can stop early
+    for prefix in prefixes[1:]:
+        tokens = tokens.filter(Exists(PersonSearchToken.objects.filter(person_id=OuterRef('person_id'),
+                                                                       **prefix_filter(prefix))))
+    rows = tokens.order_by('token', 'person_id').values_list('person_id', flat=True)
+    person_ids = []
+    #one person can match with several words, so read the index in chunks until there are enough people
+    chunk_size = limit * 5
+    offset = 0
+    while len(person_ids) < limit:
+        chunk = list(rows[offset:offset + chunk_size])
+        for person_id in chunk:
+            if person_id not in person_ids and len(person_ids) < limit:
+                person_ids.append(person_id)
+        if len(chunk) < chunk_size:
+            break
+        offset += chunk_size
+    people = Person.objects.select_related('department').in_bulk(person_ids)
+    return [people[person_id] for person_id in person_ids if person_id in people]
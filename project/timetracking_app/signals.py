@@ -0,0 +1,60 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Person, Department, SalesChannel
+from .reference import invalidate_reference_data
+from .search import index_people, INDEXED_FIELDS
+from .scope import invalidate_user_scope, invalidate_all_scopes
+
+
+#Group membership changed - from the user side (user.groups.add) or the group side (group.user_set.add)
+@receiver(m2m_changed, sender=Person.groups.through)
+def invalidate_scope_on_group_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Person):
+        invalidate_user_scope(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            invalidate_user_scope(user_id)
+    else:
+        invalidate_all_scopes()
+
+
+@receiver(m2m_changed, sender=Person.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_scope_on_permission_change(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_all_scopes()
+
+
+@receiver(post_save, sender=Person)
+def invalidate_scope_on_person_save(sender, instance, **kwargs):
+    invalidate_user_scope(instance.pk)
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_scope_on_group_delete(sender, **kwargs):
+    invalidate_all_scopes()
+
+
+#keep the employee search index in step - skipped for saves that touch other fields only (e.g. last_login on login)
+@receiver(post_save, sender=Person)
+def index_person_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & set(INDEXED_FIELDS):
+        index_people([instance])
+
+
+@receiver(post_save, sender=Department)
+def index_department_people_on_save(sender, instance, created, **kwargs):
+    if not created:
+        index_people(Person.objects.filter(department=instance))
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=SalesChannel)
+@receiver(post_delete, sender=SalesChannel)
+def invalidate_reference_data_on_change(sender, **kwargs):
+    invalidate_reference_data()
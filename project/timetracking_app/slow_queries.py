@@ -0,0 +1,89 @@
+import hashlib
+import re
+
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SlowQuery
+
+#distinct calling views kept per query
+SLOW_QUERY_MAX_VIEWS = 20
+WHITESPACE = re.compile(r'\s+')
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+#IN (%s, %s, %s) - the number of placeholders depends on the data, not on the query
+PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+#The query without its values: placeholders lists collapsed and inlined literals (LIMIT 21) replaced,
+#so the executions of the same ORM chain share one fingerprint.
+def normalize_sql(sql):
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = PLACEHOLDER_LIST.sub('%s, ...', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def get_fingerprint(sql):
+    return hashlib.md5(normalize_sql(sql).encode()).hexdigest()
+
+
+#types of the parameters, never their values (e.g. ['int', 'date', 'str'])
+def get_param_shape(params, many=False):
+    if many:
+        params = list(params or [])
+        return {'rows': len(params), 'params': get_param_shape(params[0]) if params else []}
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [f'{type(value).__name__}[{len(value)}]' if isinstance(value, (list, tuple)) else type(value).__name__
+            for value in params]
+
+
+#EXPLAIN output of a SELECT, one line per plan row. Runs in a savepoint, so a failure cannot break the transaction.
+def explain(sql, params, using='default'):
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return ''
+    connection = connections[using]
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            rows = cursor.fetchall()
+    except DatabaseError as error:
+        return f'EXPLAIN failed: {error}'
+    return '\n'.join(row if isinstance(row, str) else ' '.join(str(column) for column in row) for row in rows)
+
+
+#Store the slow queries of one request: one row per fingerprint with the execution counts and timings.
+#EXPLAIN runs only for the first execution of a fingerprint - later ones update the counters.
+def record_slow_queries(slow_queries, view_name):
+    now = timezone.now()
+    for query in slow_queries:
+        fingerprint = get_fingerprint(query['sql'])
+        duration_ms = query['duration'] * 1000
+        if update_slow_query(fingerprint, duration_ms, view_name, now):
+            continue
+        try:
+            with transaction.atomic():
+                SlowQuery.objects.create(
+                    fingerprint=fingerprint, sql=query['sql'], database=query['using'], views=[view_name],
+                    param_shape=get_param_shape(query['params'], query['many']),
+                    explain=explain(query['sql'], query['params'], query['using']),
+                    count=1, total_ms=duration_ms, max_ms=duration_ms, first_seen=now, last_seen=now)
+        except IntegrityError:
+            #another worker stored the same query in the meantime
+            update_slow_query(fingerprint, duration_ms, view_name, now)
+
+
+def update_slow_query(fingerprint, duration_ms, view_name, now):
+    updated = SlowQuery.objects.filter(fingerprint=fingerprint).update(
+        count=F('count') + 1, total_ms=F('total_ms') + duration_ms, max_ms=Greatest('max_ms', duration_ms),
+        last_seen=now)
+    if updated:
+        views = SlowQuery.objects.filter(fingerprint=fingerprint).values_list('views', flat=True).first()
+        if view_name not in views and len(views) < SLOW_QUERY_MAX_VIEWS:
+            SlowQuery.objects.filter(fingerprint=fingerprint).update(views=views + [view_name])
+    return updated
@@ -0,0 +1,131 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .date_ranges import get_today
+from .models import Person, Department, SalesChannel, LoggedHours
+from .search import index_people
+
+FIRST_NAMES = ('Anna', 'Piotr', 'Katarzyna', 'Tomasz', 'Agnieszka', 'Michał', 'Magdalena', 'Paweł', 'Joanna',
+               'Łukasz', 'Ewa', 'Krzysztof', 'Zofia', 'Marek', 'Julia', 'Jan', 'Maria', 'Adam', 'Ola', 'Jakub')
+LAST_NAMES = ('Nowak', 'Kowalski', 'Wiśniewska', 'Wójcik', 'Kowalczyk', 'Kamińska', 'Lewandowski', 'Zielińska',
+              'Szymański', 'Woźniak', 'Dąbrowski', 'Kozłowska', 'Jankowski', 'Mazur', 'Krawczyk', 'Piotrowski')
+CHANNEL_KINDS = ('Online', 'Retail', 'Wholesale', 'Partners', 'Phone', 'Marketplace', 'Export', 'B2B')
+GENERATOR_BATCH_SIZE = 5000
+#share of the working days an employee does not log (leave, sick days)
+DAY_OFF_RATE = 0.08
+
+
+#Create a synthetic organization with bulk inserts: departments with managers, sales channels shared by the
+#departments, employees and daily entries of the last years (Monday to Friday, 1-3 entries of up to 8 hours a day).
+#Entries are logged with LoggedHours.bulk_log and the employees are indexed for the search, like real data.
+#The same seed generates the same organization. Returns the created departments, channels and employees.
+class OrganizationGenerator:
+
+    def __init__(self, departments=5, channels=10, employees=100, years=1, seed=0, prefix='synthetic',
+                 batch_size=GENERATOR_BATCH_SIZE):
+        self.department_count = max(1, departments)
+        self.channel_count = max(1, channels)
+        #every department has a manager, who logs hours too
+        self.employee_count = max(employees, self.department_count)
+        self.years = years
+        self.random = random.Random(seed)
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.entries = 0
+
+    def generate(self):
+        with transaction.atomic():
+            channels = self.create_channels()
+            employees = self.create_employees()
+            departments = self.create_departments(employees, channels)
+            self.assign_sales_channels(employees, departments)
+            index_people(employees)
+            self.log_hours(employees)
+        return {'departments': departments, 'sales_channels': channels, 'employees': employees}
+
+    def create_channels(self):
+        return SalesChannel.objects.bulk_create(
+            [SalesChannel(channel_name=f'{self.prefix} {CHANNEL_KINDS[number % len(CHANNEL_KINDS)]} {number}')
+             for number in range(self.channel_count)], batch_size=self.batch_size)
+
+    def create_employees(self):
+        #passwords are unusable - hashing thousands of real ones would take minutes
+        employees = []
+        for number in range(self.employee_count):
+            first_name, last_name = self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+            employees.append(Person(username=f'{self.prefix}_{number}', first_name=first_name, last_name=last_name,
+                                    email=f'{self.prefix}.{number}@example.com', password=make_password(None)))
+        return Person.objects.bulk_create(employees, batch_size=self.batch_size)
+
+    #the first employees become the managers, the others are spread over the departments
+    def create_departments(self, employees, channels):
+        departments = Department.objects.bulk_create(
+            [Department(department_name=f'{self.prefix} department {number}', manager=employees[number])
+             for number in range(self.department_count)], batch_size=self.batch_size)
+        for number, employee in enumerate(employees):
+            employee.department = departments[number % len(departments)]
+        Person.objects.bulk_update(employees, ['department'], batch_size=self.batch_size)
+
+        #every channel serves at least one department, a department sells through a few channels
+        Link = SalesChannel.department.through
+        links = set()
+        for number, channel in enumerate(channels):
+            links.add((channel.pk, departments[number % len(departments)].pk))
+            for department in self.random.sample(departments, min(2, len(departments))):
+                links.add((channel.pk, department.pk))
+        Link.objects.bulk_create([Link(saleschannel_id=channel_id, department_id=department_id)
+                                  for channel_id, department_id in sorted(links)], batch_size=self.batch_size)
+        self.department_channels = {}
+        for channel_id, department_id in links:
+            self.department_channels.setdefault(department_id, []).append(channel_id)
+        return departments
+
+    def assign_sales_channels(self, employees, departments):
+        Link = Person.sales_channels.through
+        self.employee_channels = {}
+        links = []
+        for employee in employees:
+            channel_ids = sorted(self.department_channels[employee.department_id])
+            channel_ids = self.random.sample(channel_ids, min(len(channel_ids), self.random.randint(1, 3)))
+            self.employee_channels[employee.pk] = channel_ids
+            links.extend(Link(person_id=employee.pk, saleschannel_id=channel_id) for channel_id in channel_ids)
+        Link.objects.bulk_create(links, batch_size=self.batch_size)
+
+    def get_working_days(self):
+        today = get_today()
+        day = today - timedelta(days=365 * self.years - 1)
+        while day <= today:
+            if day.weekday() < 5:
+                yield day
+            day += timedelta(days=1)
+
+    #split a working day of 4-8 hours (in quarters) into one entry per channel worked on
+    def get_day_entries(self, employee):
+        channel_ids = self.employee_channels[employee.pk]
+        quarters = self.random.randint(16, 32)
+        channel_ids = self.random.sample(channel_ids, self.random.randint(1, len(channel_ids)))
+        cuts = sorted(self.random.sample(range(1, quarters), len(channel_ids) - 1))
+        parts = [end - start for start, end in zip([0] + cuts, cuts + [quarters])]
+        return zip(channel_ids, (part / 4 for part in parts))
+
+    def log_hours(self, employees):
+        batch = []
+        for day in self.get_working_days():
+            for employee in employees:
+                if self.random.random() < DAY_OFF_RATE:
+                    continue
+                for channel_id, hours in self.get_day_entries(employee):
+                    batch.append(LoggedHours(date=day, hour=hours, employee_id=employee.pk,
+                                             department_id=employee.department_id, sales_channel_id=channel_id))
+                if len(batch) >= self.batch_size:
+                    self.save_entries(batch)
+                    batch = []
+        self.save_entries(batch)
+
+    def save_entries(self, entries):
+        if entries:
+            LoggedHours.bulk_log(entries, batch_size=self.batch_size)
+            self.entries += len(entries)
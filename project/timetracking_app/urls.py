@@ -17,31 +17,46 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from .views import (HomePageView, LoginView, AddHoursView, ViewDepartmentHoursView,
+from .forms import OutboxPasswordResetForm
+from .views import (HomePageView, LoginView, AddHoursView, AddWeeklyHoursView, ViewDepartmentHoursView,
                     ViewEmployeesHoursView, AddEmployeeView, LogoutView, ListAllHoursView, HoursPerChannelView,
                     DeleteHoursView, EditHoursView, EditEmployeeView, DeactivateEmployeeView, ResetPasswordView,
-                    SearchEmployeeView, EmployeeDetailView)
+                    SearchEmployeeView, EmployeeAutocompleteView, EmployeeDetailView, ExportEmployeesHoursView,
+                    ImportHoursView, HoursTrendView, TrendChartDataView, OnboardEmployeesView, OffboardEmployeesView, ChannelChartDataView, DepartmentChartDataView, EmployeeChartDataView,
+                    MetricsView)
 
 urlpatterns = [
     path('home/', HomePageView.as_view(), name='home-page'),
     path('login/', LoginView.as_view(), name='login-page'),
     path('logout/', LogoutView.as_view(), name='logout-page'),
     path('add_hours/', AddHoursView.as_view(), name='add-hours'),
+    path('add_hours/week/', AddWeeklyHoursView.as_view(), name='add-weekly-hours'),
     path('list_all_hours/', ListAllHoursView.as_view(), name='list-all-hours'),
     path('channel_hours/', HoursPerChannelView.as_view(), name='hours-per-channel'),
+    path('hours_trend/', HoursTrendView.as_view(), name='hours-trend'),
     path('department_hours/', ViewDepartmentHoursView.as_view(), name='department-hours'),
     path('employees_hours/', ViewEmployeesHoursView.as_view(), name='employees-hours'),
+    path('employees_hours/export/', ExportEmployeesHoursView.as_view(), name='export-employees-hours'),
+    path('import_hours/', ImportHoursView.as_view(), name='import-hours'),
     path('add_employee/', AddEmployeeView.as_view(), name='add-employee'),
+    path('onboard_employees/', OnboardEmployeesView.as_view(), name='onboard-employees'),
+    path('offboard_employees/', OffboardEmployeesView.as_view(), name='offboard-employees'),
+    path('chart_data/channel_hours/', ChannelChartDataView.as_view(), name='chart-channel-hours'),
+    path('chart_data/department_hours/', DepartmentChartDataView.as_view(), name='chart-department-hours'),
+    path('chart_data/employees_hours/', EmployeeChartDataView.as_view(), name='chart-employees-hours'),
+    path('chart_data/hours_trend/', TrendChartDataView.as_view(), name='chart-hours-trend'),
     path('delete_hours/<int:pk>/', DeleteHoursView.as_view(), name='delete-hours'),
     path('edit_hours/<int:pk>/', EditHoursView.as_view(), name='edit-hours'),
     path('edit_employee/<int:pk>/', EditEmployeeView.as_view(), name='edit-employee'),
     path('deactivate_employee/<int:pk>/', DeactivateEmployeeView.as_view(), name='deactivate-employee'),
-    path('reset_password/', auth_views.PasswordResetView.as_view(template_name='password_reset_form.html'), name='password_reset'),
+    path('reset_password/', auth_views.PasswordResetView.as_view(template_name='password_reset_form.html', form_class=OutboxPasswordResetForm), name='password_reset'),
     path('reset_password_sent/', auth_views.PasswordResetDoneView.as_view(template_name='password_reset_done.html'), name='password_reset_done'),
     path('reset/<uidb64>/<token>/', auth_views.PasswordResetConfirmView.as_view(template_name='password_reset_confirm.html'), name='password_reset_confirm'),
     path('reset_password_complete/', auth_views.PasswordResetCompleteView.as_view(template_name='password_reset_complete.html'), name='password_reset_complete'),
     path('search_employee/', SearchEmployeeView.as_view(), name='search-employee'),
+    path('search_employee/autocomplete/', EmployeeAutocompleteView.as_view(), name='employee-autocomplete'),
     path('change_password/', auth_views.PasswordChangeView.as_view(template_name='password_change.html'), name='change-password'),
     path('change_password_done/', auth_views.PasswordChangeView.as_view(template_name='password_change_done.html'), name='password_change_done'),
     path('employee_details/<int:pk>/', EmployeeDetailView.as_view(), name='employee-detail'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
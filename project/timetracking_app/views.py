@@ -1,67 +1,82 @@
-import sendgrid
-import os
+import io
+from datetime import date
 
-from sendgrid.helpers.mail import *
-
-from django.utils import timezone
 from django.utils.timezone import timedelta
 
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.contrib.auth.models import Permission, Group
-from django.contrib.auth.views import LoginView
-from django.contrib.contenttypes.models import ContentType
-from django.contrib import messages
 from django.contrib.auth.tokens import default_token_generator
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
-from django.core.mail import send_mail
-from django.http import HttpResponse, QueryDict
+from django.core.paginator import Paginator
+from django.http import HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy, reverse
 from django.views import View
 from django.views.generic import FormView, ListView, DeleteView, UpdateView, CreateView, DetailView
 from django.contrib.auth import authenticate, login, logout
-from django.core.mail import send_mail
 from django.conf import settings
 
-from .forms import AddHoursForm, LoginForm, ResetPasswordForm, SearchEmployeeForm
-from .models import LoggedHours, SalesChannel, Person, Department
-
-
-#Create a parent class with methods that will be reused in the code.
-class DateFilterView(View):
-
-#Setting up query strings to be used for filtering data
-    def set_up_query_strings(self, *args, **kwargs):
-        query_params = QueryDict(mutable=True)
-        #Setting up query parameters
-        query_params['filter_type'] = 'value'
-
-        # Redirecting to the selected page dependent on selected parameter
-        redirect_url = '/channel_hours/?' + query_params.urlencode()
-        return redirect_url
-
-#Filtering based on specified timeframes (weekly, monthly, yearly or without any filter)
-    def filter_by_dates_range(self, filter_type):
-        #filter 'weekly'
-        if filter_type == 'weekly':
-            all_entries = LoggedHours.objects.filter(date__gte=timezone.now(),
-                                                     date__lte=timezone.now() + timedelta(days=6))
-            return all_entries
-        # filter 'monthly'
-        elif filter_type == 'monthly':
-            all_entries = LoggedHours.objects.filter(date__gte=timezone.now().replace(day=1).strftime('%Y-%m-%d'))
-            return all_entries
-        # filter 'yearly'
-        elif filter_type == 'yearly':
-            all_entries = LoggedHours.objects.filter(
-                date__gte=timezone.now().replace(day=1, month=1).strftime('%Y-%m-%d'))
-            return all_entries
-        # no date filter - all data
-        else:
-            all_entries = LoggedHours.objects.all()
-            return all_entries
+from .archive import route_date_range
+from .date_ranges import DATE_RANGE_PARAMS, DATE_RANGE_PRESETS, filter_date_range, get_today, resolve_date_range
+from .exports import export_values, iter_logged_hours_csv
+from .forms import (AddHoursForm, LoginForm, ResetPasswordForm, SearchEmployeeForm, ImportHoursForm, TimesheetFormSet,
+                    TimesheetRowForm, RosterFileForm, DateRangeForm, TrendForm)
+from .imports import LoggedHoursImporter
+from .instrumentation import registry
+from .models import LoggedHours, DailyLoggedHours, Person
+from .outbox import enqueue_email
+from .pagination import CursorPaginationMixin
+from .reference import get_channel_choices, get_department_choices
+from .report_cache import CachedReportMixin, ChartDataMixin
+from .routers import ReplicaReadsMixin
+from .roster import RosterImporter, RosterDeactivator, ROSTER_COLUMNS, OFFBOARDING_COLUMNS, deactivate_employees
+from .reports import hours_per_channel, hours_per_department, hours_per_employee, hours_per_month, hours_trend
+from .search import search_people, autocomplete_people
+from .scope import ScopedViewMixin
+
+
+#Date range of the list and report views, read from the filter_type (preset), start and end query parameters.
+#All views share the same calendar semantics; invalid parameters are reported on the form and do not filter.
+class DateRangeMixin:
+
+    def get_date_range_form(self):
+        if not hasattr(self, 'date_range_form'):
+            self.date_range_form = DateRangeForm(self.request.GET)
+            self.date_range_form.is_valid()
+        return self.date_range_form
+
+    #inclusive (start, end) dates, None for an open end
+    def get_date_range(self):
+        form = self.get_date_range_form()
+        data = form.cleaned_data if form.is_valid() else {}
+        return resolve_date_range(data.get('filter_type'), data.get('start'), data.get('end'))
+
+    def filter_by_dates_range(self, queryset):
+        return filter_date_range(queryset, *self.get_date_range())
+
+    #logged hours of the selected dates, read from the archive too when the range reaches into it
+    #build_queryset(queryset) applies the other filters of the view to either table
+    def get_dated_hours(self, build_queryset):
+        return route_date_range(build_queryset, *self.get_date_range())
+
+    #the date parameters of the request, kept in pagination and export links
+    def get_date_query(self):
+        query = QueryDict(mutable=True)
+        for param in DATE_RANGE_PARAMS:
+            if self.request.GET.get(param):
+                query[param] = self.request.GET[param]
+        return query.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'date_range_form': self.get_date_range_form(),
+            'date_range_presets': DATE_RANGE_PRESETS,
+            'filter_type': self.request.GET.get('filter_type'),
+            'date_query': self.get_date_query(),
+        })
+        return context
 
 
 #Home page - visible to logged in users only.
@@ -114,10 +129,9 @@ class AddHoursView(LoginRequiredMixin, FormView):
         form = form
         form.fields['employee'].initial = user
         date = form.cleaned_data['date']
-        form_sales_channel = form.cleaned_data['sales_channel']
-        form_department = form.cleaned_data['department']
-        sales_channel = get_object_or_404(SalesChannel, channel_name=form_sales_channel)
-        department = get_object_or_404(Department, department_name=form_department)
+        #the form has already resolved the sales channel and the department
+        sales_channel = form.cleaned_data['sales_channel']
+        department = form.cleaned_data['department']
         hour = form.cleaned_data['hour']
 
         #Add hours to the database
@@ -126,8 +140,47 @@ class AddHoursView(LoginRequiredMixin, FormView):
         return super().form_valid(form)
 
 
+#Log a whole week of hours of a logged in user at once - one row per sales channel and department.
+class AddWeeklyHoursView(LoginRequiredMixin, FormView):
+    login_url = '/login/'
+    template_name = 'add_weekly_hours.html'
+    form_class = TimesheetFormSet
+    success_url = reverse_lazy('list-all-hours')
+
+    #Monday of the week selected with ?week=YYYY-MM-DD, the current week by default
+    def get_week_start(self):
+        try:
+            day = date.fromisoformat(self.request.GET.get('week', ''))
+        except ValueError:
+            day = get_today()
+        return day - timedelta(days=day.weekday())
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['week_start'] = self.get_week_start()
+        #load the choices once for all rows
+        kwargs['form_kwargs'] = {
+            'channel_choices': get_channel_choices(),
+            'department_choices': get_department_choices(),
+        }
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        week_start = self.get_week_start()
+        context['days'] = [week_start + timedelta(days=day) for day in range(TimesheetRowForm.DAYS)]
+        context['previous_week'] = week_start - timedelta(days=7)
+        context['next_week'] = week_start + timedelta(days=7)
+        return context
+
+    #save all filled cells with one bulk insert in a single transaction
+    def form_valid(self, form):
+        LoggedHours.bulk_log(form.get_entries(self.request.user))
+        return super().form_valid(form)
+
+
 #Display all hours added by a logged in user.
-class ListAllHoursView(LoginRequiredMixin, ListView, DateFilterView):
+class ListAllHoursView(LoginRequiredMixin, DateRangeMixin, CursorPaginationMixin, ListView):
     login_url = '/login/'
     model = LoggedHours
     success_url = '/list_all_hours/'
@@ -138,45 +191,14 @@ class ListAllHoursView(LoginRequiredMixin, ListView, DateFilterView):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = LoggedHours.objects.filter(employee=user)
-        queryset = self.filter_by_dates_range(queryset)
-        return queryset
-
-    # filter data dependent on dates range
-    def filter_by_dates_range(self, queryset):
-        filter_type = self.request.GET.get('filter_type')
-        if filter_type == 'weekly':
-            start_date = timezone.now() - timezone.timedelta(days=7)
-        elif filter_type == 'monthly':
-            start_date = timezone.now() - timezone.timedelta(days=30)
-        elif filter_type == 'yearly':
-            start_date = timezone.now() - timezone.timedelta(days=365)
-        else:
-            # Default: no filtering
-            return queryset
-
-        return queryset.filter(date__gte=start_date)
-
-    # summarize data per channel and dates range selected by user
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        filter_type = self.request.GET.get('filter_type')
-        # apply filter by date
-        context['filter_type'] = filter_type
-        # get queryset
-        all_entries = self.get_queryset()
-
-
-        # get context data to the filtering buttons
-        context['weekly'] = self.set_up_query_strings('weekly')
-        context['monthly_url'] = self.set_up_query_strings('monthly')
-        context['yearly_url'] = self.set_up_query_strings('yearly')
-
-        return context
+        #load the related rows rendered in the table together with the entries
+        return self.get_dated_hours(
+            lambda queryset: queryset.filter(employee=user).select_related('sales_channel', 'department'))
 
 
 #Allow access to view summarised hours per sales channel to logged in users with specified permissions.
-class HoursPerChannelView(LoginRequiredMixin, PermissionRequiredMixin, ListView, DateFilterView):
+class HoursPerChannelView(LoginRequiredMixin, ReplicaReadsMixin, ScopedViewMixin, DateRangeMixin, CachedReportMixin,
+                          ListView):
     login_url = '/login/'
     permission_required = ['timetracking_app.view_hours_per_channel']
 
@@ -185,83 +207,24 @@ class HoursPerChannelView(LoginRequiredMixin, PermissionRequiredMixin, ListView,
     template_name = 'channel_hours.html'
     context_object_name = 'logged_hours'
 
-    #Filter queryset dependent on the user group.
+    #Filter queryset dependent on the user group (resolved once per request).
+    #The totals are summed from the daily rollup, which also holds the archived hours.
     def get_queryset(self):
-        user = self.request.user
-
-        # restricting data visibility - managers can view their departments only, director can view all departments
-        if user.groups.filter(name='director_user').exists():
-            queryset = LoggedHours.objects.all()
-        elif user.groups.filter(name='manager_user').exists():
-            queryset = LoggedHours.objects.filter(department=user.department)
-
-        else:
-            queryset = LoggedHours.objects.all()
-
+        queryset = self.get_scoped_queryset(DailyLoggedHours.objects.all())
         queryset = self.filter_by_dates_range(queryset)
         return queryset
 
-    #filter data dependent on dates range
-    def filter_by_dates_range(self, queryset):
-        filter_type = self.request.GET.get('filter_type')
-        if filter_type == 'weekly':
-            start_date = timezone.now() - timezone.timedelta(days=7)
-        elif filter_type == 'monthly':
-            start_date = timezone.now() - timezone.timedelta(days=30)
-        elif filter_type == 'yearly':
-            start_date = timezone.now() - timezone.timedelta(days=365)
-        else:
-            # Default: no filtering
-            return queryset
-
-        return queryset.filter(date__gte=start_date)
-
     #summarize data per channel and dates range selected by user
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        filter_type = self.request.GET.get('filter_type')
-        #apply filter by date
-        context['filter_type'] = filter_type
-        #get queryset
-        all_entries = self.get_queryset()
-
-        #summarize hours per channel (of all users)
-        hours_per_channel = {}
-        for entry in all_entries:
-            sales_channel = entry.sales_channel
-            hours = entry.hour
-            if sales_channel in hours_per_channel:
-                hours_per_channel[sales_channel] += hours
-            else:
-                hours_per_channel[sales_channel] = hours
-        context['hours_per_channel'] = hours_per_channel
-
-        #calling function that sets up the context data for charts
-        labels_data = self.get_labels_data(all_entries)
-        context.update(labels_data)
-
-        #get context data to the filtering buttons
-        context['weekly'] = self.set_up_query_strings('weekly')
-        context['monthly_url'] = self.set_up_query_strings('monthly')
-        context['yearly_url'] = self.set_up_query_strings('yearly')
-
+        #summarize hours per channel (of all users) and set up the context data for charts in one (cached) query
+        context.update(self.get_report('hours_per_channel', lambda: hours_per_channel(self.object_list)))
         return context
 
-    #structure the context data for the charts
-    def get_labels_data(self, logged_hours):
-        labels = []
-        data = []
-        for entry in logged_hours:
-            sales_channel = entry.sales_channel.channel_name
-            if sales_channel not in labels:
-                labels.append(sales_channel)
-                hours = sum(entry.hour for entry in logged_hours if entry.sales_channel.channel_name == sales_channel)
-                data.append(hours)
-        return {'labels': labels, 'data': data}
-
 
 #Display hours per department to logged in users, who have appropriate permissions
-class ViewDepartmentHoursView(LoginRequiredMixin, PermissionRequiredMixin, ListView, DateFilterView):
+class ViewDepartmentHoursView(LoginRequiredMixin, ReplicaReadsMixin, ScopedViewMixin, DateRangeMixin,
+                              CachedReportMixin, ListView):
     login_url = '/login/'
     permission_required = ['timetracking_app.view_hours_per_department']
 
@@ -271,66 +234,22 @@ class ViewDepartmentHoursView(LoginRequiredMixin, PermissionRequiredMixin, ListV
     context_object_name = 'logged_hours'
 
     def get_queryset(self):
-        user = self.request.user
         #restricting data visibility - managers can view their departments only, director can view all departments
-        if user.groups.filter(name='director_user').exists():
-            queryset = LoggedHours.objects.all()
-            return queryset
-        elif user.groups.filter(name='manager_user').exists():
-            queryset = LoggedHours.objects.filter(department=user.department)
-            return queryset
-
-        #calling function that filters data by specified date ranges
-        filter_type = self.request.GET.get('filter_type')
-        return self.filter_by_dates_range(filter_type)
-
-    #summarizing hours added by all users per sales channel and per department
+        #(summed from the daily rollup, which also holds the archived hours)
+        queryset = self.get_scoped_queryset(DailyLoggedHours.objects.all())
+        #filter by the selected date range - applies to every user group
+        return self.filter_by_dates_range(queryset)
+
+    #summarizing hours added by all users per sales channel and per department, together with the chart data
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        logged_hours = self.get_queryset()
-        hours_per_department = {}
-        for entry in logged_hours:
-            department = entry.department
-            hours = entry.hour
-            sales_channel = entry.sales_channel
-            if department in hours_per_department:
-                if sales_channel in hours_per_department[department]:
-                    hours_per_department[department][sales_channel] += hours
-                else:
-                    hours_per_department[department][sales_channel] = hours
-            else:
-                hours_per_department[department] = {sales_channel:hours}
-        context['hours_per_department'] = hours_per_department
-
-        #calling functions setting up context data for charts
-        labels_data = self.get_labels_data(self.request.user)
-        context.update(labels_data)
-
+        context.update(self.get_report('hours_per_department', lambda: hours_per_department(self.object_list)))
         return context
 
-    #stucture the context data for the charts
-    def get_labels_data(self, user):
-        logged_hours = self.get_queryset()
-        labels = []
-        data = []
-        hours_per_department = {}
-        for entry in logged_hours:
-            department = entry.department.department_name
-            if department not in hours_per_department:
-                hours_per_department[department] = entry.hour
-            else:
-                hours_per_department[department] += entry.hour
-
-        #convert a dictionary to lists of labels and data
-        for department, hours in hours_per_department.items():
-            labels.append(department)
-            data.append(hours)
-
-        return {'labels': labels, 'data': data}
-
 
 #Display list of hours added by all employees to loggedin users with specified permissions.
-class ViewEmployeesHoursView(LoginRequiredMixin, PermissionRequiredMixin, ListView, DateFilterView):
+class ViewEmployeesHoursView(LoginRequiredMixin, ReplicaReadsMixin, ScopedViewMixin, DateRangeMixin,
+                             CursorPaginationMixin, ListView):
     login_url = '/login/'
     permission_required = ['timetracking_app.view_hours_per_employee']
 
@@ -343,42 +262,91 @@ class ViewEmployeesHoursView(LoginRequiredMixin, PermissionRequiredMixin, ListVi
     paginate_by = 10
 
     def get_queryset(self):
-        user = self.request.user
         #restricting data visibility - managers can view their departments only, director can view all departments
-        if user.groups.filter(name='director_user').exists():
-            queryset = LoggedHours.objects.all()
-            return queryset
-        elif user.groups.filter(name='manager_user').exists():
-            queryset = LoggedHours.objects.filter(department=user.department)
-            return queryset
-
-        #calling function that filters data by specified date ranges
-        filter_type = self.request.GET.get('filter_type')
-        return self.filter_by_dates_range(filter_type)
+        #load the related rows rendered in the table together with the entries
+        return self.get_dated_hours(
+            lambda queryset: self.get_scoped_queryset(queryset).select_related('employee', 'sales_channel'))
 
+    #the per employee totals come from the daily rollup, which also holds the archived hours
+    def get_daily_hours(self):
+        return self.filter_by_dates_range(self.get_scoped_queryset(DailyLoggedHours.objects.all()))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # list all employyes hours
-        employee_entries = self.get_queryset()
-        context['employee_entries'] = employee_entries
-
-        # Sum hours per employee
-        hours_per_employee = {}
-        for entry in employee_entries:
-            employee = entry.employee
-            hours = entry.hour
-            if employee is not None:
-                employee = employee
-                if employee in hours_per_employee:
-                    hours_per_employee[employee] += hours
-                else:
-                    hours_per_employee[employee] = hours
-        context['hours_per_employee'] = hours_per_employee
+        # Sum hours per employee in the database - the paginated entries are already in the context
+        context['hours_per_employee'] = hours_per_employee(self.get_daily_hours())
 
         return context
 
+
+#Export hours of all employees visible to the user as CSV, streamed while the rows are read.
+class ExportEmployeesHoursView(ViewEmployeesHoursView):
+
+    #ordered by exported columns - a combined (archive) query can only be ordered by the columns it selects
+    def get(self, request, *args, **kwargs):
+        rows = self.get_dated_hours(lambda queryset: export_values(self.get_scoped_queryset(queryset)))
+        response = StreamingHttpResponse(iter_logged_hours_csv(rows.order_by('employee__username', 'date')),
+                                         content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="employees_hours.csv"'
+        return response
+
+#Chart series of the reports as JSON, fetched asynchronously by the report pages.
+#They share the cached reports of the pages and answer 304 Not Modified while nothing changed.
+class ChannelChartDataView(ChartDataMixin, HoursPerChannelView):
+    report_name = 'hours_per_channel'
+
+    def get_chart_data(self):
+        return hours_per_channel(self.get_queryset())
+
+
+class DepartmentChartDataView(ChartDataMixin, ViewDepartmentHoursView):
+    report_name = 'hours_per_department'
+
+    def get_chart_data(self):
+        return hours_per_department(self.get_queryset())
+
+
+class EmployeeChartDataView(ChartDataMixin, ViewEmployeesHoursView):
+    report_name = 'hours_per_employee'
+
+    def get_chart_data(self):
+        employees_hours = hours_per_employee(self.get_daily_hours())
+        return {'labels': list(employees_hours.keys()), 'data': list(employees_hours.values())}
+
+
+#Hours over time (per day, week, month or quarter), optionally split per channel or department.
+#The page holds the form only, the chart series come from TrendChartDataView.
+class HoursTrendView(LoginRequiredMixin, ScopedViewMixin, View):
+    login_url = '/login/'
+    permission_required = ['timetracking_app.view_hours_per_channel']
+    template_name = 'hours_trend.html'
+
+    def get(self, request):
+        return render(request, self.template_name, {'form': TrendForm(request.GET or None)})
+
+
+class TrendChartDataView(LoginRequiredMixin, ReplicaReadsMixin, ScopedViewMixin, ChartDataMixin, View):
+    login_url = '/login/'
+    permission_required = ['timetracking_app.view_hours_per_channel']
+    report_name = 'hours_trend'
+    chart_keys = ('labels', 'data', 'datasets', 'bucket', 'bucket_size')
+
+    def get(self, request, *args, **kwargs):
+        self.form = TrendForm(request.GET)
+        if not self.form.is_valid():
+            return JsonResponse({'errors': self.form.errors}, status=400)
+        return super().get(request, *args, **kwargs)
+
+    def get_report_cache_key(self):
+        options = self.form.cleaned_data
+        return super().get_report_cache_key() + (options['bucket'], options['split'], options['start'], options['end'])
+
+    #the daily rollup has a row per day, employee, channel and department - enough for any calendar bucket
+    def get_chart_data(self):
+        return hours_trend(self.get_scoped_queryset(DailyLoggedHours.objects.all()), **self.form.cleaned_data)
+
+
 #Add new employee form, visible to logged in users, who have appropriate permissions
 class AddEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     login_url = '/login/'
@@ -399,6 +367,51 @@ class AddEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
         return response
 
 
+#Import historical hours from a CSV file (staff users with permission to add hours)
+class ImportHoursView(LoginRequiredMixin, PermissionRequiredMixin, FormView):
+    login_url = '/login/'
+    permission_required = 'timetracking_app.add_loggedhours'
+    form_class = ImportHoursForm
+    template_name = 'import_hours.html'
+
+    def has_permission(self):
+        return self.request.user.is_staff and super().has_permission()
+
+    def form_valid(self, form):
+        file = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+        importer = LoggedHoursImporter().import_file(file)
+        return self.render_to_response(self.get_context_data(form=form, importer=importer))
+
+
+#Create employees from a CSV roster (staff users with permission to add employees)
+class OnboardEmployeesView(LoginRequiredMixin, PermissionRequiredMixin, FormView):
+    login_url = '/login/'
+    permission_required = 'timetracking_app.add_person'
+    form_class = RosterFileForm
+    template_name = 'roster.html'
+    extra_context = {'title': 'Onboard employees', 'columns': ROSTER_COLUMNS}
+
+    def has_permission(self):
+        return self.request.user.is_staff and super().has_permission()
+
+    def form_valid(self, form):
+        file = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+        importer = RosterImporter().import_file(file)
+        return self.render_to_response(self.get_context_data(form=form, importer=importer, done=importer.created))
+
+
+#Deactivate the employees listed in a CSV roster (staff users with permission to delete employees)
+class OffboardEmployeesView(OnboardEmployeesView):
+    permission_required = 'timetracking_app.delete_person'
+    extra_context = {'title': 'Offboard employees', 'columns': OFFBOARDING_COLUMNS}
+
+    def form_valid(self, form):
+        file = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+        importer = RosterDeactivator().import_file(file)
+        return self.render_to_response(self.get_context_data(form=form, importer=importer,
+                                                             done=importer.deactivated))
+
+
 #delete hours view (for logged in users with permissions)
 class DeleteHoursView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
     login_url = '/login/'
@@ -429,30 +442,49 @@ class EditEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     success_url = reverse_lazy('employees-hours')
 
 
-class SearchEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, FormView):
+class SearchEmployeeView(LoginRequiredMixin, ReplicaReadsMixin, PermissionRequiredMixin, FormView):
     login_url = '/login/'
     permission_required = 'timetracking_app.view_person'
     form_class = SearchEmployeeForm
     template_name = 'search_employee.html'
     success_url = reverse_lazy('employee-detail')
+    paginate_by = 20
 
+    #the search is a GET form, so result pages can be linked and paginated
+    def get(self, request, *args, **kwargs):
+        form = self.get_form_class()(request.GET or None)
+        if form.is_bound and form.is_valid():
+            return self.form_valid(form)
+        return self.render_to_response(self.get_context_data(form=form))
+
+    #matches every word of the queries as a prefix of the words in the search index (no table scans)
     def form_valid(self, form):
-        form = form
-        email = form.cleaned_data.get('email')
-        first_name = form.cleaned_data.get('first_name')
-        last_name = form.cleaned_data.get('last_name')
-        department = form.cleaned_data.get('department')
-        employees = Person.objects.all()
-        if email:
-            employees = employees.filter(email=email)
-        if first_name:
-            employees = employees.filter(first_name__icontains=first_name)
-        if last_name:
-            employees = employees.filter(last_name__icontains=last_name)
-        if department:
-            employees = employees.filter(department__department_name__icontains=department)
-
-        return render(self.request, 'employee_detail.html', {'employees': employees})
+        data = form.cleaned_data
+        people = Person.objects.select_related('department')
+        if not data['include_inactive']:
+            people = people.filter(is_active=True)
+        employees = search_people(people, data['q'], email=data['email'], first_name=data['first_name'],
+                                  last_name=data['last_name'], department=data['department'])
+        employees = employees.order_by('last_name', 'first_name', 'id')
+        page = Paginator(employees, self.paginate_by).get_page(self.request.GET.get('page'))
+        search_query = QueryDict(mutable=True)
+        search_query.update({field: value for field, value in data.items() if value})
+        return render(self.request, 'employee_detail.html', {'employees': page, 'page_obj': page,
+                                                             'search_query': search_query.urlencode()})
+
+
+#JSON suggestions for the employee search box
+class EmployeeAutocompleteView(LoginRequiredMixin, ReplicaReadsMixin, PermissionRequiredMixin, View):
+    login_url = '/login/'
+    permission_required = 'timetracking_app.view_person'
+
+    def get(self, request):
+        employees = autocomplete_people(request.GET.get('q', ''))
+        return JsonResponse({'results': [
+            {'id': employee.id, 'name': f'{employee.first_name} {employee.last_name}'.strip() or employee.username,
+             'email': employee.email, 'department': str(employee.department or ''),
+             'url': reverse('employee-detail', kwargs={'pk': employee.id})}
+            for employee in employees]})
 
 
 #Deactivate the employee (for logged in users with specified permissions)
@@ -469,9 +501,7 @@ class DeactivateEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, View):
         return render(request, self.template_name, {'employee': employee})
 
     def post(self, request, pk):
-        employee = Person.objects.get(pk=pk)
-        employee.is_active = False
-        employee.save()
+        deactivate_employees(Person.objects.filter(pk=pk))
         return redirect(self.success_url)
 
 
@@ -495,7 +525,8 @@ class ResetPasswordView(FormView):
             'user': user,
             'password_reset_link': password_reset_link,
         })
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
+        #delivered by the send_outbox_emails worker, so a slow mail server does not hold up the request
+        enqueue_email(subject, message, [user.email])
 
         user.is_active = True
         user.save()
@@ -514,22 +545,47 @@ class PasswordChangeDoneView(LoginRequiredMixin, View):
     template_name = 'password_change_done.html'
 
 
-class EmployeeDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
+class EmployeeDetailView(LoginRequiredMixin, ReplicaReadsMixin, PermissionRequiredMixin, DateRangeMixin, DetailView):
     login_url = '/login/'
     model = Person
     permission_required = 'timetracking_app.change_person'
     template_name = 'employee_full_details.html'
     context_object_name = 'employee'
-
+    paginate_by = 50
 
     def get_object(self):
         pk = self.kwargs.get('pk')
-        return get_object_or_404(Person, pk=pk)
+        return get_object_or_404(Person.objects.select_related('department'), pk=pk)
+
+    #restrict the daily rollup to the employee and the selected dates
+    def filter_hours(self, queryset):
+        return self.filter_by_dates_range(queryset.filter(employee=self.object))
 
+    #the page size does not grow with the tenure - totals come from the daily rollup grouped in the database,
+    #the entries are paginated and read with the displayed columns only
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Filter logged hours by employee id
-        context['employee_entries'] = LoggedHours.objects.filter(employee=self.get_object())
+        daily_hours = self.filter_hours(DailyLoggedHours.objects.all())
+        entries = self.get_dated_hours(
+            lambda queryset: queryset.filter(employee=self.object)
+            .values('id', 'date', 'hour', 'department__department_name', 'sales_channel__channel_name', 'archived')
+        ).order_by('-date', '-id')
+        page = Paginator(entries, self.paginate_by).get_page(self.request.GET.get('page'))
+        context.update({
+            'hours_per_month': hours_per_month(daily_hours),
+            'hours_per_channel': hours_per_channel(daily_hours)['hours_per_channel'],
+            'employee_entries': page,
+            'page_obj': page,
+        })
         return context
 
 
+#Per view request histograms of the worker serving the request in the Prometheus text format (staff users only).
+class MetricsView(LoginRequiredMixin, PermissionRequiredMixin, View):
+    login_url = '/login/'
+
+    def has_permission(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,110 @@
+import logging
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django import forms
+from django.conf import settings
+from django.db import connections
+from django.forms.renderers import get_default_renderer
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.urls import get_resolver
+from django.utils import timezone, translation
+
+from .archive import get_archive_boundary
+from .models import Person
+from .reference import get_channel_choices, get_department_choices
+from .report_cache import get_reports_version
+from .scope import get_scope_version, get_user_scope
+
+logger = logging.getLogger('timetracking_app.warmup')
+
+#steps without connections - in a preloading master they are done once for all the forked workers
+SHARED_STEPS = ('urls', 'templates', 'forms', 'translations')
+WORKER_STEPS = ('connections', 'caches')
+WARMUP_STEPS = SHARED_STEPS + WORKER_STEPS
+
+
+#URL patterns and the reverse lookup tables, otherwise built by the first request and the first reverse()
+def load_urls():
+    resolver = get_resolver()
+    resolver.url_patterns
+    resolver.reverse_dict
+
+
+#Compile the templates of the project (not of the installed packages) into the cached template loader.
+#Returns the number of compiled templates.
+def compile_templates():
+    compiled = 0
+    for engine in engines.all():
+        for directory in map(Path, engine.template_dirs):
+            if not directory.is_relative_to(settings.BASE_DIR):
+                continue
+            for path in sorted(directory.rglob('*.html')):
+                try:
+                    engine.get_template(path.relative_to(directory).as_posix())
+                    compiled += 1
+                except (TemplateDoesNotExist, TemplateSyntaxError) as error:
+                    logger.warning('template %s not compiled: %s', path, error)
+    return compiled
+
+
+#the form and widget templates, compiled by the separate engine of the form renderer
+def compile_form_templates():
+    renderer = get_default_renderer()
+    directory = Path(forms.__file__).parent / 'templates'
+    for path in directory.rglob('*.html'):
+        renderer.get_template(path.relative_to(directory).as_posix())
+
+
+#the catalogs are otherwise read when the first form or date is rendered
+def load_translations():
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.gettext('Date')
+    translation.deactivate()
+
+
+def open_connections():
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+#Scopes of the active users who logged in within the session lifetime - the users who can still send requests.
+#Scopes already in the shared cache (primed by another worker) are not computed again.
+def prime_user_scopes():
+    logged_in_since = timezone.now() - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+    users = Person.objects.filter(is_active=True, last_login__gte=logged_in_since)
+    for user in users.only('id', 'department_id', 'is_active', 'is_superuser').iterator():
+        get_user_scope(user)
+
+
+#version stamps of the report and scope caches, the archive boundary and the reference data read by most pages
+def prime_caches():
+    get_reports_version()
+    get_scope_version()
+    get_archive_boundary()
+    get_channel_choices()
+    get_department_choices()
+    prime_user_scopes()
+
+
+WARMUP_FUNCTIONS = {
+    'urls': load_urls,
+    'templates': compile_templates,
+    'forms': compile_form_templates,
+    'translations': load_translations,
+    'connections': open_connections,
+    'caches': prime_caches,
+}
+
+
+#Do the work of a first request before the process serves one. Returns the time of every step in ms.
+def warm_up(steps=WARMUP_STEPS):
+    timings = {}
+    for step in steps:
+        start = time.perf_counter()
+        WARMUP_FUNCTIONS[step]()
+        timings[step] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info('warmed up in %.1f ms: %s', sum(timings.values()),
+                ' '.join(f'{step}_ms={duration}' for step, duration in timings.items()))
+    return timings